@@ -4,6 +4,8 @@ const API_BASE_URL = 'https://0vhlizck0gvv.manus.space/api';
 class ApiService {
   constructor() {
     this.token = localStorage.getItem('sparko_token')
+    // Latest X-Consistency-Token from a write; sent back so our own reads see it
+    this.consistencyToken = null
   }
 
   // Helper method to get headers
@@ -16,15 +18,24 @@ class ApiService {
       headers['Authorization'] = `Bearer ${this.token}`
     }
     
+    if (this.consistencyToken) {
+      headers['X-Consistency-Token'] = this.consistencyToken
+    }
+    
     return headers
   }
 
   // Helper method to handle responses
   async handleResponse(response) {
+    const consistencyToken = response.headers.get('X-Consistency-Token')
+    if (consistencyToken) {
+      this.consistencyToken = consistencyToken
+    }
+    
     const data = await response.json()
     
     if (!response.ok) {
-      throw new Error(data.error || data.message || 'API request failed')
+      throw new Error(data.error || data.message || data.detail || 'API request failed')
     }
     
     return data
@@ -91,6 +102,28 @@ class ApiService {
     return data
   }
 
+  async uploadPhoto(file) {
+    const body = new FormData()
+    body.append('photo', file)
+    
+    // No Content-Type: the browser sets the multipart boundary
+    const response = await fetch(`${API_BASE_URL}/photos`, {
+      method: 'POST',
+      headers: this.token ? { 'Authorization': `Bearer ${this.token}` } : {},
+      body
+    })
+    
+    const data = await this.handleResponse(response)
+    
+    const currentUser = this.getCurrentUser()
+    if (currentUser && data.photo_url) {
+      currentUser.photo_url = data.photo_url
+      localStorage.setItem('sparko_user', JSON.stringify(currentUser))
+    }
+    
+    return data
+  }
+
   // Multi-role profile APIs
   async getUserProfiles() {
     const response = await fetch(`${API_BASE_URL}/profile/profiles`, {
@@ -167,6 +200,18 @@ class ApiService {
     return this.handleResponse(response)
   }
 
+  async swipeBatch(swipes) {
+    const response = await fetch(`${API_BASE_URL}/matching/swipe/batch`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+      body: JSON.stringify({
+        swipes: swipes.map(({ userId, action }) => ({ user_id: userId, action }))
+      })
+    })
+
+    return this.handleResponse(response)
+  }
+
   async getMatches() {
     const response = await fetch(`${API_BASE_URL}/matching/matches`, {
       headers: this.getHeaders()
@@ -185,11 +230,22 @@ class ApiService {
   }
 
   // Chat APIs
-  async getMessages(matchId) {
-    const response = await fetch(`${API_BASE_URL}/chat/matches/${matchId}/messages`, {
+  async getMessages(matchId, { sinceId, beforeId, limit } = {}) {
+    const params = new URLSearchParams()
+    if (sinceId !== undefined) params.set('since_id', sinceId)
+    if (beforeId !== undefined) params.set('before_id', beforeId)
+    if (limit !== undefined) params.set('limit', limit)
+    const query = params.toString() ? `?${params}` : ''
+
+    const response = await fetch(`${API_BASE_URL}/chat/matches/${matchId}/messages${query}`, {
       headers: this.getHeaders()
     })
-    
+
+    // 304: nothing new since the last poll
+    if (response.status === 304) {
+      return { messages: [], latest_id: sinceId, not_modified: true }
+    }
+
     return this.handleResponse(response)
   }
 
@@ -203,6 +259,17 @@ class ApiService {
     return this.handleResponse(response)
   }
 
+  // Real-time events: 'message', 'match' and 'chat_unlocked'
+  subscribeEvents(onEvent) {
+    const source = new EventSource(`${API_BASE_URL}/events?token=${encodeURIComponent(this.token)}`)
+    
+    ;['message', 'match', 'chat_unlocked'].forEach(type => {
+      source.addEventListener(type, event => onEvent(type, JSON.parse(event.data)))
+    })
+    
+    return source
+  }
+
   // Premium APIs
   async purchaseSuperSpark(quantity = 1) {
     const response = await fetch(`${API_BASE_URL}/premium/purchase/super-spark`, {
@@ -1,8 +1,14 @@
-from fastapi import FastAPI, Query
+from fastapi import APIRouter, FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+import hashlib
 import random
+import threading
+
+from src.services import serializers
 
 app = FastAPI()
+router = APIRouter()
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,8 +32,80 @@ fake_profiles = [
     for i in range(1, 21)
 ]
 
-@app.get("/api/profiles")
-def get_profiles(role: str = Query(None)):
-    if role:
-        return [p for p in fake_profiles if p["role"] == role]
-    return fake_profiles
+
+class ProfileCatalog:
+    """Profiles encoded once and partitioned by role, rebuilt only when they change.
+
+    Every profile is encoded to JSON bytes when the catalog is built, so a page
+    is a slice of a role's partition joined into a JSON array; the whole
+    partition (the unpaged response) is kept ready-made. ``version`` is a
+    digest of the encoded catalog, so the strong ETags derived from it survive
+    a rebuild that changed nothing. ``replace`` swaps in new data; requests
+    racing a rebuild keep serving the previous snapshot.
+    """
+
+    def __init__(self, profiles):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._source = profiles
+
+    def replace(self, profiles):
+        with self._lock:
+            self._source = profiles
+            self._snapshot = None
+
+    def _build(self, profiles):
+        encoded = [serializers.encode(profile) for profile in profiles]
+        partitions = {None: encoded}
+        for profile, body in zip(profiles, encoded):
+            partitions.setdefault(profile["role"], []).append(body)
+        bodies = {role: b"[" + b",".join(items) + b"]" for role, items in partitions.items()}
+        digest = hashlib.sha256()
+        for body in encoded:
+            digest.update(body)
+        return digest.hexdigest()[:16], partitions, bodies
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build(self._source)
+                snapshot = self._snapshot
+        return snapshot
+
+    def page(self, role=None, offset=0, limit=None, known_etags=()):
+        """``(body, total, etag)`` for one role's profiles; an unknown role is an empty list.
+
+        ``body`` is None when ``etag`` is one of ``known_etags``.
+        """
+        version, partitions, bodies = self.snapshot()
+        items = partitions.get(role, ())
+        etag = f"{version}-{role or '*'}-{offset}-{limit if limit is not None else '*'}"
+        if etag in known_etags:
+            body = None
+        elif offset == 0 and limit is None:
+            body = bodies.get(role, b"[]")
+        else:
+            end = None if limit is None else offset + limit
+            body = b"[" + b",".join(items[offset:end]) + b"]"
+        return body, len(items), etag
+
+
+catalog = ProfileCatalog(fake_profiles)
+
+
+def _if_none_match(request):
+    return {tag.strip().strip('"') for tag in request.headers.get("if-none-match", "").split(",") if tag.strip()}
+
+
+@router.get("/api/profiles")
+def get_profiles(request: Request, role: str = Query(None), offset: int = Query(0, ge=0), limit: int = Query(None, ge=1)):
+    body, total, etag = catalog.page(role, offset, limit, _if_none_match(request))
+    headers = {"ETag": f'"{etag}"', "X-Total-Count": str(total)}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+app.include_router(router)
@@ -0,0 +1,193 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import select
+import jwt
+import os
+
+from src.models.user import User, UserProfile
+from src.routes.chat import (
+    MAX_MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE, conversation_statement, messages_etag, messages_page, messages_statement
+)
+from src.routes.profile import empty_profile
+from src.services import match_cards, serializers
+from src.services.async_db import get_read_session, primary_session
+
+# Native async versions of the hot read endpoints. They are routed ahead of
+# the mounted Flask app in main.py, so the same URLs stop costing a WSGI
+# worker thread; everything else still falls through to the blueprints.
+# They read from a replica that has the client's consistency token (see db_routing).
+router = APIRouter()
+
+ROLES = ['entrepreneur', 'investor', 'partner']
+
+
+def _bearer(request):
+    token = request.headers.get("Authorization", "")
+    return token[7:] if token.startswith("Bearer ") else token
+
+
+def _decode(request, key_name):
+    token = _bearer(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Token is missing")
+    try:
+        return jwt.decode(token, os.environ[key_name], algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def jwt_user_id(request: Request):
+    """Identity of a flask_jwt_extended access token (the ``@jwt_required()`` routes)."""
+    data = _decode(request, "JWT_SECRET_KEY")
+    if data.get("type", "access") != "access" or data.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return int(data["sub"])
+
+
+def auth_user_id(request: Request):
+    """Identity of an auth blueprint token (the ``@token_required`` routes)."""
+    data = _decode(request, "SECRET_KEY")
+    if data.get("user_id") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return int(data["user_id"])
+
+
+def render(request, payload, status_code=200, etag=None):
+    """``serializers.render`` for Starlette requests."""
+    negotiated = serializers.negotiate(request.headers.get("accept"), request.headers.get("accept-encoding"))
+    body, encoding = serializers.encode_body(payload, negotiated)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if etag:
+        headers["ETag"] = f'"{serializers.representation_etag(etag, negotiated)}"'
+    return Response(body, status_code=status_code, media_type=negotiated[0], headers=headers)
+
+
+def _if_none_match(request):
+    return {tag.strip().strip('"') for tag in request.headers.get("if-none-match", "").split(",") if tag.strip()}
+
+
+@router.get("/api/profile/profiles")
+async def get_user_profiles(user_id: int = Depends(jwt_user_id), session=Depends(get_read_session)):
+    user = await session.get(User, user_id)
+    if not user:
+        return JSONResponse({"error": "User not found"}, status_code=404)
+
+    stored = {profile.role: profile for profile in await session.scalars(
+        select(UserProfile).where(UserProfile.user_id == user_id)
+    )}
+    return JSONResponse({
+        "user": user.to_dict(include_private=True),
+        "profiles": {
+            role: stored[role].to_dict() if role in stored else empty_profile(role)
+            for role in ROLES
+        }
+    })
+
+
+@router.get("/api/profile/profiles/{role}")
+async def get_profile_by_role(role: str, user_id: int = Depends(jwt_user_id), session=Depends(get_read_session)):
+    if role not in ROLES:
+        return JSONResponse({"error": "Invalid role"}, status_code=400)
+
+    profile = await session.scalar(
+        select(UserProfile).where(UserProfile.user_id == user_id, UserProfile.role == role)
+    )
+    return JSONResponse({"profile": profile.to_dict() if profile else empty_profile(role)})
+
+
+@router.get("/api/profile/check-completion/{role}")
+async def check_profile_completion(role: str, user_id: int = Depends(jwt_user_id), session=Depends(get_read_session)):
+    if role not in ROLES:
+        return JSONResponse({"error": "Invalid role"}, status_code=400)
+
+    row = (await session.execute(
+        select(UserProfile.is_complete, UserProfile.completion_percentage)
+        .where(UserProfile.user_id == user_id, UserProfile.role == role)
+    )).first()
+    is_complete = bool(row and row.is_complete)
+    return JSONResponse({
+        "is_complete": is_complete,
+        "completion_percentage": row.completion_percentage if row else 0,
+        "message": "Profile complete" if is_complete else "Complete your profile to start swiping"
+    })
+
+
+@router.get("/api/matching/matches")
+async def get_matches(request: Request, user_id: int = Depends(jwt_user_id), session=Depends(get_read_session)):
+    user = await session.get(User, user_id)
+    if not user:
+        return JSONResponse({"error": "User not found"}, status_code=404)
+
+    params = request.query_params
+    try:
+        limit = int(params.get("limit", match_cards.PAGE_SIZE))
+        sort = params.get("sort", "created_at")
+        fields = serializers.parse_fields(params.get("fields"))
+        serializers.MATCH_CARD.only(fields)
+        statement = match_cards.match_page_statement(user_id, user.current_role, params.get("cursor"), limit, sort)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid cursor, sort, limit or fields: {e}"}, status_code=400)
+
+    rows = (await session.execute(statement)).all()
+    cards, next_cursor = match_cards.page_from_rows(rows, user_id, limit, sort, fields)
+    return render(request, {
+        "matches": cards,
+        "current_role": user.current_role,
+        "next_cursor": next_cursor
+    })
+
+
+@router.get("/api/chat/matches/{match_id}/messages")
+async def get_messages(match_id: int, request: Request, user_id: int = Depends(auth_user_id), session=Depends(get_read_session)):
+    params = request.query_params
+    try:
+        since_id = int(params["since_id"]) if "since_id" in params else None
+        before_id = int(params["before_id"]) if "before_id" in params else None
+        limit = min(int(params.get("limit", MESSAGE_PAGE_SIZE)), MAX_MESSAGE_PAGE_SIZE)
+        serializer = serializers.MESSAGE.only(serializers.parse_fields(params.get("fields")))
+    except ValueError as e:
+        return JSONResponse({"message": f"Invalid since_id, before_id, limit or fields: {e}"}, status_code=400)
+
+    if limit < 1 or (since_id is not None and before_id is not None):
+        return JSONResponse({"message": "Invalid since_id, before_id or limit"}, status_code=400)
+
+    row = (await session.execute(conversation_statement(match_id, user_id))).first()
+    if not row:
+        return JSONResponse({"message": "Match not found or access denied"}, status_code=404)
+
+    match, last_message_id = row
+    etag = messages_etag(match, user_id, last_message_id, since_id, before_id, limit, params.get("fields"))
+    negotiated = serializers.negotiate(request.headers.get("accept"), request.headers.get("accept-encoding"))
+    current_etag = serializers.representation_etag(etag, negotiated)
+    if current_etag in _if_none_match(request):
+        return Response(status_code=304, headers={"ETag": f'"{current_etag}"', "Vary": "Accept, Accept-Encoding"})
+
+    messages = (await session.scalars(messages_statement(match_id, since_id, before_id, limit))).all()
+    messages, has_more = messages_page(messages, since_id, limit)
+
+    if messages and before_id is None:
+        async with primary_session(session) as primary:
+            await match_cards.mark_read_async(primary, match_id, user_id, messages[-1].id)
+            await primary.commit()
+
+    response_data = {
+        "messages": serializer.many(messages, viewer_id=user_id),
+        "has_more": has_more,
+        "latest_id": messages[-1].id if messages else since_id,
+        "match": {
+            "id": match.id,
+            "created_at": match.created_at.isoformat(),
+            "chat_unlocked": match.chat_unlocked
+        }
+    }
+
+    # Pollers already have the other user from their first load
+    if since_id is None and before_id is None:
+        other_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
+        response_data["match"]["other_user"] = serializers.PUBLIC_USER(await session.get(User, other_user_id))
+
+    return render(request, response_data, etag=etag)
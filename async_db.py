@@ -0,0 +1,194 @@
+"""Async database access for the ASGI endpoints.
+
+The async routes in ``async_api.py`` share the Flask-SQLAlchemy models but
+talk to the database through an ``AsyncEngine`` (asyncpg on PostgreSQL,
+aiosqlite on SQLite). A request waiting on the database yields its event
+loop instead of holding a worker thread. Concurrency is bounded by the
+connection pool, ``DB_POOL_SIZE`` plus ``DB_MAX_OVERFLOW`` connections.
+Requests queue for a connection in FIFO order and give up with
+``PoolBusy`` (a 503 in main.py) after ``DB_POOL_TIMEOUT`` seconds.
+
+The URL comes from ``DATABASE_URL`` (the same variable the Flask app
+reads), with the sync driver swapped for its async counterpart. A relative
+SQLite path is resolved once against ``INSTANCE_PATH`` (the Flask app's
+instance folder too), so both engines open the same file whatever the
+working directory. Read-only
+routes take ``get_read_session`` instead, a session on one of the
+``DATABASE_REPLICA_URLS`` replicas chosen by ``db_routing``; each replica
+has its own pool of the same size.
+"""
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.services import db_routing, metrics
+
+DEFAULT_DATABASE_URL = 'sqlite:///app.db'
+INSTANCE_PATH = os.path.abspath(os.environ.get('SPARKO_INSTANCE_PATH', 'instance'))
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 10
+POOL_RECYCLE = 1800
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+
+def database_url():
+    """``DATABASE_URL`` with a relative SQLite path made absolute under ``INSTANCE_PATH``."""
+    url = make_url(os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' \
+            and not url.database.startswith('file:') and not os.path.isabs(url.database):
+        os.makedirs(INSTANCE_PATH, exist_ok=True)
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url.render_as_string(hide_password=False)
+
+
+def async_url(url):
+    """``postgresql+psycopg2://...`` -> ``postgresql+asyncpg://...``, etc."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'No async driver configured for {url.get_backend_name()}')
+    # libpq-style ?host=/socket/dir is spelled differently by asyncpg
+    if driver == 'postgresql+asyncpg' and 'host' in url.query and not url.host:
+        url = url.set(host=url.query['host']).difference_update_query(['host'])
+    return url.set(drivername=driver)
+
+
+def pool_options(url):
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)),
+        'pool_recycle': POOL_RECYCLE
+    }
+
+
+def max_connections():
+    return (int(os.environ.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)) +
+            int(os.environ.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)))
+
+
+class PoolBusy(Exception):
+    pass
+
+
+_engine = None
+_sessionmaker = None
+_slots = None
+_replicas = None
+_engine_lock = threading.Lock()
+
+
+def _connect(url):
+    url = async_url(url)
+    engine = create_async_engine(url, **pool_options(url))
+    sessionmaker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    return engine, sessionmaker, asyncio.Semaphore(max_connections())
+
+
+def get_engine():
+    global _engine, _sessionmaker, _slots
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine, _sessionmaker, _slots = _connect(database_url())
+                metrics.register_source('db_pool', pool_stats)
+    return _engine
+
+
+def get_replicas():
+    """``(engine, sessionmaker, slots)`` per replica, in ``db_routing.get_replica_set()`` order."""
+    global _replicas
+    if _replicas is None:
+        with _engine_lock:
+            if _replicas is None:
+                _replicas = [_connect(replica.url) for replica in db_routing.get_replica_set().replicas]
+    return _replicas
+
+
+@asynccontextmanager
+async def session_scope(replica=None):
+    """An ``AsyncSession`` on the primary, or on the replica at index ``replica``."""
+    get_engine()
+    _, sessionmaker, slots = get_replicas()[replica] if replica is not None else (_engine, _sessionmaker, _slots)
+    timeout = float(os.environ.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT))
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise PoolBusy('Database is busy, retry shortly')
+    try:
+        async with sessionmaker() as session:
+            yield session
+    finally:
+        slots.release()
+
+
+async def get_session():
+    """FastAPI dependency: one ``AsyncSession`` per request."""
+    async with session_scope() as session:
+        yield session
+
+
+async def _probe(index):
+    async with get_replicas()[index][0].connect() as connection:
+        return await connection.run_sync(db_routing.replica_position)
+
+
+async def get_read_session(request: Request):
+    """FastAPI dependency for read-only routes: a session on a replica that has the client's consistency token.
+
+    Falls back to the primary when no replica has caught up, or none is configured.
+    """
+    replica = None
+    if get_replicas():
+        replicas = db_routing.get_replica_set()
+        replica = await replicas.choose_async(replicas.parse_token(request.headers.get(db_routing.HEADER)), _probe)
+    async with session_scope(replica) as session:
+        yield session
+
+
+@asynccontextmanager
+async def primary_session(session):
+    """``session`` if it is on the primary, else a primary session for the block, for writes from a read route."""
+    if session.bind is get_engine():
+        yield session
+    else:
+        async with session_scope() as primary:
+            yield primary
+
+
+async def primary_position():
+    async with get_engine().connect() as connection:
+        return await connection.run_sync(db_routing.primary_position)
+
+
+async def dispose():
+    global _engine, _sessionmaker, _slots, _replicas
+    for engine, _, _ in _replicas or ():
+        await engine.dispose()
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = _sessionmaker = _slots = None
+    _replicas = None
+
+
+def pool_stats():
+    if _engine is None:
+        return {}
+    pool = _engine.pool
+    stats = {'status': pool.status()}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, current_app
-from src.models.user import db, User
+from src.models.user import db, User, UserProfile
+from src.services import geo_index, password_hasher, principal_cache
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
@@ -16,8 +17,7 @@ def token_required(f):
         try:
             if token.startswith('Bearer '):
                 token = token[7:]
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            current_user = principal_cache.verify_token(token)
             if not current_user:
                 return jsonify({'message': 'Invalid token'}), 401
         except jwt.ExpiredSignatureError:
@@ -28,6 +28,12 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+def overloaded_response(error):
+    response = jsonify({'message': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -45,7 +51,7 @@ def register():
         user = User(
             email=data['email']
         )
-        user.set_password(data['password'])
+        user.password_hash = password_hasher.hash_password(data['password'])
         
         # Add optional profile fields
         if data.get('name'):
@@ -68,6 +74,9 @@ def register():
             'user': user.to_dict(include_private=True)
         }), 201
         
+    except password_hasher.HasherOverloaded as e:
+        db.session.rollback()
+        return overloaded_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Registration failed: {str(e)}'}), 500
@@ -82,9 +91,17 @@ def login():
         
         user = User.query.filter_by(email=data['email']).first()
         
-        if not user or not user.check_password(data['password']):
+        if not user or not password_hasher.check_password(data['password'], user.password_hash):
             return jsonify({'message': 'Invalid email or password'}), 401
         
+        # Transparently upgrade hashes made under a previous BCRYPT_ROUNDS
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = password_hasher.hash_password(data['password'])
+                db.session.commit()
+            except password_hasher.HasherOverloaded:
+                pass  # the old hash still verifies; upgrade on a later login
+        
         # Generate token
         token = jwt.encode({
             'user_id': user.id,
@@ -97,6 +114,9 @@ def login():
             'user': user.to_dict(include_private=True)
         }), 200
         
+    except password_hasher.HasherOverloaded as e:
+        db.session.rollback()
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({'message': f'Login failed: {str(e)}'}), 500
 
@@ -115,11 +135,20 @@ def update_profile(current_user):
         
         # Update basic user fields
         basic_fields = ['name', 'age', 'location', 'photo_url']
+        previous_location = current_user.location
         
         for field in basic_fields:
             if field in data:
                 setattr(current_user, field, data[field])
         
+        # Every profile falls back to the account location, so re-geocode them all
+        relocated = []
+        if current_user.location != previous_location:
+            relocated = [
+                (profile, geo_index.store(profile, current_user.location))
+                for profile in UserProfile.query.filter_by(user_id=current_user.id)
+            ]
+        
         # Handle role change
         if 'role' in data:
             current_user.current_role = data['role']
@@ -130,6 +159,9 @@ def update_profile(current_user):
         
         current_user.updated_at = datetime.utcnow()
         db.session.commit()
+        principal_cache.invalidate_user(current_user.id)
+        for profile, place in relocated:
+            geo_index.update_profile(profile, place)
         
         return jsonify({
             'message': 'Profile updated successfully',
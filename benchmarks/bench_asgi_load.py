@@ -0,0 +1,255 @@
+"""Load test: requests/sec per worker for the hot reads, Flask-on-threads vs. native async.
+
+Usage: python benchmarks/bench_asgi_load.py --database-url postgresql://... [--clients 500] [--duration 20] [--db-latency-ms 5]
+
+Seeds users, profiles, matches and messages (``--users``), then starts the
+unified ASGI app (``main:app``) under a single uvicorn worker twice: once
+with ``SPARKO_ASYNC_ROUTES=0``, so /matches, /profiles and chat reads go to
+the Flask blueprints on the WSGI thread pool, and once with the async
+routes on the async connection pool. ``--clients`` concurrent clients
+replay a mix of those reads for ``--duration`` seconds against each. For
+every run it prints requests/sec, p50/p99 latency and the error count.
+``--db-latency-ms`` routes database traffic through a delaying proxy to
+model a database on another host.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+SECRET_KEY = 'bench-secret-key-0123456789abcdef'
+JWT_SECRET_KEY = 'bench-jwt-secret-key-0123456789ab'
+ROLES = ['entrepreneur', 'investor', 'partner']
+
+
+def seed(users, matches_per_user):
+    from sqlalchemy import insert
+
+    from flask_app import create_app
+    from src.models.user import db, User, UserProfile, Match, Message
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        now = datetime.utcnow()
+        db.session.execute(insert(User), [
+            {'id': i, 'email': f'bench{i}@example.com', 'password_hash': 'x', 'name': f'Bench {i}',
+             'current_role': ROLES[i % 2], 'created_at': now, 'updated_at': now}
+            for i in range(1, users + 1)
+        ])
+        db.session.execute(insert(UserProfile), [
+            {'user_id': i, 'role': ROLES[i % 2], 'title': 'Founder', 'tagline': 'Building things', 'bio': 'Bio ' * 40,
+             'skills': '["AI", "Fintech", "SaaS"]', 'industry': 'Fintech', 'funding_stage': 'Seed',
+             'is_complete': True, 'completion_percentage': 100, 'created_at': now, 'updated_at': now}
+            for i in range(1, users + 1)
+        ])
+        # Investors (even ids) match with entrepreneurs (odd ids)
+        pairs = set()
+        rng = random.Random(7)
+        for investor in range(2, users + 1, 2):
+            for _ in range(matches_per_user):
+                pairs.add((investor, rng.randrange(1, users + 1, 2)))
+        db.session.execute(insert(Match), [
+            {'user1_id': a, 'user2_id': b, 'user1_role': 'investor', 'user2_role': 'entrepreneur',
+             'chat_unlocked': True, 'created_at': now - timedelta(minutes=n)}
+            for n, (a, b) in enumerate(sorted(pairs))
+        ])
+        db.session.execute(insert(Message), [
+            {'match_id': match_id, 'sender_id': 2, 'content': f'Message {k}', 'created_at': now}
+            for match_id in range(1, min(len(pairs), users) + 1) for k in range(10)
+        ])
+        db.session.commit()
+        match_owners = db.session.query(Match.id, Match.user1_id).all()
+    return match_owners
+
+
+def tokens_for(user_id):
+    exp = datetime.utcnow() + timedelta(hours=1)
+    return {
+        'jwt': jwt.encode({'sub': str(user_id), 'type': 'access', 'exp': exp}, JWT_SECRET_KEY, algorithm='HS256'),
+        'auth': jwt.encode({'user_id': user_id, 'exp': exp}, SECRET_KEY, algorithm='HS256')
+    }
+
+
+async def _pipe(reader, writer, delay):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def start_latency_proxy(database_url, latency_ms):
+    """Forward a local TCP port to the database, delaying every reply by ``latency_ms``.
+
+    Stands in for the network hop to a remote database, which is where async
+    I/O pays off; returns the database URL rewritten to go through the proxy.
+    """
+    url = make_url(database_url)
+    socket_dir = url.query.get('host')
+    port = free_port()
+    delay = latency_ms / 1000
+
+    async def handle(client_reader, client_writer):
+        if socket_dir and not url.host:
+            server_reader, server_writer = await asyncio.open_unix_connection(
+                os.path.join(socket_dir, f'.s.PGSQL.{url.port or 5432}'))
+        else:
+            server_reader, server_writer = await asyncio.open_connection(url.host, url.port or 5432)
+        await asyncio.gather(_pipe(client_reader, server_writer, 0), _pipe(server_reader, client_writer, delay))
+
+    async def serve():
+        server = await asyncio.start_server(handle, '127.0.0.1', port, backlog=1024)
+        await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    time.sleep(0.2)
+    return url.set(host='127.0.0.1', port=port).difference_update_query(['host']).render_as_string(hide_password=False)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(env, port):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--workers', '1',
+         '--log-level', 'warning', '--backlog', '2048'],
+        cwd=ROOT, env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('server did not start')
+
+
+async def _request(reader, writer, url, headers):
+    """One keep-alive HTTP/1.1 GET; a hand-rolled client keeps the load generator's CPU out of the numbers."""
+    lines = [f'GET {url} HTTP/1.1', 'Host: 127.0.0.1'] + [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head[9:12])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def load(port, clients, duration, requests):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            while time.perf_counter() < deadline:
+                url, headers = rng.choice(requests)
+                started = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(_request(reader, writer, url, headers), 30)
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    errors += 1
+                    writer.close()
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.join(tempfile.gettempdir(), 'sparko_bench_asgi.db'))
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--matches-per-user', type=int, default=20)
+    parser.add_argument('--wsgi-workers', type=int, default=10)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='simulated database round-trip (PostgreSQL only)')
+    args = parser.parse_args()
+
+    if args.db_latency_ms:
+        args.database_url = start_latency_proxy(args.database_url, args.db_latency_ms)
+
+    env = dict(os.environ, SECRET_KEY=SECRET_KEY, JWT_SECRET_KEY=JWT_SECRET_KEY, DATABASE_URL=args.database_url,
+               WSGI_WORKERS=str(args.wsgi_workers), DB_POOL_SIZE=str(args.pool_size))
+    os.environ.update(env)
+
+    print(f'seeding {args.users} users...')
+    match_owners = seed(args.users, args.matches_per_user)
+
+    requests = []
+    for match_id, owner in match_owners[:args.users]:
+        tokens = tokens_for(owner)
+        jwt_headers = {'Authorization': f'Bearer {tokens["jwt"]}'}
+        requests.append(('/api/matching/matches', jwt_headers))
+        requests.append(('/api/profile/profiles', jwt_headers))
+        requests.append((f'/api/chat/matches/{match_id}/messages?before_id=1000000',
+                         {'Authorization': f'Bearer {tokens["auth"]}'}))
+
+    print(f'{args.clients} clients x {args.duration:g}s, 1 uvicorn worker, '
+          f'{args.wsgi_workers} WSGI threads / {args.pool_size} async connections, '
+          f'+{args.db_latency_ms:g} ms per database round-trip')
+    for label, async_routes in (('flask (threads)', '0'), ('async', '1')):
+        port = free_port()
+        server = start_server(dict(env, SPARKO_ASYNC_ROUTES=async_routes), port)
+        try:
+            rps, latencies, errors = asyncio.run(load(port, args.clients, args.duration, requests))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f'  {label:<16} {rps:8.1f} req/s   p50 {percentile(latencies, 0.5) * 1000:7.1f} ms'
+              f'   p99 {percentile(latencies, 0.99) * 1000:7.1f} ms   errors {errors}')
+
+
+if __name__ == '__main__':
+    main()
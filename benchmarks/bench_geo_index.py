@@ -0,0 +1,123 @@
+"""Benchmark: radius and timezone queries over 1M geocoded profiles on one core.
+
+Usage: python benchmarks/bench_geo_index.py [--profiles 1000000] [--queries 200] [--radius 25 100 250]
+
+Profiles are scattered around the gazetteer's cities (popular hubs drawn
+more often) with a ~30 km spread, so queries around a hub return tens of
+thousands of ids, as they would in production. The first queries of each
+radius are checked against a brute-force haversine scan, and the run is
+repeated with pending saves in the index's overlay, after the one query
+that rebuilds the overlay's arrays. Exits non-zero if the p99 of a 100 km
+query on the merged index misses the budget; the overlay pass, where
+tombstones cost another mask per slice, is reported only.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services import gazetteer
+from src.services.geo_index import EARTH_RADIUS_KM, GeoIndex, haversine_km
+
+BUDGET_MS = 1.0
+SPREAD_KM = 30.0
+REGION_SHARE = 0.05
+CHECKED = 5
+
+
+def synthetic_places(n, rng):
+    """``(ids, latitudes, longitudes, offsets, city precision)`` around weighted gazetteer cities."""
+    cities = gazetteer._rows(gazetteer.CITIES)
+    weights = 1 / np.sqrt(np.arange(1, len(cities) + 1))
+    picks = rng.choice(len(cities), n, p=weights / weights.sum())
+    lat = np.array([float(city[3]) for city in cities])[picks]
+    lon = np.array([float(city[4]) for city in cities])[picks]
+    offsets = np.array([float(city[5]) for city in cities])[picks]
+    spread = np.degrees(SPREAD_KM / EARTH_RADIUS_KM)
+    lat = np.clip(lat + rng.normal(0, spread, n), -89.9, 89.9)
+    lon = (lon + rng.normal(0, spread, n) / np.cos(np.radians(lat)) + 180) % 360 - 180
+    return np.arange(1, n + 1), lat, lon, offsets, rng.random(n) >= REGION_SHARE
+
+
+def to_places(ids, lat, lon, offsets, city):
+    return {
+        int(user_id): gazetteer.Place('', float(a), float(b), float(c), 'city' if d else 'region')
+        for user_id, a, b, c, d in zip(ids, lat, lon, offsets, city)
+    }
+
+
+def brute_force(points, lat, lon, km):
+    ids, latitudes, longitudes, _, city = points
+    distances = haversine_km(np.radians(lat), np.radians(lon), np.radians(latitudes), np.radians(longitudes))
+    return np.sort(ids[(distances <= km) & city])
+
+
+def run(index, points, centers, radii, label, gated=True):
+    failed = False
+    for km in radii:
+        timings, hits = [], []
+        for i, (lat, lon) in enumerate(centers):
+            started = time.perf_counter()
+            ids = index.within('investor', lat, lon, km)
+            timings.append((time.perf_counter() - started) * 1000)
+            hits.append(len(ids))
+            if i < CHECKED:
+                assert np.array_equal(np.sort(ids), brute_force(points, lat, lon, km)), f'wrong answer at {km} km'
+        p50, p99 = np.percentile(timings, [50, 99])
+        over = gated and km == 100 and p99 >= BUDGET_MS
+        failed |= over
+        print(f'{label:<10} within {km:>4} km: p50 {p50 * 1000:6.0f} us  p99 {p99 * 1000:6.0f} us  '
+              f'mean {np.mean(hits):8.0f} ids' + ('  OVER BUDGET' if over else ''))
+
+    timings = []
+    for offset in np.random.default_rng(1).choice([-8, -5, 0, 1, 5.5, 8, 9], 50):
+        started = time.perf_counter()
+        index.in_timezone('investor', offset, 2)
+        timings.append((time.perf_counter() - started) * 1000)
+    p50, p99 = np.percentile(timings, [50, 99])
+    print(f'{label:<10} timezone ±2h:    p50 {p50 * 1000:6.0f} us  p99 {p99 * 1000:6.0f} us')
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=float, nargs='+', default=[25, 100, 250])
+    parser.add_argument('--saves', type=int, default=2_000, help='updates pending in the overlay')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    points = synthetic_places(args.profiles, rng)
+    started = time.perf_counter()
+    index = GeoIndex.from_places({'investor': to_places(*points)})
+    print(f'indexed {len(index):,} profiles in {time.perf_counter() - started:.1f}s')
+
+    _, center_lat, center_lon, _, _ = synthetic_places(args.queries, rng)
+    centers = list(zip(center_lat, center_lon))
+    failed = run(index, points, centers, args.radius, 'merged')
+
+    # Move some profiles and drop others, leaving the changes in the overlay
+    ids, lat, lon, offsets, city = (array.copy() for array in points)
+    moved = rng.choice(len(ids), args.saves, replace=False)
+    _, lat[moved], lon[moved], offsets[moved], city[moved] = synthetic_places(args.saves, rng)
+    for position in moved:
+        index.update('investor', ids[position], gazetteer.Place(
+            '', lat[position], lon[position], offsets[position], 'city' if city[position] else 'region'))
+    city[moved[:args.saves // 10]] = False
+    for position in moved[:args.saves // 10]:
+        index.remove('investor', ids[position])
+    started = time.perf_counter()
+    index.within('investor', *centers[0], 1)
+    print(f'first query after the saves (rebuilds the overlay arrays): '
+          f'{(time.perf_counter() - started) * 1e6:.0f} us')
+    failed |= run(index, (ids, lat, lon, offsets, city), centers, args.radius, 'overlay', gated=False)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
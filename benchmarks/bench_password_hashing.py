@@ -0,0 +1,111 @@
+"""Benchmark: login and swipe latency under a mixed load, inline vs. pooled bcrypt.
+
+Usage: python benchmarks/bench_password_hashing.py [--threads 16] [--duration 10] [--login-rate 10] [--swipe-rate 200] [--rounds 12]
+
+Simulates a threaded request server fed an open-loop mix of logins and
+swipes at fixed arrival rates. Each login verifies a bcrypt hash, either
+inline on the request thread the way ``User.check_password`` does or through
+``PasswordHasher``; each swipe is a short CPU-bound handler. Latency is
+measured from arrival to completion (queueing included) and reported as
+p50/p99 per request type, with the number of logins shed with 503.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services.password_hasher import DEFAULT_MAX_QUEUE, DEFAULT_WORKERS, HasherOverloaded, PasswordHasher
+
+
+def swipe_handler():
+    digest = b'swipe'
+    for _ in range(200):
+        digest = hashlib.sha256(digest).digest()
+    return digest
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(mode, args, hashed):
+    hasher = None
+    if mode == 'pool':
+        hasher = PasswordHasher(workers=args.hash_workers, max_queue=args.max_queue, rounds=args.rounds)
+        hasher.check('warm-up', hashed)
+
+    def login():
+        if hasher is None:
+            return bcrypt.checkpw(b'password123', hashed.encode())
+        return hasher.check('password123', hashed)
+
+    latencies = {'login': [], 'swipe': []}
+    rejected = [0]
+    lock = threading.Lock()
+
+    def handle(kind, arrived):
+        try:
+            login() if kind == 'login' else swipe_handler()
+        except HasherOverloaded:
+            with lock:
+                rejected[0] += 1
+            return
+        with lock:
+            latencies[kind].append(time.perf_counter() - arrived)
+
+    # Interleave arrivals of both request types on one schedule
+    schedule = sorted(
+        [(i / args.login_rate, 'login') for i in range(int(args.login_rate * args.duration))] +
+        [(i / args.swipe_rate, 'swipe') for i in range(int(args.swipe_rate * args.duration))]
+    )
+
+    server = ThreadPoolExecutor(args.threads)
+    start = time.perf_counter()
+    for offset, kind in schedule:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        server.submit(handle, kind, time.perf_counter())
+    server.shutdown(wait=True)
+    if hasher is not None:
+        hasher.shutdown()
+
+    print(f'{mode}:')
+    for kind in ('login', 'swipe'):
+        values = latencies[kind]
+        print(f'  {kind:<6} n={len(values):<6} p50 {percentile(values, 0.50) * 1000:8.1f} ms'
+              f'   p99 {percentile(values, 0.99) * 1000:8.1f} ms')
+    if mode == 'pool':
+        print(f'  logins rejected with 503: {rejected[0]}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16, help='request worker threads')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--login-rate', type=float, default=10, help='logins per second')
+    parser.add_argument('--swipe-rate', type=float, default=200, help='swipes per second')
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--hash-workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE)
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(b'password123', bcrypt.gensalt(args.rounds)).decode()
+    print(f'{os.cpu_count()} CPUs, {args.threads} request threads, {args.hash_workers} hash workers, '
+          f'cost {args.rounds}, {args.login_rate:g} logins/s + {args.swipe_rate:g} swipes/s')
+    for mode in ('inline', 'pool'):
+        run(mode, args, hashed)
+
+
+if __name__ == '__main__':
+    main()
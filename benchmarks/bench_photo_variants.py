@@ -0,0 +1,86 @@
+"""Benchmark: card image bytes per swipe session, originals vs. rendered variants.
+
+Usage: python benchmarks/bench_photo_variants.py [--photos 20] [--session 50] [--workers 2]
+
+Generates synthetic phone-camera-sized JPEGs, pushes them through
+``PhotoPipeline`` and reports the pipeline's throughput, the average size of
+each variant, and the image bytes a client downloads for a swipe session of
+``--session`` cards when served originals vs. the card variant.
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services.photo_store import FORMATS, ORIGINAL, VARIANTS, PhotoPipeline, variant_path
+
+
+def synthetic_photo(seed, size=(3024, 4032)):
+    """A smooth background with shapes and sensor-like noise, saved like a phone would."""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(100, 900)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(25))
+    noise = Image.effect_noise(size, 12).convert('RGB')
+    image = Image.blend(image, noise, 0.08)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type=int, default=20)
+    parser.add_argument('--session', type=int, default=50, help='cards viewed per swipe session')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f'generating {args.photos} synthetic photos...')
+    photos = [synthetic_photo(i) for i in range(args.photos)]
+
+    root = tempfile.mkdtemp(prefix='sparko-photos-')
+    pipeline = PhotoPipeline(root, workers=args.workers)
+    try:
+        started = time.perf_counter()
+        futures = [pipeline.schedule(pipeline.store(data)) for data in photos]
+        digests = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+        print(f'rendered {len(digests)} photos in {elapsed:.2f}s with {args.workers} workers '
+              f'({len(digests) / elapsed:.1f} photos/s)')
+
+        sizes = {}
+        for digest in digests:
+            sizes.setdefault('original', []).append(os.path.getsize(variant_path(root, digest, ORIGINAL, 'bin')))
+            for variant in VARIANTS:
+                for extension in FORMATS:
+                    path = variant_path(root, digest, variant, extension)
+                    sizes.setdefault(f'{variant}.{extension}', []).append(os.path.getsize(path))
+
+        print(f'  {"variant":<12} {"avg bytes":>10}   {"per session of " + str(args.session):>22}')
+        original_session = None
+        for name, values in sizes.items():
+            average = sum(values) / len(values)
+            session = average * args.session
+            if original_session is None:
+                original_session = session
+            print(f'  {name:<12} {average:>10.0f}   {session / 1024 / 1024:>18.2f} MiB'
+                  f'  ({original_session / session:5.1f}x smaller)')
+    finally:
+        pipeline.shutdown()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark: /api/profiles per-request cost, filter-and-serialize vs. the pre-encoded catalog.
+
+Usage: python benchmarks/bench_profile_catalog.py [--profiles 100000] [--requests 200]
+
+Fills ``api_profiles`` with ``--profiles`` synthetic profiles and replays
+role queries (unpaged, 20-item pages at random offsets, and conditional
+requests carrying the previous ETag) against the route through a Starlette
+TestClient. It runs once with the old handler, which filtered the list and
+let FastAPI serialize the result, and once with the catalog. It prints
+milliseconds per request and the one-off catalog build time.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from fastapi import FastAPI, Query
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import api_profiles
+
+SKILLS = ["AI", "Fintech", "Blockchain", "UX", "Marketing", "Cloud"]
+
+
+def synthetic_profiles(count, rng):
+    return [
+        {
+            "id": i,
+            "name": f"User {i}",
+            "role": rng.choice(api_profiles.roles),
+            "title": rng.choice(["AI Engineer", "UX Designer", "Investor", "Startup CEO"]),
+            "skills": rng.sample(SKILLS, 3),
+            "expectation": rng.choice(["Find co-founder", "Find investor", "Find technical partner"]),
+            "bio": f"This is a short bio for User {i}. Passionate about startups and new ventures."
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def legacy_app(profiles):
+    app = FastAPI()
+
+    @app.get("/api/profiles")
+    def get_profiles(role: str = Query(None), offset: int = Query(0), limit: int = Query(None)):
+        matching = [p for p in profiles if p["role"] == role] if role else profiles
+        return matching[offset:None if limit is None else offset + limit]
+
+    return app
+
+
+def replay(client, urls, conditional):
+    etags = {}
+    started = time.perf_counter()
+    for url in urls:
+        headers = {"If-None-Match": etags[url]} if conditional and url in etags else {}
+        response = client.get(url, headers=headers)
+        assert response.status_code in (200, 304), response.status_code
+        if "etag" in response.headers:
+            etags[url] = response.headers["etag"]
+    return (time.perf_counter() - started) / len(urls) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    profiles = synthetic_profiles(args.profiles, rng)
+    workloads = {
+        "unpaged role query": [f"/api/profiles?role={rng.choice(api_profiles.roles)}" for _ in range(args.requests)],
+        "20-item page": [
+            f"/api/profiles?role={rng.choice(api_profiles.roles)}&offset={rng.randrange(0, args.profiles // 3)}&limit=20"
+            for _ in range(args.requests)
+        ],
+    }
+    workloads["repeat page (If-None-Match)"] = [url for url in workloads["20-item page"][:10] for _ in range(args.requests // 10)]
+
+    api_profiles.catalog.replace(profiles)
+    started = time.perf_counter()
+    api_profiles.catalog.snapshot()
+    print(f"{args.profiles} profiles, catalog build {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    legacy, catalog = TestClient(legacy_app(profiles)), TestClient(api_profiles.app)
+    print(f"{'':<30} {'legacy ms/req':>14} {'catalog ms/req':>15}")
+    for label, urls in workloads.items():
+        # The unpaged legacy query takes seconds per request at 100k; a handful is enough
+        legacy_urls = urls[:5] if label == "unpaged role query" else urls
+        conditional = "If-None-Match" in label
+        print(f"{label:<30} {replay(legacy, legacy_urls, conditional):14.2f} {replay(catalog, urls, conditional):15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark: score 1M candidate profiles and take the top-k on one core.
+
+Usage: python benchmarks/bench_scoring.py [--candidates 1000000] [--queries 50]
+
+Features are synthesized block by block with the same layout and sparsity as
+``scoring.encode`` produces, so no database is needed. Exits non-zero if the
+p99 latency misses the budget.
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services.scoring import BLOCKS, DIM, OFFSETS, CandidateMatrix
+
+BUDGET_MS = 50.0
+ACTIVE_PER_BLOCK = {'skills': 4, 'industry': 2, 'stage': 1, 'amount': 2, 'geo': 1, 'investor_type': 1}
+
+
+def synthetic_features(n, rng):
+    features = np.zeros((n, DIM), dtype=np.float32)
+    rows = np.arange(n)
+    for name, width, _ in BLOCKS:
+        start, _ = OFFSETS[name]
+        active = ACTIVE_PER_BLOCK[name]
+        for _ in range(active):
+            features[rows, start + rng.integers(0, width, n)] = 1.0
+        block = features[:, start:start + width]
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, norms, out=block, where=norms > 0)
+    return features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--candidates', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--exclude', type=int, default=5_000, help='already-swiped ids per query')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    started = time.perf_counter()
+    matrix = CandidateMatrix(np.arange(1, args.candidates + 1), synthetic_features(args.candidates, rng))
+    print(f'built {len(matrix):,} x {DIM} matrix ({matrix.features.nbytes / 2**20:.0f} MiB) '
+          f'in {time.perf_counter() - started:.1f}s')
+
+    queries = synthetic_features(args.queries, rng)
+    matrix.top_k(queries[0], args.k)  # warm up
+
+    timings = []
+    for query in queries:
+        exclude = rng.choice(args.candidates, args.exclude, replace=False) + 1
+        started = time.perf_counter()
+        ids, _ = matrix.top_k(query, args.k, exclude)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert len(ids) == args.k
+
+    timings = np.array(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f'top_k(k={args.k}) over {args.candidates:,} candidates: '
+          f'p50 {p50:.1f} ms  p95 {p95:.1f} ms  p99 {p99:.1f} ms  (budget {BUDGET_MS:.0f} ms)')
+    return 0 if p99 < BUDGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Benchmark: bytes and CPU per response for the list endpoint serializers.
+
+Usage: python benchmarks/bench_serialization.py [--cards 20] [--iterations 2000]
+
+Builds a page of synthetic /discover cards and a page of chat messages from
+transient model objects, then encodes them the way the routes used to
+(``to_dict`` + ``json.dumps``) and through ``serializers`` in each wire
+format: JSON, sparse-fieldset JSON, MessagePack, and each of those with gzip
+and brotli. Prints bytes and microseconds per response.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.models.user import User, UserProfile, Message
+from src.services import serializers
+
+SKILLS = ['AI', 'Fintech', 'SaaS', 'Marketplaces', 'Climate', 'Healthcare', 'B2B', 'Hardware']
+SPARSE_CARD_FIELDS = ['user_id', 'name', 'photo_url', 'title', 'tagline', 'skills', 'industry', 'funding_stage']
+
+
+def synthetic_cards(count):
+    rows = []
+    for i in range(count):
+        user = User(id=i + 1, email=f'user{i}@example.com', name=f'Founder {i}', age=30 + i % 20,
+                    location='San Francisco, CA', photo_url=f'https://cdn.example.com/photos/{i}.jpg',
+                    current_role='entrepreneur')
+        profile = UserProfile(
+            id=i + 1, user_id=i + 1, role='entrepreneur', title='Founder & CEO', company=f'Startup {i}',
+            tagline='Building the operating system for small-business finance',
+            bio='Second-time founder, previously led payments infrastructure at a large fintech. ' * 3,
+            project_description='We automate cash-flow forecasting for SMBs using bank data. ' * 4,
+            funding_stage='Seed', funding_amount='$1M - $2M', industry='Fintech', team_size='5-10',
+            looking_for_investor_type='Angel or seed fund', is_complete=True, completion_percentage=100,
+            created_at=datetime.utcnow(), updated_at=datetime.utcnow()
+        )
+        profile.set_skills(SKILLS[i % 4:i % 4 + 4])
+        rows.append((profile, user))
+    return rows
+
+
+def synthetic_messages(count):
+    now = datetime.utcnow()
+    return [
+        Message(id=i + 1, match_id=1, sender_id=1 + i % 2, content=f'Message {i}: sounds great, when are you free to talk?', created_at=now)
+        for i in range(count)
+    ]
+
+
+def legacy_card(row):
+    profile, user = row
+    data = profile.to_dict()
+    data.update({'name': user.name, 'age': user.age, 'location': user.location, 'photo_url': user.photo_url})
+    return data
+
+
+def legacy_message(message, viewer_id):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender_id': message.sender_id,
+        'is_from_me': message.sender_id == viewer_id,
+        'created_at': message.created_at.isoformat()
+    }
+
+
+def measure(build, iterations):
+    body = build()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build()
+    return len(body), (time.perf_counter() - started) / iterations * 1e6
+
+
+def report(title, variants, iterations):
+    print(title)
+    print(f'  {"variant":<28} {"bytes":>8} {"us/resp":>10}')
+    for name, build in variants:
+        size, micros = measure(build, iterations)
+        print(f'  {name:<28} {size:>8} {micros:>10.1f}')
+
+
+def variants_for(legacy, serialize):
+    def encoded(mimetype, encoding, fields=None):
+        return lambda: serializers.compress(serializers.encode(serialize(fields), mimetype), encoding)
+
+    msgpack_type = serializers.MSGPACK_MIMETYPES[0]
+    return [
+        ('to_dict + json (before)', lambda: json.dumps(legacy()).encode()),
+        ('serializer json', encoded('application/json', None)),
+        ('serializer json + gzip', encoded('application/json', 'gzip')),
+        ('serializer json + br', encoded('application/json', 'br')),
+        ('serializer msgpack', encoded(msgpack_type, None)),
+        ('serializer msgpack + br', encoded(msgpack_type, 'br')),
+        ('sparse json', encoded('application/json', None, True)),
+        ('sparse json + br', encoded('application/json', 'br', True)),
+        ('sparse msgpack', encoded(msgpack_type, None, True)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    cards = synthetic_cards(args.cards)
+    report(f'/discover page of {args.cards} cards', variants_for(
+        lambda: {'profiles': [legacy_card(row) for row in cards]},
+        lambda sparse: {'profiles': serializers.DISCOVER_CARD.only(SPARSE_CARD_FIELDS if sparse else None).many(cards)}
+    ), args.iterations)
+
+    messages = synthetic_messages(args.messages)
+    report(f'chat page of {args.messages} messages', variants_for(
+        lambda: {'messages': [legacy_message(message, 1) for message in messages]},
+        lambda sparse: {'messages': serializers.MESSAGE.only(['id', 'content', 'sender_id'] if sparse else None).many(messages, viewer_id=1)}
+    ), args.iterations)
+
+
+if __name__ == '__main__':
+    main()
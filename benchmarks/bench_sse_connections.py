@@ -0,0 +1,92 @@
+"""Benchmark: how many idle SSE connections one worker holds.
+
+Usage: python benchmarks/bench_sse_connections.py [--connections 10000] [--step 1000]
+
+Starts one uvicorn worker serving ``main:app`` with the in-memory broker,
+opens idle /api/events streams in steps and reports the worker's resident
+memory per connection after each step. Raise ``ulimit -n`` above the
+connection count first.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import jwt
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SECRET_KEY = 'bench-secret-key-bench-secret-key'
+
+
+def rss_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def open_stream(port, user_id):
+    token = jwt.encode({'user_id': user_id}, SECRET_KEY, algorithm='HS256')
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /api/events?token={token} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b': connected\n\n')
+    if b'200 OK' not in head:
+        raise RuntimeError(head.decode(errors='replace'))
+    return writer
+
+
+async def run(args, pid):
+    writers = []
+    baseline = rss_kib(pid)
+    print(f'worker baseline RSS: {baseline / 1024:.1f} MiB')
+    user_id = 1
+    while len(writers) < args.connections:
+        started = time.perf_counter()
+        batch = min(args.step, args.connections - len(writers))
+        for offset in range(0, batch, 200):
+            writers += await asyncio.gather(*[
+                open_stream(args.port, user_id + i) for i in range(offset, min(offset + 200, batch))
+            ])
+        user_id += batch
+        elapsed = time.perf_counter() - started
+        rss = rss_kib(pid)
+        print(f'{len(writers):>7,} idle connections  RSS {rss / 1024:7.1f} MiB  '
+              f'{(rss - baseline) / len(writers):5.1f} KiB/connection  (+{batch} in {elapsed:.2f}s)')
+    for writer in writers:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=10_000)
+    parser.add_argument('--step', type=int, default=1_000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.connections + 100:
+        print(f'warning: open file limit {hard} caps the run below {args.connections} connections')
+
+    env = dict(os.environ, SECRET_KEY=SECRET_KEY, PYTHONPATH=ROOT)
+    env.pop('SPARKO_BROKER_URL', None)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(args.port),
+         '--log-level', 'warning', '--workers', '1'],
+        cwd=ROOT, env=env
+    )
+    try:
+        time.sleep(2)
+        asyncio.run(run(args, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark: per-swipe commits vs. the write-behind swipe buffer.
+
+Usage: python benchmarks/bench_swipe_buffer.py [--swipes 20000] [--database-url sqlite:///...]
+
+Writes the same synthetic swipes twice, once committing each row on its own
+the way /swipe does and once through ``SwipeBuffer``, then prints the
+throughput of both and the buffer's flush latency / flush size histograms.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.models.user import db, Swipe
+from src.services.swipe_buffer import SwipeBuffer
+
+
+def synthetic_swipes(count, offset=0):
+    now = datetime.utcnow()
+    return [
+        {
+            'swiper_id': 1 + (i // 1000),
+            'swiped_id': offset + i,
+            'swiper_role': 'investor',
+            'swiped_role': 'entrepreneur',
+            'action': 'like' if i % 3 else 'skip',
+            'created_at': now
+        }
+        for i in range(count)
+    ]
+
+
+def print_histogram(title, snapshot):
+    print(f'{title} (count {snapshot["count"]}, sum {snapshot["sum"]:.3f})')
+    previous = 0
+    for bound, cumulative in snapshot['buckets'].items():
+        print(f'  le {bound:>8}: {cumulative - previous}')
+        previous = cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--swipes', type=int, default=20_000)
+    parser.add_argument('--flush-size', type=int, default=500)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        rows = synthetic_swipes(args.swipes)
+        started = time.perf_counter()
+        for row in rows:
+            db.session.add(Swipe(**row))
+            db.session.commit()
+        direct = time.perf_counter() - started
+        print(f'per-swipe commit: {args.swipes:,} swipes in {direct:.2f}s '
+              f'({args.swipes / direct:,.0f} swipes/s)')
+
+    buffer = SwipeBuffer(app, flush_size=args.flush_size, flush_interval=args.flush_interval)
+    rows = synthetic_swipes(args.swipes, offset=args.swipes)
+    started = time.perf_counter()
+    for i in range(0, len(rows), 20):
+        buffer.add(rows[i:i + 20])
+    accepted = time.perf_counter() - started
+    buffer.close()
+    drained = time.perf_counter() - started
+    print(f'write-behind buffer: accepted {args.swipes:,} swipes in {accepted:.3f}s, '
+          f'drained in {drained:.2f}s ({args.swipes / drained:,.0f} swipes/s, '
+          f'{direct / drained:.1f}x)')
+
+    stats = buffer.stats()
+    print_histogram('flush latency (s)', stats['flush_seconds'])
+    print_histogram('rows per flush', stats['flush_rows'])
+
+
+if __name__ == '__main__':
+    main()
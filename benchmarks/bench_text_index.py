@@ -0,0 +1,154 @@
+"""Benchmark: BM25 queries over 1M profiles' text on one core.
+
+Usage: python benchmarks/bench_text_index.py [--profiles 1000000] [--queries 300] [--segments 4]
+
+Profiles get ~40 distinct terms each from a Zipf-distributed vocabulary,
+so common terms post to a third of the corpus and rare ones to a handful;
+queries are one to three terms picked log-uniformly by frequency rank, for
+investors with complete profiles, and pages of 20. The index is timed in
+memory, then written to a temporary directory and timed again from the
+memory-mapped files, with and without an ``allowed`` candidate list like
+the one tag filters produce. A small corpus is first checked against a
+straightforward BM25 over Python dicts. Exits non-zero if the p99 of the
+on-disk queries misses the budget.
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services.text_index import B, K1, ROLE_CODES, Segment, TextIndex
+
+BUDGET_MS = 20.0
+VOCABULARY = 50_000
+TERMS_PER_PROFILE = 40
+COMPLETE_SHARE = 0.8
+ALLOWED_SHARE = 0.05
+RANK_SHIFT = 10
+
+
+def synthetic_segments(n, count, rng):
+    """``count`` segments of ``n`` synthetic profiles, user ids 1..n, roles and completeness at random."""
+    # Zipf-Mandelbrot: stopwords are gone, so the commonest term is in about a third of profiles
+    weights = 1 / (np.arange(1, VOCABULARY + 1) + RANK_SHIFT)
+    terms = [f'w{rank}' for rank in range(VOCABULARY)]
+    segments = []
+    for seq, ids in enumerate(np.array_split(np.arange(1, n + 1), count), start=1):
+        roles = rng.integers(0, len(ROLE_CODES), len(ids))
+        keys = np.sort(roles.astype(np.int64) << 32 | ids)
+        per_doc = rng.poisson(TERMS_PER_PROFILE, len(ids))
+        numbers = np.repeat(np.arange(len(ids)), per_doc)
+        term_ids = rng.choice(VOCABULARY, len(numbers), p=weights / weights.sum())
+        pairs = np.unique(numbers.astype(np.int64) * VOCABULARY + term_ids)
+        numbers, term_ids = pairs // VOCABULARY, pairs % VOCABULARY
+        tfs = rng.geometric(0.6, len(pairs))
+        lengths = np.bincount(numbers, weights=tfs, minlength=len(ids)).astype(np.uint32)
+        segments.append(Segment.from_postings(
+            f'bench-{seq}', seq, keys,
+            complete=rng.random(len(ids)) < COMPLETE_SHARE,
+            removed=np.zeros(len(ids), dtype=bool),
+            lengths=lengths, terms=terms,
+            term_ids=term_ids.astype(np.int32), numbers=numbers.astype(np.int32), tfs=tfs.astype(np.int32)
+        ))
+    return segments
+
+
+def reference(segments, query, role, limit):
+    """Top ``limit`` ``(user id, score)`` pairs by a per-document BM25 over dicts."""
+    docs = {}
+    for segment in segments:
+        for number, key in enumerate(segment.keys.tolist()):
+            docs[key] = (int(segment.lengths[number]), bool(segment.complete[number]), {})
+        for t, term in enumerate(segment.terms):
+            for posting in range(segment.starts[t], segment.starts[t + 1]):
+                docs[int(segment.keys[segment.docs[posting]])][2][term] = int(segment.tfs[posting])
+    avgdl = sum(length for length, _, _ in docs.values()) / len(docs)
+    scores = {}
+    for key, (length, complete, tfs) in docs.items():
+        if key >> 32 != ROLE_CODES[role] or not complete:
+            continue
+        score = 0.0
+        for term in query:
+            df = sum(term in other[2] for other in docs.values())
+            if term in tfs:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tfs[term] * (K1 + 1) / (tfs[term] + K1 * (1 - B + B * length / avgdl))
+        if score:
+            scores[key & 0xFFFFFFFF] = score
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def check(rng):
+    segments = synthetic_segments(2_000, 2, rng)
+    index = TextIndex.from_segments(segments)
+    for ranks in ([0], [3, 40], [120, 7, 900]):
+        query = [f'w{rank}' for rank in ranks]
+        ids, scores, _ = index.search(' '.join(query), 'investor', limit=10)
+        expected = reference(segments, query, 'investor', 10)
+        assert ids == [user_id for user_id, _ in expected], f'wrong ranking for {query}'
+        assert np.allclose(scores, [score for _, score in expected], rtol=1e-4), f'wrong scores for {query}'
+
+
+def queries(count, rng):
+    ranks = np.exp(rng.uniform(0, np.log(VOCABULARY), (count, 3))).astype(int) - 1
+    sizes = rng.integers(1, 4, count)
+    return [' '.join(f'w{rank}' for rank in row[:size]) for row, size in zip(ranks, sizes)]
+
+
+def run(index, texts, label, allowed=None):
+    timings, totals = [], []
+    for text in texts:
+        started = time.perf_counter()
+        _, _, total = index.search(text, 'investor', allowed=allowed, limit=20)
+        timings.append((time.perf_counter() - started) * 1000)
+        totals.append(total)
+    p50, p99 = np.percentile(timings, [50, 99])
+    print(f'{label:<18} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {max(timings):6.2f} ms  '
+          f'mean {np.mean(totals):8.0f} matches')
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--segments', type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    check(rng)
+    print('rankings match the reference BM25')
+
+    started = time.perf_counter()
+    segments = synthetic_segments(args.profiles, args.segments, rng)
+    postings = sum(segment.postings for segment in segments)
+    print(f'built {args.profiles:,} profiles, {postings:,} postings in {time.perf_counter() - started:.1f}s')
+    texts = queries(args.queries, rng)
+    allowed = np.sort(rng.choice(np.arange(1, args.profiles + 1), int(args.profiles * ALLOWED_SHARE), replace=False))
+
+    run(TextIndex.from_segments(segments), texts, 'in memory')
+    with tempfile.TemporaryDirectory() as path:
+        started = time.perf_counter()
+        index = TextIndex.from_segments(segments, path)
+        print(f'wrote and mapped {len(index):,} profiles in {time.perf_counter() - started:.1f}s')
+        p99 = run(index, texts, 'memory-mapped')
+        p99 = max(p99, run(index, texts, 'with allowed ids', allowed))
+
+        started = time.perf_counter()
+        index.merge(index.segments)
+        print(f'merged {args.segments} segments in {time.perf_counter() - started:.1f}s')
+        p99 = max(p99, run(index, texts, 'after merge'))
+
+    over = p99 >= BUDGET_MS
+    print(f'p99 {p99:.2f} ms, budget {BUDGET_MS:.0f} ms' + ('  OVER BUDGET' if over else ''))
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Benchmark: recall@10 and latency of the IVF vector index against brute force.
+
+Usage: python benchmarks/bench_vector_index.py [--profiles 200000] [--queries 300] [--nprobe 4 8 16 32]
+
+Profiles are synthetic text: each mixes words of a primary and a
+secondary topic (out of 300) with background words common to all. Every
+topic has its own words and shares a few with its neighbour. The
+embedding model is trained on a sample and every profile is embedded. The index is built in memory, and queries are held-out
+profiles' vectors. For each ``nprobe`` it reports the share of the exact
+top 10 the index finds, and the latency of both. Then the same is done
+against the index written to a temporary directory and memory-mapped.
+Exits non-zero if recall at the default ``NPROBE`` is under the target,
+or if the index is not faster than scanning.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services.embeddings import EmbeddingModel
+from src.services.vector_index import NPROBE, VectorIndex
+
+RECALL_TARGET = 0.9
+TOPICS = 300
+WORDS_PER_TOPIC = 40
+SHARED_WORDS = 8
+BACKGROUND = 2000
+WORDS_PER_PROFILE = 40
+MIX = (0.35, 0.25, 0.4)  # primary topic, secondary topic, background
+TRAIN_SAMPLE = 50_000
+K = 10
+
+
+def synthetic_texts(n, rng):
+    """``n`` profile texts and their primary topics."""
+    sizes = rng.poisson(WORDS_PER_PROFILE, n)
+    owner = np.repeat(np.arange(n), sizes)
+    primary = rng.integers(0, TOPICS, n)
+    secondary = rng.integers(0, TOPICS, n)
+    source = rng.choice(len(MIX), len(owner), p=MIX)
+    topic = np.where(source == 0, primary[owner], secondary[owner])
+    # Neighbouring topics share words, as "fintech" and "payments" profiles do
+    word = rng.integers(0, WORDS_PER_TOPIC + SHARED_WORDS, len(owner))
+    word = np.where(
+        word < WORDS_PER_TOPIC,
+        topic * WORDS_PER_TOPIC + word,
+        (topic + 1) % TOPICS * WORDS_PER_TOPIC + word - WORDS_PER_TOPIC
+    )
+    word = np.where(source == 2, TOPICS * WORDS_PER_TOPIC + rng.integers(0, BACKGROUND, len(owner)), word)
+    vocabulary = np.array([f't{topic}w{word}' for topic in range(TOPICS) for word in range(WORDS_PER_TOPIC)]
+                          + [f'b{word}' for word in range(BACKGROUND)])
+    words = np.split(vocabulary[word], np.cumsum(sizes)[:-1])
+    return [' '.join(profile_words) for profile_words in words], primary
+
+
+def run(index, queries, label, nprobes):
+    exact, timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        ids, _ = index.exact('investor', query, K)
+        timings.append((time.perf_counter() - started) * 1000)
+        exact.append(set(ids.tolist()))
+    p50, p99 = np.percentile(timings, [50, 99])
+    print(f'{label:<14} brute force     p50 {p50:6.2f} ms  p99 {p99:6.2f} ms')
+    brute_p50 = p50
+
+    results = {}
+    for nprobe in nprobes:
+        timings, found = [], 0
+        for query, expected in zip(queries, exact):
+            started = time.perf_counter()
+            ids, _ = index.nearest('investor', query, K, nprobe=nprobe)
+            timings.append((time.perf_counter() - started) * 1000)
+            found += len(expected & set(ids.tolist()))
+        recall = found / sum(len(expected) for expected in exact)
+        p50, p99 = np.percentile(timings, [50, 99])
+        print(f'{label:<14} nprobe {nprobe:<8} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  recall@{K} {recall:.3f}')
+        results[nprobe] = (recall, p50)
+    return brute_p50, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=200_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, NPROBE, 32])
+    args = parser.parse_args()
+    nprobes = sorted(set(args.nprobe) | {NPROBE})
+
+    rng = np.random.default_rng(42)
+    started = time.perf_counter()
+    texts, topics = synthetic_texts(args.profiles + args.queries, rng)
+    print(f'generated {len(texts):,} profiles in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    model = EmbeddingModel.train(texts[:min(TRAIN_SAMPLE, args.profiles)])
+    print(f'trained on {min(TRAIN_SAMPLE, args.profiles):,} profiles, {len(model.vocabulary):,} terms, '
+          f'{model.dim} dimensions in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    vectors = np.concatenate([model.embed(texts[start:start + 10_000]) for start in range(0, len(texts), 10_000)])
+    print(f'embedded {len(texts):,} profiles in {time.perf_counter() - started:.1f}s')
+    queries, vectors = vectors[args.profiles:], vectors[:args.profiles]
+    query_topics, topics = topics[args.profiles:], topics[:args.profiles]
+
+    started = time.perf_counter()
+    index = VectorIndex.from_vectors(model, {'investor': (np.arange(1, args.profiles + 1), vectors)})
+    print(f'built the index in {time.perf_counter() - started:.1f}s')
+    brute_p50, results = run(index, queries, 'in memory', nprobes)
+
+    same_topic = np.mean([
+        np.mean(topics[index.nearest('investor', query, K)[0] - 1] == topic)
+        for query, topic in zip(queries, query_topics)
+    ])
+    print(f'{same_topic:.0%} of the top {K} share the query profile\'s primary topic '
+          f'(1 in {TOPICS} at random)')
+
+    with tempfile.TemporaryDirectory() as path:
+        index.save(path)
+        mapped = VectorIndex.load(path, model)
+        mapped_p50, mapped_results = run(mapped, queries, 'memory-mapped', nprobes)
+
+    recall = min(results[NPROBE][0], mapped_results[NPROBE][0])
+    slower = results[NPROBE][1] >= brute_p50 or mapped_results[NPROBE][1] >= mapped_p50
+    print(f'recall@{K} {recall:.3f} at nprobe {NPROBE}, target {RECALL_TARGET}'
+          + ('  UNDER TARGET' if recall < RECALL_TARGET else '')
+          + ('  NOT FASTER THAN BRUTE FORCE' if slower else ''))
+    return 1 if recall < RECALL_TARGET or slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
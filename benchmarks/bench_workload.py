@@ -0,0 +1,349 @@
+"""End-to-end workload replay: the user journey from sign-up to chat, with per-endpoint latency.
+
+Usage: python benchmarks/bench_workload.py [--users 200] [--concurrency 8] [--sessions 3] [--save run.json] [--compare baseline.json]
+
+Every virtual user registers and completes the profile for its role
+(``--mix``). Once all of them are onboarded, each runs ``--sessions``
+swiping sessions: /discover, a /swipe per card (``--like-rate``,
+``--super-spark-rate``), /matches, then for each new match unlock, send a
+message and poll the conversation. Virtual users mostly discover each other,
+so likes turn into matches and chats. ``--background-users`` first loads
+that many users from ``dataset.py`` to run against a larger catalog.
+
+By default the Flask app runs in-process (``--database-url``, a fresh
+schema) and each SQL statement is counted against the request that issued
+it. ``--url`` drives a running server instead; it must share
+``--jwt-secret-key``, and query counts are not available. The auth
+blueprint only issues its own tokens, so the ``@jwt_required`` routes get an
+access token minted here for the registered user id.
+
+It reports throughput and, per endpoint, requests, errors, p50/p95/p99 and
+queries per request. ``--save`` writes the results as JSON. ``--compare``
+diffs against a saved run and exits 1 when an endpoint gained more than
+``--query-tolerance`` queries per request or its p95 grew by more than
+``--latency-tolerance`` (endpoints with at least ``LATENCY_MIN_SAMPLES``
+requests). Query counts barely vary between runs, so an
+extra query in a handler shows up in the comparison.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import jwt
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+SECRET_KEY = 'bench-secret-key-0123456789abcdef'
+JWT_SECRET_KEY = 'bench-jwt-secret-key-0123456789ab'
+ROLES = ['entrepreneur', 'investor', 'partner']
+# Fewer samples than this make p95 too noisy to gate on
+LATENCY_MIN_SAMPLES = 100
+
+PROFILE_FIELDS = {
+    'entrepreneur': {
+        'project_description': 'We automate cash-flow forecasting for small businesses.',
+        'funding_stage': 'Seed', 'funding_amount': '$1M - $2M', 'industry': 'Fintech',
+        'team_size': '5-10', 'looking_for_investor_type': 'Seed fund'
+    },
+    'investor': {
+        'investment_range': '$100K - $1M', 'past_investments': '12 early-stage fintech companies',
+        'professional_background': 'Former operator turned investor.', 'geographic_preference': 'North America',
+        'value_add_services': 'Go-to-market, hiring', 'investment_preferences': {'stages': ['Seed']}
+    },
+    'partner': {
+        'availability': 'Full-time', 'collaboration_type': 'Co-founder', 'desired_role': 'CTO',
+        'equity_expectation': '1-5%', 'location_preference': 'Remote', 'expertise': ['Backend', 'ML']
+    }
+}
+
+
+class InProcessClient:
+    """Flask test client; counts the SQL statements each request issues on this thread."""
+
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def request(self, method, path, body=None, headers=None):
+        self.counter.count = 0
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True), self.counter.count
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        import requests
+        self.session = requests.Session()
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.session.request(method, self.base_url + path, json=body, headers=headers)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        return response.status_code, payload, None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, client, label, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        status, payload, queries = client.request(method, path, body, headers)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples[label].append(elapsed)
+            if queries is not None:
+                self.queries[label].append(queries)
+            if status >= 400:
+                self.errors[label] += 1
+        return status, payload or {}
+
+    def summary(self, wall_time):
+        endpoints = {}
+        for label, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            queries = self.queries.get(label)
+            endpoints[label] = {
+                'requests': len(samples),
+                'errors': self.errors[label],
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p95_ms': percentile(samples, 0.95) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'queries': sum(queries) / len(queries) if queries else None
+            }
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {'throughput': total / wall_time, 'requests': total, 'endpoints': endpoints}
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+class VirtualUser:
+    def __init__(self, index, role, rng, jwt_secret_key):
+        self.index = index
+        self.role = role
+        self.rng = rng
+        self.jwt_secret_key = jwt_secret_key
+        self.user_id = None
+        self.auth = self.jwt = None
+        self.chats = {}
+
+    def onboard(self, client, recorder, run_id):
+        status, payload = recorder.call(client, 'POST /auth/register', 'POST', '/api/auth/register', {
+            'email': f'vu{run_id}-{self.index}@example.com', 'password': 'password123',
+            'name': f'Virtual User {self.index}', 'role': self.role
+        })
+        if status != 201:
+            return False
+        self.user_id = payload['user']['id']
+        self.auth = {'Authorization': f'Bearer {payload["token"]}'}
+        access_token = jwt.encode({
+            'sub': str(self.user_id), 'type': 'access', 'fresh': False,
+            'exp': datetime.utcnow() + timedelta(hours=6)
+        }, self.jwt_secret_key, algorithm='HS256')
+        self.jwt = {'Authorization': f'Bearer {access_token}'}
+
+        profile = {
+            'title': 'Founder' if self.role == 'entrepreneur' else 'Partner', 'company': f'Company {self.index}',
+            'tagline': 'Building the future of small-business finance', 'bio': 'Operator and builder. ' * 10,
+            'skills': self.rng.sample(['AI', 'Fintech', 'SaaS', 'Growth', 'Sales', 'Design'], 3)
+        }
+        profile.update(PROFILE_FIELDS[self.role])
+        status, _ = recorder.call(client, 'PUT /profile/profiles/<role>', 'PUT',
+                                  f'/api/profile/profiles/{self.role}', profile, self.jwt)
+        return status == 200
+
+    def session(self, client, recorder, args):
+        _, payload = recorder.call(client, 'GET /matching/discover', 'GET', '/api/matching/discover', headers=self.jwt)
+        for card in payload.get('profiles', []):
+            roll = self.rng.random()
+            action = 'super_spark' if roll < args.super_spark_rate else 'like' if roll < args.like_rate else 'skip'
+            status, _ = recorder.call(client, 'POST /matching/swipe', 'POST', '/api/matching/swipe',
+                                      {'user_id': card['user_id'], 'action': action}, self.jwt)
+            if status == 400 and action == 'super_spark':
+                recorder.call(client, 'POST /matching/swipe', 'POST', '/api/matching/swipe',
+                              {'user_id': card['user_id'], 'action': 'like'}, self.jwt)
+
+        _, payload = recorder.call(client, 'GET /matching/matches', 'GET', '/api/matching/matches', headers=self.jwt)
+        for match in payload.get('matches', []):
+            match_id = match['match_id']
+            if match_id not in self.chats:
+                if not match.get('chat_unlocked'):
+                    recorder.call(client, 'POST /chat/matches/<id>/unlock', 'POST',
+                                  f'/api/chat/matches/{match_id}/unlock', headers=self.auth)
+                _, page = recorder.call(client, 'GET /chat/matches/<id>/messages', 'GET',
+                                        f'/api/chat/matches/{match_id}/messages', headers=self.auth)
+                self.chats[match_id] = page.get('latest_id')
+            recorder.call(client, 'POST /chat/matches/<id>/messages', 'POST', f'/api/chat/matches/{match_id}/messages',
+                          {'content': f'Hi from {self.index}, session message'}, self.auth)
+            since = self.chats[match_id]
+            path = f'/api/chat/matches/{match_id}/messages' + (f'?since_id={since}' if since else '')
+            _, page = recorder.call(client, 'GET /chat/matches/<id>/messages?since_id', 'GET', path, headers=self.auth)
+            self.chats[match_id] = page.get('latest_id') or since
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        if role not in ROLES:
+            raise argparse.ArgumentTypeError(f'unknown role {role!r}')
+        mix[role] = float(weight)
+    return mix
+
+
+def in_process_app(args):
+    from sqlalchemy import event
+
+    os.environ.update(SECRET_KEY=SECRET_KEY, JWT_SECRET_KEY=JWT_SECRET_KEY, DATABASE_URL=args.database_url)
+    if args.background_users:
+        import dataset
+        print(f'loading {args.background_users} background users...')
+        dataset.generate(args.database_url, args.background_users, args.background_users * 50, log=lambda line: None)
+
+    from flask_app import create_app
+    from src.models.user import db
+
+    app = create_app()
+    # One hash per sign-up is the point of the hasher benchmark, not this one
+    app.config['BCRYPT_ROUNDS'] = args.bcrypt_rounds
+    counter = threading.local()
+    with app.app_context():
+        if not args.background_users:
+            db.drop_all()
+            db.create_all()
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*_):
+            counter.count = getattr(counter, 'count', 0) + 1
+
+    return lambda: InProcessClient(app, counter)
+
+
+def run(args):
+    make_client = (lambda: HttpClient(args.url)) if args.url else in_process_app(args)
+    jwt_secret_key = args.jwt_secret_key or (JWT_SECRET_KEY if not args.url else os.environ['JWT_SECRET_KEY'])
+    rng = random.Random(args.seed)
+    roles, weights = zip(*args.mix.items())
+    users = [VirtualUser(i, rng.choices(roles, weights)[0], random.Random(args.seed * 1000003 + i), jwt_secret_key)
+             for i in range(args.users)]
+    run_id = int(time.time())
+    recorder = Recorder()
+    barrier = threading.Barrier(args.concurrency)
+    failures = []
+
+    def worker(offset):
+        client = make_client()
+        mine = users[offset::args.concurrency]
+        try:
+            for user in mine:
+                if not user.onboard(client, recorder, run_id):
+                    failures.append(user.index)
+            barrier.wait()
+            for _ in range(args.sessions):
+                for user in mine:
+                    if user.user_id is not None:
+                        user.session(client, recorder, args)
+        except threading.BrokenBarrierError:
+            pass
+        except Exception:
+            barrier.abort()
+            raise
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = recorder.summary(time.perf_counter() - started)
+    summary['config'] = {name: value for name, value in vars(args).items() if name not in ('save', 'compare')}
+    if failures:
+        print(f'warning: {len(failures)} users failed to onboard')
+    return summary
+
+
+def report(summary):
+    print(f'{summary["requests"]} requests, {summary["throughput"]:.1f} req/s')
+    print(f'{"endpoint":<44} {"reqs":>6} {"err":>5} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    for label, endpoint in summary['endpoints'].items():
+        queries = '-' if endpoint['queries'] is None else f'{endpoint["queries"]:.2f}'
+        print(f'{label:<44} {endpoint["requests"]:6d} {endpoint["errors"]:5d} {endpoint["p50_ms"]:8.1f} '
+              f'{endpoint["p95_ms"]:8.1f} {endpoint["p99_ms"]:8.1f} {queries:>8}')
+
+
+def compare(summary, baseline, query_tolerance, latency_tolerance):
+    """Print the per-endpoint diff against ``baseline``; returns the regressed endpoints."""
+    regressions = []
+    print(f'\n{"endpoint":<44} {"p95 ms (base -> now)":>24} {"queries (base -> now)":>24}')
+    for label, endpoint in summary['endpoints'].items():
+        base = baseline['endpoints'].get(label)
+        if base is None:
+            print(f'{label:<44} {"(new endpoint)":>24}')
+            continue
+        flags = []
+        if min(endpoint['requests'], base['requests']) >= LATENCY_MIN_SAMPLES and \
+                endpoint['p95_ms'] > base['p95_ms'] * (1 + latency_tolerance):
+            flags.append('p95')
+        if endpoint['queries'] is not None and base['queries'] is not None and \
+                endpoint['queries'] > base['queries'] + query_tolerance:
+            flags.append('queries')
+        queries = '-' if endpoint['queries'] is None or base['queries'] is None else \
+            f'{base["queries"]:.2f} -> {endpoint["queries"]:.2f}'
+        print(f'{label:<44} {base["p95_ms"]:10.1f} -> {endpoint["p95_ms"]:9.1f} {queries:>24}'
+              + (f'   REGRESSED ({", ".join(flags)})' if flags else ''))
+        if flags:
+            regressions.append(label)
+    print(f'throughput {baseline["throughput"]:.1f} -> {summary["throughput"]:.1f} req/s')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='drive a running server instead of the in-process app')
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.join(tempfile.gettempdir(), 'sparko_bench_workload.db'))
+    parser.add_argument('--jwt-secret-key', help="the server's JWT_SECRET_KEY (with --url)")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=3)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('entrepreneur=0.45,investor=0.35,partner=0.2'))
+    parser.add_argument('--like-rate', type=float, default=0.5)
+    parser.add_argument('--super-spark-rate', type=float, default=0.02)
+    parser.add_argument('--background-users', type=int, default=0)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier --save')
+    parser.add_argument('--query-tolerance', type=float, default=0.5, help='allowed increase in queries per request')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25, help='allowed relative p95 increase')
+    args = parser.parse_args()
+
+    summary = run(args)
+    report(summary)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(summary, baseline, args.query_tolerance, args.latency_tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""Query plan check: EXPLAIN every statement the hot endpoints issue and fail on sequential scans.
+
+Usage: python benchmarks/check_query_plans.py --database-url postgresql://... [--users 100000] [--swipes 5000000] [--reuse] [--save plans.json]
+
+Loads the ``dataset.py`` fixture (``--reuse`` plans against one that is
+already loaded), then drives the Flask app in-process through the hot
+paths: a new user signing up, filling in a profile, discovering and
+swiping, and a fixture user with a long match history paging through
+matches, reading, sending and polling messages, and searching. Every SQL
+statement is captured with its parameters and the chain of repo functions
+that issued it, then planned with ``EXPLAIN (FORMAT JSON)`` against the
+fixture's statistics (PostgreSQL only).
+
+It exits 1 when a plan reads a table of at least ``--min-rows`` rows with a
+sequential scan, unless one of the issuing functions is in ``FULL_SCANS``:
+bulk loads that want every row of a role anyway. Sequential scans of
+smaller tables are listed but not gated, as a few pages read in order beat
+an index there. ``--save`` writes every plan as JSON, to diff against a
+known-good run when an access path changes.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import jwt
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import bench_workload
+import dataset
+
+FULL_SCANS = {
+    'scoring.load_matrix': 'the candidate matrix holds every complete profile of a role',
+    'profile_index.build': 'the search index holds every profile',
+    'geo_index.build': 'the spatial index holds every complete profile',
+    'text_index.build': 'the text index holds every profile',
+    'vector_index.build': 'the vector index holds every complete profile',
+    'vector_index.train_model': 'the embedding model trains on a strided sample of all profiles',
+}
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class StatementLog:
+    """The first occurrence of each distinct statement, keyed by normalized SQL and issuing function."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+
+    def capture(self, statement, parameters):
+        origin = []
+        frame = sys._getframe(2)
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if module.startswith('src.'):
+                origin.append(f'{module.rsplit(".", 1)[-1]}.{frame.f_code.co_name}')
+            frame = frame.f_back
+        from src.services.query_stats import normalize_sql
+        key = (normalize_sql(statement), origin[0] if origin else '')
+        with self.lock:
+            self.statements.setdefault(key, (statement, parameters, origin))
+
+
+def plan_scans(plan):
+    """``(node type, relation, index)`` for every scan node in a JSON plan."""
+    scans = []
+    if 'Relation Name' in plan:
+        scans.append((plan['Node Type'], plan['Relation Name'], plan.get('Index Name')))
+    for child in plan.get('Plans', ()):
+        scans.extend(plan_scans(child))
+    return scans
+
+
+def busiest_match_user(connection):
+    """A fixture user with many unlocked matches, one of their conversations, and the role they matched in."""
+    from sqlalchemy import text
+    return connection.execute(text(
+        'SELECT m.user1_id, m.user1_role, m.id FROM "match" m '
+        'JOIN (SELECT user1_id FROM "match" WHERE chat_unlocked GROUP BY user1_id ORDER BY count(*) DESC LIMIT 1) b '
+        'ON b.user1_id = m.user1_id '
+        'WHERE m.chat_unlocked AND EXISTS (SELECT 1 FROM message WHERE match_id = m.id) ORDER BY m.id LIMIT 1'
+    )).first()
+
+
+def fixture_user_journey(client, recorder, user_id, role, match_id):
+    status, payload = recorder.call(client, 'POST /auth/login', 'POST', '/api/auth/login',
+                                    {'email': f'user{user_id}@example.com', 'password': dataset.PASSWORD})
+    assert status == 200, payload
+    auth = {'Authorization': f'Bearer {payload["token"]}'}
+    access_token = jwt.encode({
+        'sub': str(user_id), 'type': 'access', 'fresh': False, 'exp': datetime.utcnow() + timedelta(hours=1)
+    }, bench_workload.JWT_SECRET_KEY, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {access_token}'}
+
+    recorder.call(client, 'POST /profile/switch-role', 'POST', '/api/profile/switch-role', {'role': role}, headers)
+    recorder.call(client, 'GET /profile/profiles', 'GET', '/api/profile/profiles', headers=headers)
+    recorder.call(client, 'GET /profile/profiles/<role>', 'GET', f'/api/profile/profiles/{role}', headers=headers)
+    _, page = recorder.call(client, 'GET /matching/matches', 'GET', '/api/matching/matches', headers=headers)
+    if page.get('next_cursor'):
+        recorder.call(client, 'GET /matching/matches?cursor', 'GET',
+                      f'/api/matching/matches?cursor={page["next_cursor"]}', headers=headers)
+    recorder.call(client, 'GET /matching/matches?sort=activity', 'GET', '/api/matching/matches?sort=activity',
+                  headers=headers)
+    _, cards = recorder.call(client, 'GET /matching/discover', 'GET', '/api/matching/discover', headers=headers)
+    for card in cards.get('profiles', [])[:3]:
+        recorder.call(client, 'POST /matching/swipe', 'POST', '/api/matching/swipe',
+                      {'user_id': card['user_id'], 'action': 'like'}, headers)
+    recorder.call(client, 'GET /matching/search', 'GET', '/api/matching/search?role=investor&industry=Fintech',
+                  headers=headers)
+    recorder.call(client, 'GET /matching/search?within_km', 'GET',
+                  '/api/matching/search?role=investor&within_km=100&timezone_hours=2', headers=headers)
+    recorder.call(client, 'GET /matching/search?q', 'GET', '/api/matching/search?role=investor&q=fintech+seed',
+                  headers=headers)
+    if cards.get('profiles'):
+        recorder.call(client, 'GET /matching/similar/<id>', 'GET',
+                      f'/api/matching/similar/{cards["profiles"][0]["user_id"]}?role={cards["target_role"]}',
+                      headers=headers)
+
+    path = f'/api/chat/matches/{match_id}/messages'
+    _, messages = recorder.call(client, 'GET /chat/matches/<id>/messages', 'GET', path, headers=auth)
+    latest = messages.get('latest_id')
+    recorder.call(client, 'GET /chat/matches/<id>/messages?before_id', 'GET', f'{path}?before_id={latest}', headers=auth)
+    recorder.call(client, 'POST /chat/matches/<id>/messages', 'POST', path, {'content': 'Plan check'}, auth)
+    recorder.call(client, 'GET /chat/matches/<id>/messages?since_id', 'GET', f'{path}?since_id={latest}', headers=auth)
+
+
+def capture(args):
+    from sqlalchemy import event
+
+    os.environ.update(SECRET_KEY=bench_workload.SECRET_KEY, JWT_SECRET_KEY=bench_workload.JWT_SECRET_KEY,
+                      DATABASE_URL=args.database_url)
+    if not args.reuse:
+        print(f'loading {args.users} users / ~{args.swipes} swipes...')
+        dataset.generate(args.database_url, args.users, args.swipes, log=print)
+
+    from flask_app import create_app
+    from src.models.user import db
+
+    app = create_app()
+    app.config['BCRYPT_ROUNDS'] = 4
+    log = StatementLog()
+    counter = threading.local()
+    with app.app_context():
+        with db.engine.connect() as connection:
+            fixture_user = busiest_match_user(connection)
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def capture_statement(conn, cursor, statement, parameters, context, executemany):
+            if not executemany:
+                log.capture(statement, parameters)
+
+    client = bench_workload.InProcessClient(app, counter)
+    recorder = bench_workload.Recorder()
+    journey = argparse.Namespace(like_rate=0.6, super_spark_rate=0.05)
+    newcomer = bench_workload.VirtualUser(0, 'entrepreneur', random.Random(7), bench_workload.JWT_SECRET_KEY)
+    assert newcomer.onboard(client, recorder, f'plans{os.getpid()}'), 'sign-up failed'
+    newcomer.session(client, recorder, journey)
+    if fixture_user is not None:
+        fixture_user_journey(client, recorder, *fixture_user)
+    else:
+        print('warning: the fixture has no conversations; chat queries were not exercised')
+    errors = {label: count for label, count in recorder.errors.items() if count}
+    if errors:
+        print(f'warning: requests failed: {errors}')
+    return app, dict(log.statements)
+
+
+def explain(app, statements, min_rows):
+    from sqlalchemy import text
+    from src.models.user import db
+
+    results, failures = [], []
+    with app.app_context(), db.engine.connect() as connection:
+        rows = dict(connection.execute(text(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        )).all())
+        for (normalized, _), (statement, parameters, origin) in sorted(statements.items(), key=lambda item: item[0][1]):
+            if not statement.lstrip().upper().startswith(EXPLAINABLE):
+                continue
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()[0]['Plan']
+            connection.rollback()
+            scans = plan_scans(plan)
+            allowed = next((FULL_SCANS[name] for name in origin if name in FULL_SCANS), None)
+            gated = [(node, relation) for node, relation, _ in scans
+                     if node == 'Seq Scan' and rows.get(relation, 0) >= min_rows and allowed is None]
+            results.append({'origin': origin, 'sql': normalized, 'scans': scans, 'plan': plan})
+            if gated:
+                failures.append((origin, normalized, gated))
+            mark = 'FAIL' if gated else ' ok '
+            access = ', '.join(f'{relation}: {node}' + (f' ({index})' if index else '') for node, relation, index in scans)
+            print(f'{mark} {" < ".join(origin[:2]) or "(framework)":<55} {access or "no table access"}')
+    return results, failures, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True, help='a PostgreSQL database; its schema is replaced')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--swipes', type=int, default=5000000)
+    parser.add_argument('--reuse', action='store_true', help='plan against the fixture already loaded')
+    parser.add_argument('--min-rows', type=int, default=10000)
+    parser.add_argument('--save', help='write every plan to this JSON file')
+    args = parser.parse_args()
+    if not args.database_url.startswith('postgresql'):
+        parser.error('plans are checked on PostgreSQL only')
+
+    app, statements = capture(args)
+    results, failures, rows = explain(app, statements, args.min_rows)
+    print(f'\n{len(results)} distinct statements planned; table sizes: ' +
+          ', '.join(f'{name} {int(count)}' for name, count in sorted(rows.items()) if count > 0))
+    scan_types = Counter(node for result in results for node, _, _ in result['scans'])
+    print('scan nodes: ' + ', '.join(f'{node} {count}' for node, count in scan_types.most_common()))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+    if failures:
+        print(f'\n{len(failures)} statement(s) scan a large table sequentially:')
+        for origin, normalized, gated in failures:
+            print(f'  {" < ".join(origin) or "(framework)"}: {", ".join(relation for _, relation in gated)}')
+            print(f'    {normalized[:200]}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Read-your-writes check for replica routing against a local primary/replica pair.
+
+Usage: python benchmarks/check_read_your_writes.py [--primary-url postgresql://... --replica-url postgresql://...] [--pairs 20]
+
+Without URLs it runs against a simulated pair: two SQLite files in a
+temporary directory, the replica overwritten from the primary every
+``--copy-interval`` seconds with SQLite's backup API. SQLite has no WAL
+position, so the app is told the replica lags at most ``--max-lag`` seconds.
+
+For PostgreSQL, start a streaming pair whose replica applies WAL late, so
+the lag is long enough to observe::
+
+    initdb -D /tmp/primary && pg_ctl -D /tmp/primary -o '-p 5432' -l /tmp/primary.log start
+    createdb -p 5432 sparko
+    pg_basebackup -p 5432 -D /tmp/replica -R
+    echo "recovery_min_apply_delay = '500ms'" >> /tmp/replica/postgresql.auto.conf
+    pg_ctl -D /tmp/replica -o '-p 5433' -l /tmp/replica.log start
+
+and pass ``--primary-url postgresql://localhost:5432/sparko
+--replica-url postgresql://localhost:5433/sparko``. The primary's schema
+is dropped and recreated.
+
+The Flask app runs in-process. ``--pairs`` entrepreneur/investor pairs sign
+up and the replica is given time to catch up. Then each pair likes each
+other, and the second swiper immediately reads /matches, unlocks the chat,
+sends a message and reads the conversation. Every request carries the
+swiper's latest ``X-Consistency-Token``. After each token-carrying read, the
+same read is repeated without a token, counting how often the replica
+alone would have been stale.
+
+It exits 1 when a read that carried a token missed the swiper's own match
+or message, or when no read was served by the replica at all.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import bench_workload
+
+SETTLE_TIMEOUT = 30
+
+
+class Client:
+    """Flask test client for one user; remembers and sends back its consistency token."""
+
+    def __init__(self, app, header, send_tokens=True):
+        self.client = app.test_client()
+        self.header = header
+        self.send_tokens = send_tokens
+        self.token = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.send_tokens and self.token:
+            headers[self.header] = self.token
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        self.token = response.headers.get(self.header, self.token)
+        return response.status_code, response.get_json(silent=True), None
+
+
+def copy_sqlite(primary_path, replica_path, interval, stop):
+    """Overwrite the replica from the primary every ``interval`` seconds until ``stop`` is set."""
+    while not stop.wait(interval):
+        source = sqlite3.connect(primary_path, timeout=5)
+        target = sqlite3.connect(replica_path, timeout=5)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+
+def settle(app):
+    """Wait until a replica has everything the primary has committed so far."""
+    from src.models.user import db
+    from src.services import db_routing
+
+    router = app.extensions['db_routing']
+    with app.app_context():
+        if router.replicas.kind == 'lsn':
+            with db.engine.connect() as connection:
+                token = db_routing.primary_position(connection)
+        else:
+            token = int(time.time() * 1000)
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        while router.replicas.choose(token, router.probe) is None:
+            if time.monotonic() > deadline:
+                raise SystemExit('replica did not catch up; is replication running?')
+            time.sleep(0.05)
+
+
+def run(args):
+    stop = threading.Event()
+    if args.primary_url:
+        primary_url, replica_url = args.primary_url, args.replica_url
+    else:
+        directory = tempfile.mkdtemp(prefix='sparko_replica_pair_')
+        primary_path, replica_path = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+        primary_url, replica_url = f'sqlite:///{primary_path}', f'sqlite:///{replica_path}'
+        sqlite3.connect(primary_path).close()
+        sqlite3.connect(replica_path).close()
+
+    os.environ.update(
+        SECRET_KEY=bench_workload.SECRET_KEY, JWT_SECRET_KEY=bench_workload.JWT_SECRET_KEY,
+        DATABASE_URL=primary_url, DATABASE_REPLICA_URLS=replica_url, DB_REPLICA_MAX_LAG=str(args.max_lag)
+    )
+    from flask_app import create_app
+    from src.models.user import db
+    from src.services import db_routing
+
+    app = create_app()
+    app.config['BCRYPT_ROUNDS'] = args.bcrypt_rounds
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    if not args.primary_url:
+        threading.Thread(target=copy_sqlite, args=(primary_path, replica_path, args.copy_interval, stop),
+                         daemon=True).start()
+
+    rng = random.Random(args.seed)
+    recorder = bench_workload.Recorder()
+    run_id = int(time.time())
+    pairs = []
+    for index in range(args.pairs):
+        pair = []
+        for offset, role in enumerate(('entrepreneur', 'investor')):
+            user = bench_workload.VirtualUser(2 * index + offset, role, random.Random(rng.random()),
+                                              bench_workload.JWT_SECRET_KEY)
+            client = Client(app, db_routing.HEADER)
+            if not user.onboard(client, recorder, run_id):
+                raise SystemExit(f'user {user.index} failed to onboard')
+            pair.append((user, client))
+        pairs.append(pair)
+    print(f'{2 * args.pairs} users signed up; waiting for the replica...')
+    settle(app)
+
+    stale_with_token = []
+    stale_without_token = 0
+    reads = 0
+    for (first, first_client), (second, second_client) in pairs:
+        tokenless = Client(app, db_routing.HEADER, send_tokens=False)
+        recorder.call(first_client, 'POST /matching/swipe', 'POST', '/api/matching/swipe',
+                      {'user_id': second.user_id, 'action': 'like'}, first.jwt)
+        status, swipe = recorder.call(second_client, 'POST /matching/swipe', 'POST', '/api/matching/swipe',
+                                      {'user_id': first.user_id, 'action': 'like'}, second.jwt)
+        match_id = swipe.get('match_id')
+        if status != 200 or match_id is None:
+            raise SystemExit(f'expected a match, got {status} {swipe}')
+
+        def has_match(client):
+            _, page = recorder.call(client, 'GET /matching/matches', 'GET', '/api/matching/matches',
+                                    headers=second.jwt)
+            return any(card['match_id'] == match_id for card in page.get('matches', []))
+
+        recorder.call(second_client, 'POST /chat/matches/<id>/unlock', 'POST',
+                      f'/api/chat/matches/{match_id}/unlock', headers=second.auth)
+        _, sent = recorder.call(second_client, 'POST /chat/matches/<id>/messages', 'POST',
+                                f'/api/chat/matches/{match_id}/messages', {'content': 'Read-your-writes check'},
+                                second.auth)
+        message_id = sent.get('data', {}).get('id')
+
+        def has_message(client):
+            _, page = recorder.call(client, 'GET /chat/matches/<id>/messages', 'GET',
+                                    f'/api/chat/matches/{match_id}/messages', headers=second.auth)
+            return any(message['id'] == message_id for message in page.get('messages', []))
+
+        for name, check in (('matches', has_match), ('messages', has_message)):
+            reads += 1
+            if not check(second_client):
+                stale_with_token.append((name, match_id))
+            if not check(tokenless):
+                stale_without_token += 1
+
+    stop.set()
+    stats = db_routing.get_replica_set().stats()
+    print(f'{reads} reads with a token, {len(stale_with_token)} stale')
+    print(f'{reads} reads without a token, {stale_without_token} stale')
+    print(f'replica reads {stats["replica_reads"]}, primary fallbacks {stats["primary_fallbacks"]}, '
+          f'probes {stats["probes"]}, tokens issued {stats["tokens_issued"]}')
+    if not stale_without_token:
+        print('warning: the replica never lagged, so the token reads proved little; raise the apply delay')
+    for name, match_id in stale_with_token:
+        print(f'STALE: {name} of match {match_id} read with the writer\'s token')
+    return not stale_with_token and stats['replica_reads'] > 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--primary-url', help='primary of a running PostgreSQL pair')
+    parser.add_argument('--replica-url', help='its streaming replica')
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--copy-interval', type=float, default=0.5, help='simulated pair: seconds between copies')
+    parser.add_argument('--max-lag', type=float, default=2.0, help='DB_REPLICA_MAX_LAG for non-PostgreSQL pairs')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    if bool(args.primary_url) != bool(args.replica_url):
+        parser.error('--primary-url and --replica-url go together')
+
+    sys.exit(0 if run(args) else 1)
+
+
+if __name__ == '__main__':
+    main()
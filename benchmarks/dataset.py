@@ -0,0 +1,372 @@
+"""Deterministic synthetic dataset for benchmarks: users, role profiles, swipes and matches.
+
+Usage: python benchmarks/dataset.py --database-url postgresql://... [--users 1000000] [--swipes 100000000] [--seed 7]
+
+Replaces the schema at ``--database-url`` with ``--users`` users, one profile
+for each user's current role (plus a second role for some), about
+``--swipes`` swipes, the matches those swipes imply and their messages. The same arguments
+always produce the same rows. Every user's password is ``password123``,
+hashed once up front. Benchmarks call ``generate()`` so they all run against
+the same fixture.
+
+Rows are produced in chunks of ``CHUNK_ROWS`` and written as they are made,
+so memory stays flat however large the dataset. PostgreSQL loads through
+``COPY``, skipping foreign-key triggers when the role is a superuser.
+Other databases use multi-row inserts. The profile, swipe, match and
+message indexes are dropped for the load and rebuilt once at the end.
+
+The shape of the data:
+
+* swipe activity per user follows a power law (``ACTIVITY_ALPHA``): most
+  users swipe a little, a few swipe a lot;
+* how often a user is swiped also follows a power law
+  (``POPULARITY_EXPONENT``), and popular users get liked more;
+* the swiped user swipes back on some of the people who liked them
+  (``REPLY_RATE``), and a like coming back on a like is a match;
+* an unlocked match holds a geometrically distributed number of messages
+  averaging ``MESSAGES_PER_MATCH``, from either side at random.
+
+Each unordered pair of users is assigned to one side by a hash, and only
+that side picks it as an initial swipe. So no pair is swiped twice in the
+same direction, and every mutual like gets its match, without keeping any
+per-pair state.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import numpy as np
+from sqlalchemy import create_engine, insert, text
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'password123'
+CHUNK_ROWS = 50000
+
+ROLES = ['entrepreneur', 'investor', 'partner']
+ROLE_SHARES = [0.5, 0.2, 0.3]
+TARGET_ROLE_INDEX = [1, 0, 2]
+SECOND_PROFILE_RATE = 0.15
+INCOMPLETE_PROFILE_RATE = 0.1
+
+ACTIVITY_ALPHA = 1.6
+POPULARITY_EXPONENT = 0.8
+BASE_LIKE_RATE = 0.2
+POPULAR_LIKE_BONUS = 0.4
+SUPER_SPARK_SHARE = 0.02
+REPLY_RATE = 0.5
+MESSAGES_PER_MATCH = 4
+HISTORY_DAYS = 180
+
+FIRST_NAMES = ['Sarah', 'David', 'Emily', 'Michael', 'Lisa', 'Alex', 'Jennifer', 'Ryan', 'Priya', 'Wei',
+               'Carlos', 'Aisha', 'Tom', 'Yuki', 'Omar', 'Hannah', 'Diego', 'Mei', 'Noah', 'Fatima']
+LAST_NAMES = ['Chen', 'Kim', 'Rodriguez', 'Zhang', 'Johnson', 'Thompson', 'Lee', 'Patel', 'Garcia', 'Nguyen',
+              'Smith', 'Okafor', 'Silva', 'Tanaka', 'Haddad', 'Novak', 'Rossi', 'Cohen', 'Kowalski', 'Singh']
+LOCATIONS = ['San Francisco, CA', 'New York, NY', 'Austin, TX', 'Seattle, WA', 'Boston, MA', 'Los Angeles, CA',
+             'Palo Alto, CA', 'Chicago, IL', 'Miami, FL', 'Denver, CO', 'London, UK', 'Berlin, Germany',
+             'Singapore', 'Toronto, Canada', 'Taipei, Taiwan', 'Bangalore, India']
+INDUSTRIES = ['Fintech', 'AI', 'SaaS', 'Healthcare', 'Climate', 'E-commerce', 'Biotech', 'EdTech']
+STAGES = ['Pre-seed', 'Seed', 'Series A', 'Series B']
+SKILLS = ['Machine Learning', 'Product Strategy', 'Team Leadership', 'Venture Capital', 'Due Diligence',
+          'React', 'Node.js', 'AWS', 'UI/UX Design', 'Sales', 'Marketing', 'Regulatory Affairs',
+          'Financial Analysis', 'Hardware Engineering', 'Partnerships', 'Growth']
+TITLES = {
+    'entrepreneur': ['Founder & CEO', 'Co-Founder & CTO', 'Solo Founder', 'Co-Founder & COO'],
+    'investor': ['Angel Investor', 'Managing Partner', 'Principal', 'Venture Partner'],
+    'partner': ['Full-Stack Developer', 'Product Designer', 'Growth Marketer', 'Business Development Lead']
+}
+MESSAGES = ['Hi! Great to match with you.', 'Would love to hear more about what you are building.',
+            'Are you free for a call next week?', 'Thanks, sending over our deck now.',
+            'What stage are you focused on at the moment?', 'Sounds good, talk soon.']
+SWIPE_COLUMNS = ['swiper_id', 'swiped_id', 'swiper_role', 'swiped_role', 'action', 'created_at']
+MATCH_COLUMNS = ['id', 'user1_id', 'user2_id', 'user1_role', 'user2_role', 'chat_unlocked', 'created_at']
+MESSAGE_COLUMNS = ['match_id', 'sender_id', 'content', 'created_at']
+ROLE_FIELDS = ['project_description', 'funding_stage', 'funding_amount', 'team_size', 'investment_range',
+               'professional_background', 'past_investments', 'availability', 'desired_role', 'equity_expectation']
+
+
+def password_hash():
+    from src.services.password_hasher import DEFAULT_ROUNDS
+    return bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(DEFAULT_ROUNDS)).decode()
+
+
+def assign_roles(rng, users):
+    """Current role index per user id (index 0 unused)."""
+    return np.concatenate([[0], rng.choice(len(ROLES), size=users, p=ROLE_SHARES)]).astype(np.int8)
+
+
+def _times_before(rng, now, size):
+    """``size`` random datetimes in the ``HISTORY_DAYS`` before ``now``."""
+    seconds = (rng.random(size) * HISTORY_DAYS * 86400).astype('timedelta64[s]')
+    return (np.datetime64(now, 's') - seconds).astype(datetime).tolist()
+
+
+def _pick(rng, options, size):
+    return np.asarray(options, dtype=object)[rng.integers(0, len(options), size)]
+
+
+def user_chunks(rng, roles, hashed, now):
+    users = len(roles) - 1
+    for start in range(1, users + 1, CHUNK_ROWS):
+        ids = np.arange(start, min(start + CHUNK_ROWS, users + 1))
+        first, last = _pick(rng, FIRST_NAMES, len(ids)), _pick(rng, LAST_NAMES, len(ids))
+        ages = rng.integers(22, 65, len(ids))
+        locations = _pick(rng, LOCATIONS, len(ids))
+        created = _times_before(rng, now, len(ids))
+        yield [
+            {'id': int(i), 'email': f'user{i}@example.com', 'password_hash': hashed, 'name': f'{f} {l}',
+             'age': int(a), 'location': loc, 'current_role': ROLES[roles[i]], 'super_spark_count': 3,
+             'super_spark_reset_date': now, 'created_at': c, 'updated_at': c}
+            for i, f, l, a, loc, c in zip(ids, first, last, ages, locations, created)
+        ]
+
+
+def _profile(rng, user_id, role, now):
+    skills = json.dumps(list(_pick(rng, SKILLS, 3)))
+    industry = INDUSTRIES[rng.integers(len(INDUSTRIES))]
+    row = dict.fromkeys(ROLE_FIELDS)
+    row.update({
+        'user_id': user_id, 'role': role, 'title': TITLES[role][rng.integers(4)],
+        'company': f'{LAST_NAMES[rng.integers(len(LAST_NAMES))]} {industry} Labs',
+        'tagline': f'Building the future of {industry.lower()}',
+        'bio': f'{industry} operator with {rng.integers(2, 20)} years of experience. Previously founded and scaled teams.',
+        'skills': skills, 'industry': industry, 'created_at': now, 'updated_at': now
+    })
+    if role == 'entrepreneur':
+        row.update(project_description=f'We help small businesses adopt {industry.lower()} tools.',
+                   funding_stage=STAGES[rng.integers(len(STAGES))], funding_amount='$500K - $2M', team_size='2-10')
+    elif role == 'investor':
+        row.update(investment_range='$100K - $1M', professional_background='Former operator turned investor.',
+                   past_investments=f'{rng.integers(1, 40)} early-stage {industry.lower()} companies')
+    else:
+        row.update(availability='Full-time', desired_role='Technical co-founder', equity_expectation='1-5%')
+    if rng.random() < INCOMPLETE_PROFILE_RATE:
+        row['bio'] = None
+        row.update(is_complete=False, completion_percentage=80)
+    else:
+        row.update(is_complete=True, completion_percentage=100)
+    return row
+
+
+def profile_chunks(rng, roles, now):
+    users = len(roles) - 1
+    for start in range(1, users + 1, CHUNK_ROWS):
+        rows = []
+        for user_id in range(start, min(start + CHUNK_ROWS, users + 1)):
+            role = int(roles[user_id])
+            rows.append(_profile(rng, user_id, ROLES[role], now))
+            if rng.random() < SECOND_PROFILE_RATE:
+                rows.append(_profile(rng, user_id, ROLES[(role + 1 + rng.integers(2)) % 3], now))
+        yield rows
+
+
+def _owns(swiper, candidates):
+    """Which side of each unordered pair may open it, decided by a hash of the pair."""
+    low, high = np.minimum(swiper, candidates).astype(np.uint64), np.maximum(swiper, candidates).astype(np.uint64)
+    mixed = (low * np.uint64(0x9E3779B97F4A7C15)) ^ (high * np.uint64(0xC2B2AE3D27D4EB4F))
+    first_side = ((mixed >> np.uint64(29)) & np.uint64(1)).astype(bool)
+    return first_side == (swiper < candidates)
+
+
+def _messages(rng, match_id, pair, matched_at, now):
+    count = rng.geometric(1 / (MESSAGES_PER_MATCH + 1)) - 1
+    if not count:
+        return []
+    senders = np.asarray(pair)[rng.integers(0, 2, count)].tolist()
+    offsets = np.sort(rng.random(count) * 14 * 86400).astype('timedelta64[s]').astype(timedelta).tolist()
+    texts = _pick(rng, MESSAGES, count).tolist()
+    return [(match_id, sender, content, min(matched_at + offset, now))
+            for sender, content, offset in zip(senders, texts, offsets)]
+
+
+def swipe_chunks(rng, roles, swipes, now):
+    """Chunks of ``(swipe_rows, match_rows, message_rows)``, tuples in ``*_COLUMNS`` order; about ``swipes`` swipes in total.
+
+    Match ids are assigned here, from 1, so messages can refer to them; the
+    match table must start out empty.
+    """
+    users = len(roles) - 1
+    by_role = [np.flatnonzero(roles[1:] == r) + 1 for r in range(len(ROLES))]
+    # Popularity: a power law over a random ranking within each role
+    popularity = np.zeros(users + 1)
+    cdf = []
+    for members in by_role:
+        weights = (rng.permutation(len(members)) + 1.0) ** -POPULARITY_EXPONENT
+        popularity[members] = weights / weights.max()
+        cdf.append(np.cumsum(weights) / weights.sum())
+
+    # Initial swipes per user; replies roughly add REPLY_RATE on top
+    activity = rng.pareto(ACTIVITY_ALPHA, users + 1) + 1
+    activity[0] = 0
+    opened = swipes / (1 + REPLY_RATE)
+    reachable = np.array([len(by_role[TARGET_ROLE_INDEX[r]]) // 2 for r in range(len(ROLES))])[roles]
+    activity = np.minimum(np.round(activity * opened / activity.sum()), reachable).astype(np.int64)
+
+    swipe_rows, match_rows, message_rows = [], [], []
+    match_id = 0
+    for swiper in range(1, users + 1):
+        count = activity[swiper]
+        if count == 0:
+            continue
+        role = roles[swiper]
+        target = TARGET_ROLE_INDEX[role]
+        # Oversample: about half the picks belong to the other side, some repeat
+        picks = by_role[target][np.searchsorted(cdf[target], rng.random(count * 3))]
+        picks = picks[(picks != swiper)]
+        picks = picks[_owns(swiper, picks)]
+        picks = picks[np.sort(np.unique(picks, return_index=True)[1])][:count]
+        if not len(picks):
+            continue
+
+        liked = rng.random(len(picks)) < BASE_LIKE_RATE + POPULAR_LIKE_BONUS * popularity[picks]
+        spark = liked & (rng.random(len(picks)) < SUPER_SPARK_SHARE)
+        replied = rng.random(len(picks)) < REPLY_RATE
+        liked_back = rng.random(len(picks)) < BASE_LIKE_RATE + POPULAR_LIKE_BONUS * popularity[swiper] + 0.2 * liked
+        times = _times_before(rng, now, len(picks))
+        reply_delay = (rng.random(len(picks)) * 72 * 3600).astype('timedelta64[s]').astype(timedelta).tolist()
+
+        swiper_role, target_role = ROLES[role], ROLES[target]
+        for other, like, super_spark, reply, like_back, at, delay in zip(
+                picks.tolist(), liked.tolist(), spark.tolist(), replied.tolist(), liked_back.tolist(), times, reply_delay):
+            action = 'super_spark' if super_spark else 'like' if like else 'skip'
+            swipe_rows.append((swiper, other, swiper_role, target_role, action, at))
+            if not reply:
+                continue
+            replied_at = min(at + delay, now)
+            swipe_rows.append((other, swiper, target_role, swiper_role, 'like' if like_back else 'skip', replied_at))
+            if like and like_back:
+                first = swiper < other
+                match_id += 1
+                unlocked = bool(rng.random() < 0.5)
+                match_rows.append((
+                    match_id, min(swiper, other), max(swiper, other),
+                    swiper_role if first else target_role, target_role if first else swiper_role,
+                    unlocked, replied_at
+                ))
+                if unlocked:
+                    message_rows.extend(_messages(rng, match_id, (swiper, other), replied_at, now))
+        if len(swipe_rows) >= CHUNK_ROWS:
+            yield swipe_rows, match_rows, message_rows
+            swipe_rows, match_rows, message_rows = [], [], []
+    if swipe_rows or match_rows:
+        yield swipe_rows, match_rows, message_rows
+
+
+def _skip_foreign_key_checks(connection):
+    """Generated ids are valid by construction, so skip the per-row FK triggers where allowed."""
+    if connection.dialect.name == 'postgresql' and \
+            connection.execute(text("SELECT current_setting('is_superuser')")).scalar() == 'on':
+        connection.execute(text('SET LOCAL session_replication_role = replica'))
+
+
+def _copy(connection, table, rows, columns=None):
+    """``COPY ... FROM STDIN`` on PostgreSQL, a multi-row insert elsewhere.
+
+    ``rows`` are dicts, or tuples in the order of ``columns``.
+    """
+    if not rows:
+        return
+    if columns is None:
+        columns = list(rows[0])
+        rows = [tuple(row[c] for c in columns) for row in rows]
+    if connection.dialect.name != 'postgresql':
+        connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+        return
+    # In CSV format an unquoted empty field is NULL, which is how csv writes None
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    column_list = ', '.join(f'"{c}"' for c in columns)
+    cursor = connection.connection.dbapi_connection.cursor()
+    cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def generate(database_url, users=10000, swipes=1000000, seed=7, log=print):
+    """Replace the schema at ``database_url`` with the synthetic dataset; returns row counts."""
+    from flask_app import create_app
+    from src.models.user import db, User, UserProfile, Swipe, Match, Message
+
+    # Importing the app registers every model and index on the metadata
+    os.environ.setdefault('SECRET_KEY', 'dataset')
+    os.environ.setdefault('JWT_SECRET_KEY', 'dataset')
+    os.environ['DATABASE_URL'] = database_url
+    create_app()
+
+    rng = np.random.default_rng(seed)
+    now = datetime(2026, 1, 1)
+    engine = create_engine(database_url)
+    metadata = db.metadata
+    deferred = [index for model in (UserProfile, Swipe, Match, Message) for index in model.__table__.indexes]
+    counts = {'users': 0, 'profiles': 0, 'swipes': 0, 'matches': 0, 'messages': 0}
+    started = time.perf_counter()
+
+    with engine.begin() as connection:
+        metadata.drop_all(connection)
+        metadata.create_all(connection)
+        for index in deferred:
+            index.drop(connection)
+
+    roles = assign_roles(rng, users)
+    hashed = password_hash()
+    stages = [
+        ('users', User.__table__, user_chunks(rng, roles, hashed, now)),
+        ('profiles', UserProfile.__table__, profile_chunks(rng, roles, now)),
+    ]
+    for name, table, chunks in stages:
+        with engine.begin() as connection:
+            _skip_foreign_key_checks(connection)
+            for rows in chunks:
+                _copy(connection, table, rows)
+                counts[name] += len(rows)
+        log(f'  {name}: {counts[name]} rows, {time.perf_counter() - started:.0f}s')
+
+    with engine.begin() as connection:
+        _skip_foreign_key_checks(connection)
+        for swipe_rows, match_rows, message_rows in swipe_chunks(rng, roles, swipes, now):
+            _copy(connection, Swipe.__table__, swipe_rows, SWIPE_COLUMNS)
+            _copy(connection, Match.__table__, match_rows, MATCH_COLUMNS)
+            _copy(connection, Message.__table__, message_rows, MESSAGE_COLUMNS)
+            counts['swipes'] += len(swipe_rows)
+            counts['matches'] += len(match_rows)
+            counts['messages'] += len(message_rows)
+    log(f'  swipes: {counts["swipes"]} rows, matches: {counts["matches"]} rows, '
+        f'messages: {counts["messages"]} rows, {time.perf_counter() - started:.0f}s')
+
+    with engine.begin() as connection:
+        for index in deferred:
+            index.create(connection)
+        if connection.dialect.name == 'postgresql':
+            # Explicit user and match ids bypassed the sequences
+            for table in ('"user"', '"match"'):
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+            connection.execute(text('ANALYZE'))
+    log(f'  indexes: {time.perf_counter() - started:.0f}s')
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', default='sqlite:///' + os.path.join(ROOT, 'benchmark.db'))
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--swipes', type=int, default=100000000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f'generating {args.users} users / ~{args.swipes} swipes (seed {args.seed})...')
+    started = time.perf_counter()
+    counts = generate(args.database_url, args.users, args.swipes, args.seed)
+    print(f'done in {time.perf_counter() - started:.0f}s: ' + ', '.join(f'{v} {k}' for k, v in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
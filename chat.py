@@ -1,50 +1,110 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from src.models.user import db, User, Match, Message
 from src.routes.auth import token_required
+from src.services import db_routing, match_cards, realtime, serializers
+from sqlalchemy import select
 
 chat_bp = Blueprint('chat', __name__)
 
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+ix_message_match_id = db.Index('ix_message_match_id', Message.match_id, Message.id)
+
+def conversation_statement(match_id, user_id):
+    """The match and its last message id, only if user_id is a participant"""
+    return select(Match, match_cards.MatchActivity.last_message_id).outerjoin(
+        match_cards.MatchActivity, match_cards.MatchActivity.match_id == Match.id
+    ).where(
+        Match.id == match_id,
+        (Match.user1_id == user_id) | (Match.user2_id == user_id)
+    )
+
+def messages_etag(match, user_id, last_message_id, since_id, before_id, limit, fields):
+    return f'{match.id}-{user_id}-{last_message_id or 0}-{int(bool(match.chat_unlocked))}-{since_id}-{before_id}-{limit}-{fields or ""}'
+
+def messages_statement(match_id, since_id, before_id, limit):
+    """One page plus a look-ahead row, served from the (match_id, id) index"""
+    statement = select(Message).where(Message.match_id == match_id)
+    if since_id is not None:
+        return statement.where(Message.id > since_id).order_by(Message.id.asc()).limit(limit + 1)
+    if before_id is not None:
+        statement = statement.where(Message.id < before_id)
+    return statement.order_by(Message.id.desc()).limit(limit + 1)
+
+def messages_page(messages, since_id, limit):
+    """Trim the look-ahead row and return (oldest-first messages, has_more)"""
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return (messages if since_id is not None else messages[::-1]), has_more
+
 @chat_bp.route('/matches/<int:match_id>/messages', methods=['GET'])
+@db_routing.replica_reads
 @token_required
 def get_messages(current_user, match_id):
+    """Page through a conversation.
+    
+    ?since_id=N returns messages newer than N (polling), ?before_id=N returns
+    the page older than N (scrollback), neither returns the latest page.
+    Polls carry an ETag derived from the last message id, so an unchanged
+    conversation answers 304 without reading any messages.
+    """
     try:
+        since_id = request.args.get('since_id', type=int)
+        before_id = request.args.get('before_id', type=int)
+        limit = min(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), MAX_MESSAGE_PAGE_SIZE)
+        
+        if limit < 1 or (since_id is not None and before_id is not None):
+            return jsonify({'message': 'Invalid since_id, before_id or limit'}), 400
+        
+        try:
+            serializer = serializers.MESSAGE.only(serializers.requested_fields())
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         # Verify user is part of this match
-        match = Match.query.filter(
-            Match.id == match_id,
-            (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id)
-        ).first()
+        row = db.session.execute(conversation_statement(match_id, current_user.id)).first()
         
-        if not match:
+        if not row:
             return jsonify({'message': 'Match not found or access denied'}), 404
         
-        # Get messages
-        messages = Message.query.filter_by(match_id=match_id).order_by(Message.created_at.asc()).all()
+        match, last_message_id = row
+        etag = messages_etag(match, current_user.id, last_message_id, since_id, before_id, limit, request.args.get('fields'))
+        if serializers.representation_etag(etag) in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(serializers.representation_etag(etag))
+            response.vary.update(('Accept', 'Accept-Encoding'))
+            return response
         
-        message_data = []
-        for msg in messages:
-            message_data.append({
-                'id': msg.id,
-                'content': msg.content,
-                'sender_id': msg.sender_id,
-                'is_from_me': msg.sender_id == current_user.id,
-                'created_at': msg.created_at.isoformat()
-            })
+        messages = db.session.scalars(messages_statement(match_id, since_id, before_id, limit)).all()
+        messages, has_more = messages_page(messages, since_id, limit)
         
-        # Get other user info
-        other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
-        other_user = User.query.get(other_user_id)
+        message_data = serializer.many(messages, viewer_id=current_user.id)
         
-        return jsonify({
+        if messages and before_id is None:
+            match_cards.mark_read(match_id, current_user.id, messages[-1].id)
+            db.session.commit()
+        
+        response_data = {
             'messages': message_data,
+            'has_more': has_more,
+            'latest_id': messages[-1].id if messages else since_id,
             'match': {
                 'id': match.id,
-                'other_user': other_user.to_dict(),
                 'created_at': match.created_at.isoformat(),
                 'chat_unlocked': match.chat_unlocked
             }
-        }), 200
+        }
+        
+        # Pollers already have the other user from their first load
+        if since_id is None and before_id is None:
+            other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
+            response_data['match']['other_user'] = serializers.PUBLIC_USER(db.session.get(User, other_user_id))
+        
+        return serializers.render(response_data, etag=etag)
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': f'Failed to get messages: {str(e)}'}), 500
 
 @chat_bp.route('/matches/<int:match_id>/messages', methods=['POST'])
@@ -77,18 +137,24 @@ def send_message(current_user, match_id):
         )
         
         db.session.add(message)
+        db.session.flush()
+        match_cards.record_message(message)
         db.session.commit()
         
-        return jsonify({
+        message_data = {
+            'id': message.id,
+            'match_id': match_id,
+            'content': message.content,
+            'sender_id': message.sender_id,
+            'created_at': message.created_at.isoformat()
+        }
+        other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
+        realtime.publish_to_users([other_user_id], 'message', dict(message_data, is_from_me=False))
+        
+        return serializers.render({
             'message': 'Message sent successfully',
-            'data': {
-                'id': message.id,
-                'content': message.content,
-                'sender_id': message.sender_id,
-                'is_from_me': True,
-                'created_at': message.created_at.isoformat()
-            }
-        }), 201
+            'data': dict(message_data, is_from_me=True)
+        }, 201)
         
     except Exception as e:
         db.session.rollback()
@@ -111,6 +177,7 @@ def unlock_chat(current_user, match_id):
         # For now, unlock immediately (in production, add premium checks)
         match.chat_unlocked = True
         db.session.commit()
+        realtime.publish_to_users([match.user1_id, match.user2_id], 'chat_unlocked', {'match_id': match.id})
         
         return jsonify({
             'message': 'Chat unlocked successfully',
@@ -0,0 +1,385 @@
+"""Read-replica routing with read-your-writes consistency tokens.
+
+Views marked ``@replica_reads`` (and the async routes that depend on
+``async_db.get_read_session``) read from a replica listed in
+``DATABASE_REPLICA_URLS``. Every other request, every write, and every read
+in a request after its first write goes to the primary. Without replicas
+configured everything stays on the primary.
+
+A response to a request that committed a write carries an
+``X-Consistency-Token`` header naming the primary's position after the
+commit. A client sends its latest token back on every request, and a read
+is only served by a replica that has caught up to it, otherwise by the
+primary. So a client's own follow-up reads (/matches right after a matching
+swipe) never see stale data.
+
+Positions are WAL locations on PostgreSQL: ``pg_current_wal_insert_lsn()``
+on the primary, ``pg_last_wal_replay_lsn()`` on a replica, probed when a
+token is newer than the replica's last known position. Other databases have
+no position to compare, so their tokens hold the commit time and a replica
+is trusted for it ``DB_REPLICA_MAX_LAG`` seconds later. Reads without a
+token take any replica that answered a probe in the last
+``DB_REPLICA_CHECK_INTERVAL`` seconds, and one that fails a probe is
+skipped for ``DB_REPLICA_RETRY`` seconds.
+
+A ``@replica_reads`` view that reads a row in order to write it (the
+discovery queue refill, read markers) does that read under ``primary()``.
+"""
+import functools
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
+
+from src.services import metrics
+
+HEADER = 'X-Consistency-Token'
+DEFAULT_MAX_LAG = 2.0
+DEFAULT_CHECK_INTERVAL = 1.0
+DEFAULT_RETRY = 5.0
+
+PRIMARY_POSITION_SQL = text('SELECT pg_current_wal_insert_lsn()::text')
+# A standby that was promoted (or a primary listed as a replica) has no replay position
+REPLICA_POSITION_SQL = text('SELECT COALESCE(pg_last_wal_replay_lsn(), pg_current_wal_lsn())::text')
+
+
+def replica_urls():
+    return [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+def parse_lsn(value):
+    """``'16/B374D848'`` -> ``0x16B374D848``."""
+    high, low = value.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def primary_position(connection):
+    return parse_lsn(connection.scalar(PRIMARY_POSITION_SQL))
+
+
+def replica_position(connection):
+    """The replica's replayed WAL position on PostgreSQL; elsewhere just a liveness check."""
+    if connection.dialect.name == 'postgresql':
+        return parse_lsn(connection.scalar(REPLICA_POSITION_SQL))
+    connection.scalar(text('SELECT 1'))
+    return None
+
+
+class RequestRouting:
+    __slots__ = ('token', 'read_only', 'pinned', 'wrote', 'replica')
+
+    def __init__(self, token=None):
+        self.token = token
+        self.read_only = False
+        self.pinned = False
+        self.wrote = False
+        self.replica = None
+
+
+class Replica:
+    __slots__ = ('url', 'position', 'checked_at', 'down_until')
+
+    def __init__(self, url):
+        self.url = url
+        self.position = None
+        self.checked_at = float('-inf')
+        self.down_until = 0.0
+
+
+class ReplicaSet:
+    """The configured replicas and what is known of their replay positions.
+
+    ``choose`` returns the index of a replica that can serve a read for a
+    token, probing replicas whose last known position is behind it;
+    engines are kept by the callers, in the same order, as the Flask side
+    and the async side each need their own.
+    """
+
+    def __init__(self, urls, max_lag=DEFAULT_MAX_LAG, check_interval=DEFAULT_CHECK_INTERVAL, retry=DEFAULT_RETRY):
+        self.replicas = [Replica(url) for url in urls]
+        backends = {make_url(url).get_backend_name() for url in urls}
+        self.kind = 'lsn' if backends == {'postgresql'} else 'time'
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry = retry
+        self._turn = itertools.count()
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+        self.probes = 0
+        self.probe_failures = 0
+        self.tokens_issued = 0
+
+    def token(self, position=None):
+        """A token for the primary's current state; ``position`` is its WAL position for ``lsn`` tokens."""
+        self.tokens_issued += 1
+        return f'lsn.{position}' if self.kind == 'lsn' else f'time.{int(time.time() * 1000)}'
+
+    def parse_token(self, value):
+        """The position a client token asks for, or None for no, malformed or foreign tokens."""
+        kind, _, position = (value or '').partition('.')
+        if kind != self.kind or not position.isdigit():
+            return None
+        return int(position)
+
+    def _rotation(self):
+        start = next(self._turn)
+        count = len(self.replicas)
+        return [(start + offset) % count for offset in range(count)]
+
+    def _covers(self, replica, token, now):
+        if token is None:
+            return now - replica.checked_at < self.check_interval
+        if self.kind == 'time':
+            return time.time() * 1000 - self.max_lag * 1000 >= token and now - replica.checked_at < self.check_interval
+        return replica.position is not None and replica.position >= token
+
+    def _observed(self, replica, position, now):
+        replica.position = position
+        replica.checked_at = now
+
+    def _failed(self, replica, now):
+        self.probe_failures += 1
+        replica.down_until = now + self.retry
+
+    def _candidates(self, token):
+        """``(index, covered)`` for each replica that isn't down, in round-robin order."""
+        now = time.monotonic()
+        for index in self._rotation():
+            replica = self.replicas[index]
+            if replica.down_until <= now:
+                yield index, self._covers(replica, token, now)
+
+    def _fresh(self, index, token, position):
+        replica = self.replicas[index]
+        now = time.monotonic()
+        self._observed(replica, position, now)
+        return self._covers(replica, token, now)
+
+    def _chosen(self, index):
+        if index is None:
+            self.primary_fallbacks += 1
+        else:
+            self.replica_reads += 1
+        return index
+
+    def choose(self, token, probe):
+        """Index of a replica that has caught up to ``token`` (None: any), or None to read the primary.
+
+        ``probe(index)`` returns the replica's position, see ``replica_position``.
+        """
+        for index, covered in self._candidates(token):
+            if covered:
+                return self._chosen(index)
+            self.probes += 1
+            try:
+                position = probe(index)
+            except Exception:
+                self._failed(self.replicas[index], time.monotonic())
+                continue
+            if self._fresh(index, token, position):
+                return self._chosen(index)
+        return self._chosen(None)
+
+    async def choose_async(self, token, probe):
+        """``choose`` with an async ``probe``."""
+        for index, covered in self._candidates(token):
+            if covered:
+                return self._chosen(index)
+            self.probes += 1
+            try:
+                position = await probe(index)
+            except Exception:
+                self._failed(self.replicas[index], time.monotonic())
+                continue
+            if self._fresh(index, token, position):
+                return self._chosen(index)
+        return self._chosen(None)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'replicas': len(self.replicas),
+            'replicas_down': sum(replica.down_until > now for replica in self.replicas),
+            'replica_reads': self.replica_reads,
+            'primary_fallbacks': self.primary_fallbacks,
+            'probes': self.probes,
+            'probe_failures': self.probe_failures,
+            'tokens_issued': self.tokens_issued
+        }
+
+
+_replica_set = None
+_request = ContextVar('sparko_db_routing', default=None)
+_use_primary = ContextVar('sparko_db_use_primary', default=False)
+
+
+def get_replica_set():
+    global _replica_set
+    if _replica_set is None:
+        _replica_set = ReplicaSet(
+            replica_urls(),
+            max_lag=float(os.environ.get('DB_REPLICA_MAX_LAG', DEFAULT_MAX_LAG)),
+            check_interval=float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)),
+            retry=float(os.environ.get('DB_REPLICA_RETRY', DEFAULT_RETRY))
+        )
+        if _replica_set.replicas:
+            metrics.register_source('db_replicas', _replica_set.stats, counters=(
+                'replica_reads', 'primary_fallbacks', 'probes', 'probe_failures', 'tokens_issued'
+            ))
+    return _replica_set
+
+
+def start_request(token_header=None):
+    """Route statements in this context for a new request; returns a token for ``finish_request``."""
+    return _request.set(RequestRouting(get_replica_set().parse_token(token_header)))
+
+
+def finish_request(token):
+    _request.reset(token)
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, for a row about to be written."""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def reads_from_replica(state):
+    return state is not None and state.read_only and not state.pinned and not _use_primary.get()
+
+
+# Writes are seen on the connection that runs them, Flask and async engines alike
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        conn.info['wrote'] = True
+        state = _request.get()
+        if state is not None:
+            state.pinned = True
+
+
+@event.listens_for(Engine, 'commit')
+def _commit(conn):
+    if conn.info.pop('wrote', False):
+        state = _request.get()
+        if state is not None:
+            state.wrote = True
+
+
+@event.listens_for(Engine, 'rollback')
+def _rollback(conn):
+    conn.info.pop('wrote', None)
+
+
+class Router:
+    def __init__(self, replicas, engines):
+        self.replicas = replicas
+        self.engines = engines
+
+    def probe(self, index):
+        with self.engines[index].connect() as connection:
+            return replica_position(connection)
+
+
+def _replica_engine():
+    state = _request.get()
+    if not reads_from_replica(state):
+        return None
+    if state.replica is None:
+        router = current_app.extensions['db_routing']
+        index = router.replicas.choose(state.token, router.probe) if router.engines else None
+        state.replica = router.engines[index] if index is not None else False
+    return state.replica or None
+
+
+# Only SELECTs are rebound: flushes and DML keep the session's primary bind
+@event.listens_for(Session, 'do_orm_execute')
+def _route_select(orm_execute_state):
+    if orm_execute_state.is_select and 'bind' not in orm_execute_state.bind_arguments and \
+            getattr(orm_execute_state.statement, '_for_update_arg', None) is None:
+        engine = _replica_engine()
+        if engine is not None:
+            orm_execute_state.bind_arguments['bind'] = engine
+
+
+def replica_reads(view):
+    """Serve the view's reads from a replica that has the client's consistency token."""
+    @functools.wraps(view)
+    def decorated(*args, **kwargs):
+        state = _request.get()
+        if state is not None:
+            state.read_only = True
+        return view(*args, **kwargs)
+    return decorated
+
+
+def install(app, db):
+    """Route the ``replica_reads`` views of ``app`` and issue consistency tokens; reads ``DATABASE_REPLICA_URLS``."""
+    replicas = get_replica_set()
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.extensions['db_routing'] = Router(replicas, [create_engine(replica.url, **options) for replica in replicas.replicas])
+
+    @app.before_request
+    def _start_routing():
+        g.db_routing = start_request(request.headers.get(HEADER))
+
+    @app.after_request
+    def _issue_token(response):
+        state = _request.get()
+        if state is not None and state.wrote and replicas.replicas:
+            position = None
+            if replicas.kind == 'lsn':
+                with db.engine.connect() as connection:
+                    position = primary_position(connection)
+            response.headers[HEADER] = replicas.token(position)
+        return response
+
+    @app.teardown_request
+    def _finish_routing(error):
+        if 'db_routing' in g:
+            finish_request(g.pop('db_routing'))
+
+
+class ConsistencyMiddleware:
+    """ASGI counterpart of ``install``'s token handling for the FastAPI routes.
+
+    ``primary_position`` is a coroutine returning the primary's WAL
+    position. Responses from a mounted app that set their own token keep it.
+    """
+
+    def __init__(self, app, primary_position):
+        self.app = app
+        self.primary_position = primary_position
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        token = start_request(headers.get(HEADER.lower().encode(), b'').decode('latin-1'))
+        state = _request.get()
+        replicas = get_replica_set()
+
+        async def send_with_token(message):
+            if message['type'] == 'http.response.start' and state.wrote and replicas.replicas:
+                names = {name.lower() for name, _ in message.get('headers', ())}
+                if HEADER.lower().encode() not in names:
+                    position = await self.primary_position() if replicas.kind == 'lsn' else None
+                    message = dict(message, headers=list(message.get('headers', ())) + [
+                        (HEADER.lower().encode(), replicas.token(position).encode('latin-1'))
+                    ])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            finish_request(token)
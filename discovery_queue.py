@@ -0,0 +1,267 @@
+"""Precomputed discovery queue backing /discover.
+
+Every (user, role) pair owns an ordered queue of candidate user ids that is
+filled ahead of time, best match first, by a background worker. /discover reads a page of it
+through an opaque cursor, so a request costs O(page) no matter how long the
+swipe history is, and swipes delete their candidate from the queue instead of
+forcing the next request to re-scan the Swipe table.
+
+Refills reserve their positions with one ``UPDATE ... RETURNING`` on the
+queue state, so concurrent refills of one queue (e.g. an inline first-visit
+refill racing a background one) never reuse a position. When they picked
+the same candidates, the later one hits ``uq_discovery_queue_candidate``
+and backs off: the queue was already refilled.
+"""
+import base64
+import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db, User, UserProfile
+from src.services import db_routing, scoring, seen_set, vector_index
+
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+REFILL_BATCH = 100
+# Every third refill slot goes to the nearest profile by text embedding
+SEMANTIC_EVERY = 3
+LOW_WATER = 30
+
+TARGET_ROLES = {
+    'entrepreneur': 'investor',
+    'investor': 'entrepreneur',
+    'partner': 'partner'
+}
+
+
+class DiscoveryQueueEntry(db.Model):
+    __tablename__ = 'discovery_queue'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('uq_discovery_queue_candidate', 'user_id', 'role', 'candidate_id', unique=True),
+    )
+
+
+class DiscoveryQueueState(db.Model):
+    __tablename__ = 'discovery_queue_state'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    next_position = db.Column(db.Integer, nullable=False, default=0)
+
+
+def encode_cursor(role, position):
+    raw = f'{role}:{position}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, role):
+    """Return the queue position a cursor points at, or -1 to start from the head.
+
+    Cursors issued for another role (the user switched roles since) are ignored.
+    """
+    if not cursor:
+        return -1
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_role, position = base64.urlsafe_b64decode(padded).decode().split(':')
+        position = int(position)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    return position if cursor_role == role else -1
+
+
+def _ensure_state(user_id, role):
+    """Create the queue's state row unless it exists; a concurrent refill may create it first."""
+    if db.session.get(DiscoveryQueueState, (user_id, role)) is not None:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(DiscoveryQueueState.__table__).values(
+                user_id=user_id, role=role, next_position=0
+            ))
+    except IntegrityError:
+        pass
+
+
+def _reserve_positions(user_id, role, count):
+    """Advance ``next_position`` by ``count`` and return the first reserved position.
+
+    The UPDATE holds the state row until commit, so a concurrent refill waits
+    and then reserves the positions after these.
+    """
+    state = DiscoveryQueueState.__table__
+    end = db.session.execute(update(state).where(and_(
+        state.c.user_id == user_id,
+        state.c.role == role
+    )).values(next_position=state.c.next_position + count).returning(state.c.next_position)).scalar_one()
+    return end - count
+
+
+def _excluded_ids(user_id, role):
+    """The viewer, everyone they already swiped in this role and everyone already queued."""
+    queued = db.session.query(DiscoveryQueueEntry.candidate_id).filter(
+        and_(
+            DiscoveryQueueEntry.user_id == user_id,
+            DiscoveryQueueEntry.role == role
+        )
+    )
+    return np.concatenate((
+        [user_id], seen_set.load(user_id, role).to_array(), [row[0] for row in queued]
+    )).astype(np.int64)
+
+
+def _blend(structured, semantic):
+    """The structured ranking with every ``SEMANTIC_EVERY``-th slot given to the next semantic match.
+
+    Semantic matches the structured ranking already has keep their place there.
+    """
+    structured = [int(candidate_id) for candidate_id in structured]
+    taken = set(structured)
+    semantic = [int(candidate_id) for candidate_id in semantic if int(candidate_id) not in taken]
+    size = min(len(structured) + len(semantic), REFILL_BATCH)
+    structured, semantic = iter(structured), iter(semantic)
+    blended = []
+    for slot in range(size):
+        first, second = (semantic, structured) if (slot + 1) % SEMANTIC_EVERY == 0 else (structured, semantic)
+        blended.append(next(first, None) or next(second))
+    return blended
+
+
+@db_routing.primary()
+def refill(user_id, role):
+    """Append the next best-scoring batch of candidates to the queue and commit.
+
+    Candidates come from the role's cached scoring matrix, so profiles
+    completed since the last rebuild join the queue once the matrix expires.
+    A third of them are instead the profiles whose text is nearest the
+    viewer's, from the vector index. The queue state it advances is read
+    from the primary, also when /discover runs it inline. Returns 0 when a
+    concurrent refill already queued these candidates.
+    """
+    target_role = TARGET_ROLES[role]
+    _ensure_state(user_id, role)
+
+    viewer = db.session.query(UserProfile, User).join(
+        User, UserProfile.user_id == User.id
+    ).filter(
+        UserProfile.user_id == user_id,
+        UserProfile.role == role
+    ).first()
+
+    candidate_ids = []
+    if viewer:
+        excluded = _excluded_ids(user_id, role)
+        matrix = scoring.candidate_matrix(target_role)
+        candidate_ids, _ = matrix.top_k(scoring.encode(*viewer), REFILL_BATCH, excluded)
+        semantic_ids, _ = vector_index.candidates(
+            user_id, role, target_role, REFILL_BATCH // SEMANTIC_EVERY, excluded
+        )
+        candidate_ids = _blend(candidate_ids, semantic_ids)
+
+    if len(candidate_ids):
+        position = _reserve_positions(user_id, role, len(candidate_ids))
+        try:
+            db.session.execute(insert(DiscoveryQueueEntry.__table__), [
+                {
+                    'user_id': user_id,
+                    'role': role,
+                    'position': position + offset,
+                    'candidate_id': int(candidate_id)
+                }
+                for offset, candidate_id in enumerate(candidate_ids)
+            ])
+        except IntegrityError:
+            # A concurrent refill queued (some of) the same candidates first
+            db.session.rollback()
+            return 0
+
+    db.session.commit()
+    return len(candidate_ids)
+
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='discovery-refill')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _run_refill(app, user_id, role):
+    try:
+        with app.app_context():
+            try:
+                refill(user_id, role)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Discovery queue refill failed for user %s (%s)', user_id, role)
+    finally:
+        with _pending_lock:
+            _pending.discard((user_id, role))
+
+
+def schedule_refill(user_id, role):
+    """Top up a queue in the background; concurrent requests for one queue collapse."""
+    key = (user_id, role)
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    _executor.submit(_run_refill, current_app._get_current_object(), user_id, role)
+
+
+def next_page(user_id, role, cursor=None, limit=PAGE_SIZE):
+    """Return ``(rows, next_cursor)`` for the page after ``cursor``.
+
+    ``rows`` is a list of ``(UserProfile, User)`` pairs in queue order.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor, role)
+    target_role = TARGET_ROLES[role]
+
+    state = db.session.get(DiscoveryQueueState, (user_id, role))
+    if state is None:
+        # First visit: build the head of the queue inline so the page isn't empty
+        refill(user_id, role)
+        state = db.session.get(DiscoveryQueueState, (user_id, role))
+
+    rows = db.session.query(DiscoveryQueueEntry.position, UserProfile, User).join(
+        UserProfile,
+        and_(
+            UserProfile.user_id == DiscoveryQueueEntry.candidate_id,
+            UserProfile.role == target_role,
+            UserProfile.is_complete == True
+        )
+    ).join(
+        User, User.id == DiscoveryQueueEntry.candidate_id
+    ).filter(
+        and_(
+            DiscoveryQueueEntry.user_id == user_id,
+            DiscoveryQueueEntry.role == role,
+            DiscoveryQueueEntry.position > after
+        )
+    ).order_by(DiscoveryQueueEntry.position).limit(limit).all()
+
+    last_position = rows[-1][0] if rows else after
+    if state.next_position - last_position <= LOW_WATER:
+        schedule_refill(user_id, role)
+
+    next_cursor = encode_cursor(role, last_position) if rows else cursor
+    return [(profile, profile_user) for _, profile, profile_user in rows], next_cursor
+
+
+def drop_candidate(user_id, role, candidate_id):
+    """Remove a swiped candidate from the swiper's queue (joins the caller's transaction)."""
+    DiscoveryQueueEntry.query.filter_by(
+        user_id=user_id,
+        role=role,
+        candidate_id=candidate_id
+    ).delete(synchronize_session=False)
@@ -0,0 +1,171 @@
+"""Local text embeddings for profiles: TF-IDF projected by a truncated SVD (latent semantic analysis).
+
+Keyword search misses that "seeking a technical cofounder" and "looking to
+join as CTO" ask for the same thing. Words used in similar profiles end up
+close together after a low-rank factorisation of the term-profile matrix,
+so profiles are compared by the cosine of their ``DIM``-wide projections.
+
+Terms are the search tokenizer's words plus adjacent-word bigrams, with a
+log-scaled term frequency and a smoothed IDF. ``EmbeddingModel.train``
+learns the vocabulary and projection from our own profiles with a
+randomized SVD (a few passes over the sparse matrix, as in Halko, Martinsson
+and Tropp). Nothing leaves the process and nothing beyond numpy is needed.
+"""
+import hashlib
+import io
+import math
+import os
+import uuid
+from array import array
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from src.services.text_index import tokenize
+
+# Everything that says what a profile offers or is looking for
+TEXT_FIELDS = (
+    'title', 'tagline', 'bio', 'skills', 'industry', 'project_description', 'looking_for_investor_type',
+    'past_investments', 'professional_background', 'value_add_services', 'expertise',
+    'collaboration_type', 'desired_role'
+)
+DIM = 128
+MAX_FEATURES = 100000
+MIN_DF = 3
+OVERSAMPLE = 16
+POWER_ITERATIONS = 3
+CHUNK_NONZEROS = 250000
+
+Sparse = namedtuple('Sparse', 'indptr indices data shape')
+
+
+def profile_text(profile):
+    return ' '.join(str(value) for value in (getattr(profile, field) for field in TEXT_FIELDS) if value)
+
+
+def features(text):
+    """Term counts of ``text``: its tokens and each pair of adjacent tokens."""
+    tokens = tokenize(text)
+    counts = Counter(tokens)
+    counts.update(f'{first}_{second}' for first, second in zip(tokens, tokens[1:]))
+    return counts
+
+
+def dot(matrix, dense):
+    """``matrix @ dense`` for a ``Sparse`` CSR matrix, ``CHUNK_NONZEROS`` products at a time."""
+    indptr, indices, data, (rows, _) = matrix
+    out = np.zeros((rows, dense.shape[1]), dtype=np.float32)
+    start = 0
+    while start < rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + CHUNK_NONZEROS, side='right')) - 1
+        stop = min(max(stop, start + 1), rows)
+        low, high = indptr[start], indptr[stop]
+        if high > low:
+            products = data[low:high, None] * dense[indices[low:high]]
+            nonempty = np.flatnonzero(np.diff(indptr[start:stop + 1]))
+            out[start + nonempty] = np.add.reduceat(products, indptr[start:stop][nonempty] - low, axis=0)
+        start = stop
+    return out
+
+
+def transpose(matrix):
+    indptr, indices, data, (rows, columns) = matrix
+    order = np.argsort(indices, kind='stable')
+    row_of = np.repeat(np.arange(rows, dtype=np.int32), np.diff(indptr))
+    counts = np.bincount(indices, minlength=columns)
+    return Sparse(np.concatenate(([0], np.cumsum(counts))), row_of[order], data[order], (columns, rows))
+
+
+def _orthonormal(matrix):
+    return np.linalg.qr(matrix)[0].astype(np.float32)
+
+
+def truncated_svd(matrix, dim, seed=0):
+    """The top ``dim`` right singular vectors of ``matrix`` as columns, by randomized range finding."""
+    rng = np.random.default_rng(seed)
+    transposed = transpose(matrix)
+    width = min(dim + OVERSAMPLE, *matrix.shape)
+    basis = _orthonormal(dot(matrix, rng.standard_normal((matrix.shape[1], width)).astype(np.float32)))
+    for _ in range(POWER_ITERATIONS):
+        basis = _orthonormal(dot(matrix, _orthonormal(dot(transposed, basis))))
+    # basis.T @ matrix is small and dense: width x terms
+    _, _, right = np.linalg.svd(dot(transposed, basis).T, full_matrices=False)
+    return np.ascontiguousarray(right[:dim].T, dtype=np.float32)
+
+
+def normalize(vectors):
+    """Rows scaled to unit length; all-zero rows (no known terms) stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class EmbeddingModel:
+    def __init__(self, vocabulary, idf, components):
+        self.vocabulary = list(vocabulary)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)  # terms x dim
+        self.columns = {term: i for i, term in enumerate(self.vocabulary)}
+        self.version = hashlib.sha1(self.components.tobytes()).hexdigest()[:12]
+
+    @property
+    def dim(self):
+        return self.components.shape[1]
+
+    def tfidf(self, bags):
+        """The unit-length TF-IDF rows of term-count bags, as a ``Sparse`` matrix."""
+        indptr, columns, counts = array('q', [0]), array('i'), array('f')
+        for bag in bags:
+            for term, count in bag.items():
+                column = self.columns.get(term)
+                if column is not None:
+                    columns.append(column)
+                    counts.append(count)
+            indptr.append(len(columns))
+        indptr = np.frombuffer(indptr, dtype=np.int64)
+        columns = np.frombuffer(columns, dtype=np.int32)
+        data = (1 + np.log(np.frombuffer(counts, dtype=np.float32))) * self.idf[columns]
+        row_of = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        norms = np.sqrt(np.bincount(row_of, weights=data * data, minlength=len(indptr) - 1))
+        data = (data / norms[row_of]).astype(np.float32) if len(data) else data
+        return Sparse(indptr, columns, data, (len(indptr) - 1, len(self.vocabulary)))
+
+    def embed(self, texts):
+        """Unit-length ``DIM``-wide vectors of ``texts``, one row each."""
+        return normalize(dot(self.tfidf([features(text) for text in texts]), self.components))
+
+    @classmethod
+    def train(cls, texts, dim=DIM, max_features=MAX_FEATURES, min_df=MIN_DF, seed=0):
+        """Learn the vocabulary, IDF and projection from ``texts``."""
+        bags = [features(text) for text in texts]
+        df = Counter()
+        for bag in bags:
+            df.update(bag.keys())
+        vocabulary = sorted((term for term, count in df.items() if count >= min_df),
+                            key=lambda term: (-df[term], term))[:max_features]
+        if not vocabulary:
+            raise ValueError('not enough text to train on')
+        idf = [math.log((1 + len(bags)) / (1 + df[term])) + 1 for term in vocabulary]
+        model = cls(vocabulary, idf, np.zeros((len(vocabulary), 1), dtype=np.float32))
+        matrix = model.tfidf(bags)
+        return cls(vocabulary, idf, truncated_svd(matrix, min(dim, *matrix.shape), seed))
+
+    def _write(self, f):
+        np.savez(f, vocabulary=np.frombuffer('\n'.join(self.vocabulary).encode(), dtype=np.uint8),
+                 idf=self.idf, components=self.components)
+
+    def save(self, path):
+        temporary = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(temporary, 'wb') as f:
+            self._write(f)
+        os.replace(temporary, path)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        self._write(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, path):
+        """A model from a file written by ``save``, or from the bytes of ``to_bytes``."""
+        with np.load(io.BytesIO(path) if isinstance(path, bytes) else path) as saved:
+            return cls(saved['vocabulary'].tobytes().decode().split('\n'), saved['idf'], saved['components'])
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import os
+import jwt
+
+from src.services.realtime import get_broker, user_channel
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = 15
+
+
+def authenticate(token):
+    """Resolve a Sparko JWT (auth blueprint or flask_jwt_extended) to a user id."""
+    if token and token.startswith('Bearer '):
+        token = token[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Token is missing")
+    for key in filter(None, [os.environ.get("SECRET_KEY"), os.environ.get("JWT_SECRET_KEY")]):
+        try:
+            data = jwt.decode(token, key, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token has expired")
+        except jwt.InvalidTokenError:
+            continue
+        user_id = data.get("user_id", data.get("sub"))
+        if user_id is not None:
+            return int(user_id)
+    raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@router.get("/api/events")
+async def stream_events(request: Request, token: str = None):
+    # EventSource can't set headers, so browsers pass the token as ?token=
+    user_id = authenticate(token or request.headers.get("Authorization"))
+    subscription = get_broker().subscribe(user_channel(user_id))
+
+    async def stream():
+        try:
+            yield ": connected\n\n"
+            while True:
+                event = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                if await request.is_disconnected():
+                    break
+                yield format_event(event) if event else ": heartbeat\n\n"
+        except asyncio.CancelledError:
+            pass
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
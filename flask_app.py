@@ -0,0 +1,47 @@
+import os
+from flask import Flask
+from flask_cors import CORS
+from flask_jwt_extended import JWTManager
+
+from src.models.user import db
+from src.routes.auth import auth_bp
+from src.routes.chat import chat_bp
+from src.routes.matching import matching_bp
+from src.routes.photos import photos_bp
+from src.routes.profile import profile_bp
+from src.services import db_routing, migrations, query_stats
+from src.services.async_db import INSTANCE_PATH, database_url
+
+def create_app():
+    """The Flask side of the API, mounted inside the ASGI app in main.py.
+
+    Configuration comes from the environment so the async routes (which read
+    the same variables) always agree with it on secrets and database.
+    """
+    # The async engine resolves relative SQLite paths against the same folder
+    app = Flask(__name__, instance_path=INSTANCE_PATH)
+    app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
+    app.config['JWT_SECRET_KEY'] = os.environ['JWT_SECRET_KEY']
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_recycle': 1800}
+
+    CORS(app, expose_headers=[db_routing.HEADER])
+    JWTManager(app)
+    db.init_app(app)
+    query_stats.install(app)
+    db_routing.install(app, db)
+
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(profile_bp, url_prefix='/api/profile')
+    app.register_blueprint(matching_bp, url_prefix='/api/matching')
+    app.register_blueprint(chat_bp, url_prefix='/api/chat')
+    app.register_blueprint(photos_bp, url_prefix='/api/photos')
+
+    with app.app_context():
+        db.create_all()
+        # Deployments run python -m src.services.migrations before starting workers
+        if os.environ.get('SPARKO_MIGRATE_ON_START') == '1':
+            migrations.upgrade(db.engine, log=app.logger.info)
+
+    return app
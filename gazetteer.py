@@ -0,0 +1,402 @@
+"""Offline geocoder for the free-text location fields.
+
+``User.location``, ``geographic_preference`` and ``location_preference``
+hold strings like "San Francisco, CA" or "Berlin, Germany". ``geocode``
+resolves one to a ``Place`` without any network call. A place has
+coordinates, a UTC offset and a precision. The precision is ``'city'``, or
+``'region'`` for a US state or a country, which resolves to its centroid.
+
+The built-in table covers the startup hubs users actually enter, plus every
+US state and the larger countries as region fallbacks, so "Boise, ID"
+still lands in Idaho. ``GAZETTEER_PATH`` may point at a GeoNames cities
+dump (``cities15000.txt`` and the like) to cover everywhere else. Its
+cities are added to the built-in ones, and their offsets come from
+``zoneinfo``. Offsets are standard time: daylight saving is ignored, which
+is fine for "same timezone ±2h".
+"""
+import threading
+import unicodedata
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app, has_app_context
+
+Place = namedtuple('Place', 'name latitude longitude utc_offset precision')
+
+UNPLACEABLE = {'remote', 'anywhere', 'global', 'worldwide', 'online', 'n/a', 'none'}
+
+# name|state or province|country|lat|lon|utc offset
+CITIES = """
+San Francisco|CA|US|37.7749|-122.4194|-8
+Palo Alto|CA|US|37.4419|-122.1430|-8
+Mountain View|CA|US|37.3861|-122.0839|-8
+Menlo Park|CA|US|37.4530|-122.1817|-8
+San Jose|CA|US|37.3382|-121.8863|-8
+Oakland|CA|US|37.8044|-122.2712|-8
+Berkeley|CA|US|37.8715|-122.2730|-8
+Los Angeles|CA|US|34.0522|-118.2437|-8
+Santa Monica|CA|US|34.0195|-118.4912|-8
+San Diego|CA|US|32.7157|-117.1611|-8
+Irvine|CA|US|33.6846|-117.8265|-8
+Sacramento|CA|US|38.5816|-121.4944|-8
+Seattle|WA|US|47.6062|-122.3321|-8
+Bellevue|WA|US|47.6101|-122.2015|-8
+Redmond|WA|US|47.6740|-122.1215|-8
+Portland|OR|US|45.5152|-122.6784|-8
+Las Vegas|NV|US|36.1699|-115.1398|-8
+Phoenix|AZ|US|33.4484|-112.0740|-7
+Salt Lake City|UT|US|40.7608|-111.8910|-7
+Denver|CO|US|39.7392|-104.9903|-7
+Boulder|CO|US|40.0150|-105.2705|-7
+Austin|TX|US|30.2672|-97.7431|-6
+Dallas|TX|US|32.7767|-96.7970|-6
+Houston|TX|US|29.7604|-95.3698|-6
+San Antonio|TX|US|29.4241|-98.4936|-6
+Chicago|IL|US|41.8781|-87.6298|-6
+Minneapolis|MN|US|44.9778|-93.2650|-6
+Kansas City|MO|US|39.0997|-94.5786|-6
+St Louis|MO|US|38.6270|-90.1994|-6
+Nashville|TN|US|36.1627|-86.7816|-6
+New Orleans|LA|US|29.9511|-90.0715|-6
+Madison|WI|US|43.0731|-89.4012|-6
+Detroit|MI|US|42.3314|-83.0458|-5
+Ann Arbor|MI|US|42.2808|-83.7430|-5
+Columbus|OH|US|39.9612|-82.9988|-5
+Pittsburgh|PA|US|40.4406|-79.9959|-5
+Philadelphia|PA|US|39.9526|-75.1652|-5
+New York|NY|US|40.7128|-74.0060|-5
+Brooklyn|NY|US|40.6782|-73.9442|-5
+Boston|MA|US|42.3601|-71.0589|-5
+Cambridge|MA|US|42.3736|-71.1097|-5
+Washington|DC|US|38.9072|-77.0369|-5
+Baltimore|MD|US|39.2904|-76.6122|-5
+Raleigh|NC|US|35.7796|-78.6382|-5
+Durham|NC|US|35.9940|-78.8986|-5
+Charlotte|NC|US|35.2271|-80.8431|-5
+Atlanta|GA|US|33.7490|-84.3880|-5
+Miami|FL|US|25.7617|-80.1918|-5
+Tampa|FL|US|27.9506|-82.4572|-5
+Orlando|FL|US|28.5383|-81.3792|-5
+Honolulu|HI|US|21.3069|-157.8583|-10
+Anchorage|AK|US|61.2181|-149.9003|-9
+Toronto|ON|CA|43.6532|-79.3832|-5
+Waterloo|ON|CA|43.4643|-80.5204|-5
+Ottawa|ON|CA|45.4215|-75.6972|-5
+Montreal|QC|CA|45.5017|-73.5673|-5
+Vancouver|BC|CA|49.2827|-123.1207|-8
+Calgary|AB|CA|51.0447|-114.0719|-7
+Mexico City||MX|19.4326|-99.1332|-6
+Sao Paulo||BR|-23.5505|-46.6333|-3
+Rio de Janeiro||BR|-22.9068|-43.1729|-3
+Buenos Aires||AR|-34.6037|-58.3816|-3
+Santiago||CL|-33.4489|-70.6693|-4
+Bogota||CO|4.7110|-74.0721|-5
+Lima||PE|-12.0464|-77.0428|-5
+London||GB|51.5074|-0.1278|0
+Manchester||GB|53.4808|-2.2426|0
+Oxford||GB|51.7520|-1.2577|0
+Edinburgh||GB|55.9533|-3.1883|0
+Dublin||IE|53.3498|-6.2603|0
+Lisbon||PT|38.7223|-9.1393|0
+Paris||FR|48.8566|2.3522|1
+Berlin||DE|52.5200|13.4050|1
+Munich||DE|48.1351|11.5820|1
+Hamburg||DE|53.5511|9.9937|1
+Frankfurt||DE|50.1109|8.6821|1
+Amsterdam||NL|52.3676|4.9041|1
+Brussels||BE|50.8503|4.3517|1
+Zurich||CH|47.3769|8.5417|1
+Geneva||CH|46.2044|6.1432|1
+Vienna||AT|48.2082|16.3738|1
+Madrid||ES|40.4168|-3.7038|1
+Barcelona||ES|41.3851|2.1734|1
+Milan||IT|45.4642|9.1900|1
+Rome||IT|41.9028|12.4964|1
+Copenhagen||DK|55.6761|12.5683|1
+Stockholm||SE|59.3293|18.0686|1
+Oslo||NO|59.9139|10.7522|1
+Warsaw||PL|52.2297|21.0122|1
+Prague||CZ|50.0755|14.4378|1
+Budapest||HU|47.4979|19.0402|1
+Helsinki||FI|60.1699|24.9384|2
+Tallinn||EE|59.4370|24.7536|2
+Athens||GR|37.9838|23.7275|2
+Kyiv||UA|50.4501|30.5234|2
+Istanbul||TR|41.0082|28.9784|3
+Moscow||RU|55.7558|37.6173|3
+Tel Aviv||IL|32.0853|34.7818|2
+Dubai||AE|25.2048|55.2708|4
+Abu Dhabi||AE|24.4539|54.3773|4
+Riyadh||SA|24.7136|46.6753|3
+Cairo||EG|30.0444|31.2357|2
+Lagos||NG|6.5244|3.3792|1
+Nairobi||KE|-1.2921|36.8219|3
+Johannesburg||ZA|-26.2041|28.0473|2
+Cape Town||ZA|-33.9249|18.4241|2
+Bangalore||IN|12.9716|77.5946|5.5
+Bengaluru||IN|12.9716|77.5946|5.5
+Mumbai||IN|19.0760|72.8777|5.5
+New Delhi||IN|28.6139|77.2090|5.5
+Delhi||IN|28.7041|77.1025|5.5
+Hyderabad||IN|17.3850|78.4867|5.5
+Chennai||IN|13.0827|80.2707|5.5
+Pune||IN|18.5204|73.8567|5.5
+Singapore||SG|1.3521|103.8198|8
+Kuala Lumpur||MY|3.1390|101.6869|8
+Jakarta||ID|-6.2088|106.8456|7
+Bangkok||TH|13.7563|100.5018|7
+Ho Chi Minh City||VN|10.8231|106.6297|7
+Hanoi||VN|21.0278|105.8342|7
+Manila||PH|14.5995|120.9842|8
+Hong Kong||HK|22.3193|114.1694|8
+Shenzhen||CN|22.5431|114.0579|8
+Shanghai||CN|31.2304|121.4737|8
+Beijing||CN|39.9042|116.4074|8
+Hangzhou||CN|30.2741|120.1551|8
+Taipei||TW|25.0330|121.5654|8
+Seoul||KR|37.5665|126.9780|9
+Tokyo||JP|35.6762|139.6503|9
+Osaka||JP|34.6937|135.5023|9
+Sydney|NSW|AU|-33.8688|151.2093|10
+Melbourne|VIC|AU|-37.8136|144.9631|10
+Brisbane|QLD|AU|-27.4698|153.0251|10
+Perth|WA|AU|-31.9505|115.8605|8
+Auckland||NZ|-36.8485|174.7633|12
+"""
+
+# code|names, the first canonical|centroid lat|lon|utc offset
+US_STATES = """
+AL|Alabama|32.8|-86.8|-6
+AK|Alaska|64.2|-149.5|-9
+AZ|Arizona|34.0|-111.1|-7
+AR|Arkansas|34.8|-92.2|-6
+CA|California|36.8|-119.4|-8
+CO|Colorado|39.1|-105.4|-7
+CT|Connecticut|41.6|-72.7|-5
+DE|Delaware|39.0|-75.5|-5
+FL|Florida|27.8|-81.7|-5
+GA|Georgia|32.2|-83.4|-5
+HI|Hawaii|19.9|-155.6|-10
+ID|Idaho|44.1|-114.7|-7
+IL|Illinois|40.0|-89.2|-6
+IN|Indiana|40.3|-86.1|-5
+IA|Iowa|42.0|-93.2|-6
+KS|Kansas|38.5|-98.4|-6
+KY|Kentucky|37.8|-84.3|-5
+LA|Louisiana|31.2|-92.1|-6
+ME|Maine|45.3|-69.4|-5
+MD|Maryland|39.0|-76.6|-5
+MA|Massachusetts|42.4|-71.4|-5
+MI|Michigan|44.3|-85.6|-5
+MN|Minnesota|46.7|-94.7|-6
+MS|Mississippi|32.7|-89.7|-6
+MO|Missouri|38.5|-92.3|-6
+MT|Montana|46.9|-110.4|-7
+NE|Nebraska|41.5|-99.9|-6
+NV|Nevada|38.8|-116.4|-8
+NH|New Hampshire|43.2|-71.6|-5
+NJ|New Jersey|40.1|-74.4|-5
+NM|New Mexico|34.5|-105.9|-7
+NY|New York State,New York|42.9|-75.5|-5
+NC|North Carolina|35.6|-79.0|-5
+ND|North Dakota|47.5|-100.5|-6
+OH|Ohio|40.4|-82.9|-5
+OK|Oklahoma|35.0|-97.1|-6
+OR|Oregon|43.8|-120.6|-8
+PA|Pennsylvania|41.2|-77.2|-5
+RI|Rhode Island|41.6|-71.5|-5
+SC|South Carolina|33.8|-81.2|-5
+SD|South Dakota|43.9|-99.9|-6
+TN|Tennessee|35.5|-86.6|-6
+TX|Texas|31.0|-99.9|-6
+UT|Utah|39.3|-111.1|-7
+VT|Vermont|44.6|-72.6|-5
+VA|Virginia|37.4|-78.7|-5
+WA|Washington State,Washington|47.8|-120.7|-8
+WV|West Virginia|38.6|-80.5|-5
+WI|Wisconsin|43.8|-88.8|-6
+WY|Wyoming|43.1|-107.6|-7
+DC|District of Columbia|38.9|-77.0|-5
+"""
+# ISO code|names, the first canonical|centroid lat|lon|utc offset
+COUNTRIES = """
+US|United States,USA,United States of America,America|39.8|-98.6|-6
+CA|Canada|56.1|-106.3|-6
+MX|Mexico|23.6|-102.6|-6
+BR|Brazil|-14.2|-51.9|-3
+AR|Argentina|-38.4|-63.6|-3
+CL|Chile|-35.7|-71.5|-4
+CO|Colombia|4.6|-74.3|-5
+PE|Peru|-9.2|-75.0|-5
+GB|United Kingdom,UK,Great Britain,England,Scotland|54.0|-2.0|0
+IE|Ireland|53.4|-8.2|0
+PT|Portugal|39.4|-8.2|0
+FR|France|46.2|2.2|1
+DE|Germany|51.2|10.5|1
+NL|Netherlands,Holland|52.1|5.3|1
+BE|Belgium|50.5|4.5|1
+CH|Switzerland|46.8|8.2|1
+AT|Austria|47.5|14.6|1
+ES|Spain|40.5|-3.7|1
+IT|Italy|41.9|12.6|1
+DK|Denmark|56.3|9.5|1
+SE|Sweden|60.1|18.6|1
+NO|Norway|60.5|8.5|1
+FI|Finland|61.9|25.7|2
+PL|Poland|51.9|19.1|1
+CZ|Czech Republic,Czechia|49.8|15.5|1
+HU|Hungary|47.2|19.5|1
+EE|Estonia|58.6|25.0|2
+GR|Greece|39.1|21.8|2
+UA|Ukraine|48.4|31.2|2
+TR|Turkey,Turkiye|39.0|35.2|3
+RU|Russia|55.8|37.6|3
+IL|Israel|31.0|34.9|2
+AE|United Arab Emirates,UAE|23.4|53.8|4
+SA|Saudi Arabia|23.9|45.1|3
+EG|Egypt|26.8|30.8|2
+NG|Nigeria|9.1|8.7|1
+KE|Kenya|-0.02|37.9|3
+ZA|South Africa|-30.6|22.9|2
+IN|India|20.6|79.0|5.5
+SG|Singapore|1.35|103.8|8
+MY|Malaysia|4.2|101.98|8
+ID|Indonesia|-0.8|113.9|7
+TH|Thailand|15.9|100.99|7
+VN|Vietnam|14.1|108.3|7
+PH|Philippines|12.9|121.8|8
+HK|Hong Kong|22.3|114.2|8
+CN|China|35.9|104.2|8
+TW|Taiwan|23.7|121.0|8
+KR|South Korea,Korea|35.9|127.8|9
+JP|Japan|36.2|138.3|9
+AU|Australia|-25.3|133.8|10
+NZ|New Zealand|-40.9|174.9|12
+"""
+
+
+def normalize(text):
+    """Lowercase ASCII with punctuation dropped: "São Paulo" -> "sao paulo", "St. Louis" -> "st louis"."""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    text = ''.join(ch if ch.isalnum() or ch == ',' else ' ' for ch in text)
+    return ' '.join(text.split())
+
+
+def _rows(table):
+    return [line.split('|') for line in table.strip().splitlines()]
+
+
+def _standard_offset(timezone):
+    """Standard-time UTC offset in hours, the smaller of January's and July's."""
+    from zoneinfo import ZoneInfo
+    zone = ZoneInfo(timezone)
+    return min(datetime(2026, month, 1, tzinfo=zone).utcoffset().total_seconds() for month in (1, 7)) / 3600
+
+
+class Gazetteer:
+    def __init__(self):
+        self._cities = {}   # name -> Place, first added wins (the table lists the likelier one first)
+        self._qualified = {}  # (name, region or country) -> Place
+        self._regions = {}  # state or country name/code -> Place
+        self._country_names = {}  # country code -> its normalized names, for "City, Country"
+        self._state_names = {}  # US state code -> its normalized names, for "City, State"
+
+        for code, names, lat, lon, offset in _rows(COUNTRIES):
+            aliases = [normalize(name) for name in names.split(',')]
+            self._country_names[code] = aliases + [code.lower()]
+            place = Place(names.split(',')[0], float(lat), float(lon), float(offset), 'region')
+            for alias in aliases:
+                self._regions.setdefault(alias, place)
+        for code, names, lat, lon, offset in _rows(US_STATES):
+            aliases = [normalize(name) for name in names.split(',')]
+            place = Place(names.split(',')[0], float(lat), float(lon), float(offset), 'region')
+            self._state_names[code.lower()] = aliases
+            # States take the two-letter codes: "Portland, OR" is far likelier than the country codes
+            self._regions[code.lower()] = place
+            for alias in aliases:
+                self._regions.setdefault(alias, place)
+        for code in self._country_names:
+            self._regions.setdefault(code.lower(), self._regions[self._country_names[code][0]])
+
+        for name, region, country, lat, lon, offset in _rows(CITIES):
+            self.add_city(name, region, country, float(lat), float(lon), float(offset))
+
+    def add_city(self, name, region, country, latitude, longitude, utc_offset, aliases=()):
+        place = Place(name, latitude, longitude, utc_offset, 'city')
+        for key in [normalize(name)] + [normalize(alias) for alias in aliases]:
+            if not key:
+                continue
+            self._cities.setdefault(key, place)
+            qualifiers = [region.lower()] + self._country_names.get(country, [country.lower()])
+            if country == 'US':
+                qualifiers.extend(self._state_names.get(region.lower(), ()))
+            for qualifier in qualifiers:
+                if qualifier:
+                    self._qualified.setdefault((key, qualifier), place)
+
+    def load_geonames(self, path, max_aliases=5):
+        """Add the cities of a GeoNames dump; returns how many were read."""
+        count = 0
+        offsets = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 18:
+                    continue
+                timezone = fields[17]
+                if timezone not in offsets:
+                    try:
+                        offsets[timezone] = _standard_offset(timezone)
+                    except Exception:
+                        offsets[timezone] = None
+                if offsets[timezone] is None:
+                    continue
+                aliases = [fields[2]] + [alias for alias in fields[3].split(',') if alias.isascii()][:max_aliases]
+                self.add_city(fields[1], fields[10], fields[8], float(fields[4]), float(fields[5]),
+                              offsets[timezone], aliases)
+                count += 1
+        return count
+
+    def geocode(self, text):
+        """The ``Place`` for a free-text location, or None when it can't be placed."""
+        if not text:
+            return None
+        parts = [part.strip() for part in normalize(text).split(',') if part.strip()]
+        if not parts or parts[0] in UNPLACEABLE:
+            return None
+        city = parts[0]
+        for qualifier in reversed(parts[1:]):
+            place = self._qualified.get((city, qualifier))
+            if place:
+                return place
+        if len(parts) == 1 or parts[-1] not in self._regions:
+            place = self._cities.get(city)
+            if place:
+                return place
+        for part in reversed(parts):
+            place = self._regions.get(part)
+            if place:
+                return place
+        return None
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Process-wide gazetteer, extended from ``GAZETTEER_PATH`` when it is configured."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                gazetteer = Gazetteer()
+                path = current_app.config.get('GAZETTEER_PATH') if has_app_context() else None
+                if path:
+                    gazetteer.load_geonames(path)
+                _gazetteer = gazetteer
+    return _gazetteer
+
+
+def geocode(text):
+    return get_gazetteer().geocode(text)
@@ -0,0 +1,456 @@
+"""Geocoded profile locations and an in-memory spatial index over them.
+
+When a profile is saved, its location string is resolved with the offline
+gazetteer and stored in ``profile_location``. Entrepreneurs use
+``User.location``. Investors use ``geographic_preference`` and partners
+``location_preference``, each falling back to ``User.location`` when the
+preference doesn't place. ``GeoIndex`` holds the complete profiles of each
+role and answers "within ``km`` of a point" and "UTC offset within ±``hours``"
+with arrays of user ids, so search can add them to its candidate filters.
+
+Points live in a fixed 0.1° latitude/longitude grid. The cell number
+``row * GRID_COLUMNS + column`` plays the part of a geohash prefix, and
+points are kept sorted by it, so the cells a circle covers in one grid row
+are one contiguous slice found by binary search. Slices of cells whose four
+corners are all inside the circle are taken wholesale. Only points in the
+edge cells are checked exactly, with a dot product of unit vectors. The cost
+follows the rows touched and the size of the answer, not the index.
+Region-precision locations (a bare "Texas" resolves to the state's centroid)
+are left out of radius queries but still count for timezones.
+
+A save after the build tombstones the profile's entry in the sorted arrays
+and goes to a small overlay, which is merged in once it reaches
+``MERGE_THRESHOLD`` entries. Each worker has its own index: saves made here
+are applied when they commit, and every ``REFRESH_SECONDS`` the index
+re-reads the profiles whose profile, account or location row changed since
+its last look, so other workers' saves show up too. A profile that became
+incomplete, or whose location no longer places (its row is deleted, but the
+profile or account stamp still moves), is removed the same way.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import and_, or_, select
+
+from src.models.user import db, User, UserProfile
+from src.services import gazetteer
+
+CELL_DEGREES = 0.1
+GRID_ROWS = int(180 / CELL_DEGREES)
+GRID_COLUMNS = int(360 / CELL_DEGREES)
+EARTH_RADIUS_KM = 6371.0088
+MERGE_THRESHOLD = 4096
+# Below this many points a flat scan beats walking the grid rows
+SCAN_BELOW = 8192
+ROLES = ('entrepreneur', 'investor', 'partner')
+REFRESH_SECONDS = 5.0
+# Rows committed this long after their updated_at was stamped are still caught
+CATCH_UP_LAG = timedelta(seconds=30)
+
+
+class ProfileLocation(db.Model):
+    __tablename__ = 'profile_location'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    place = db.Column(db.String(100), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    utc_offset = db.Column(db.Float, nullable=False)
+    precision = db.Column(db.String(10), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+def location_text(role, user_location, geographic_preference=None, location_preference=None):
+    """The location strings to try for a profile, most specific first."""
+    preference = {'investor': geographic_preference, 'partner': location_preference}.get(role)
+    return [text for text in (preference, user_location) if text]
+
+
+def resolve(role, user_location, geographic_preference=None, location_preference=None):
+    """The ``Place`` of a profile: the first of its location strings that places, city precision preferred."""
+    places = [gazetteer.geocode(text) for text in
+              location_text(role, user_location, geographic_preference, location_preference)]
+    places = [place for place in places if place is not None]
+    return next((place for place in places if place.precision == 'city'), places[0] if places else None)
+
+
+def store(profile, user_location):
+    """Geocode ``profile`` and stage its ``profile_location`` row (joins the caller's transaction).
+
+    Returns the place, or None if the profile can't be placed.
+    """
+    place = resolve(profile.role, user_location, profile.geographic_preference, profile.location_preference)
+    row = db.session.get(ProfileLocation, (int(profile.user_id), profile.role))
+    if place is None:
+        if row is not None:
+            db.session.delete(row)
+        return None
+    if row is None:
+        row = ProfileLocation(user_id=int(profile.user_id), role=profile.role)
+        db.session.add(row)
+    row.place, row.latitude, row.longitude = place.name, place.latitude, place.longitude
+    row.utc_offset, row.precision, row.updated_at = place.utc_offset, place.precision, datetime.utcnow()
+    return place
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance; arguments in radians, arrays welcome."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _cell_keys(latitudes, longitudes):
+    rows = np.clip(((np.asarray(latitudes) + 90) // CELL_DEGREES).astype(np.int64), 0, GRID_ROWS - 1)
+    columns = ((np.asarray(longitudes) + 180) // CELL_DEGREES).astype(np.int64) % GRID_COLUMNS
+    return rows * GRID_COLUMNS + columns
+
+
+def _unit_vectors(latitudes, longitudes):
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    return np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)
+
+
+def _key_ranges(row, first, last):
+    """Half-open key ranges of columns ``first..last`` of a row, split where they wrap at 180°."""
+    first, last = first % GRID_COLUMNS, last % GRID_COLUMNS
+    base = row * GRID_COLUMNS
+    if first <= last:
+        return [(base + first, base + last + 1)]
+    return [(base + first, base + GRID_COLUMNS), (base, base + last + 1)]
+
+
+def _cell_ranges(latitude, longitude, km):
+    """Key ranges a circle may touch: ``(whole, edge)``, wholly inside it and crossing its edge.
+
+    In each grid row the circle covers a run of columns: the cells whose four
+    corners are all inside it in the middle, edge cells on either side.
+    """
+    angle = km / EARTH_RADIUS_KM
+    lat_span = math.degrees(angle)
+    first_row = max(int((latitude - lat_span + 90) // CELL_DEGREES), 0)
+    last_row = min(int((latitude + lat_span + 90) // CELL_DEGREES), GRID_ROWS - 1)
+    rows = np.arange(first_row, last_row + 1)
+    cos_lat = math.cos(math.radians(latitude))
+    if angle >= math.pi / 2 or math.sin(angle) >= cos_lat:
+        # The circle reaches a pole (or half the globe): whole rows, checked point by point
+        return [], [(row * GRID_COLUMNS, (row + 1) * GRID_COLUMNS) for row in rows]
+
+    lon_span = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    first_column = int((longitude - lon_span + 180) // CELL_DEGREES)
+    last_column = int((longitude + lon_span + 180) // CELL_DEGREES)
+
+    # The farthest point of a lat/lon cell from the centre is one of its corners
+    corner_lat = np.radians(np.append(rows, last_row + 1) * CELL_DEGREES - 90)[:, None]
+    corner_lon = np.radians(np.arange(first_column, last_column + 2) * CELL_DEGREES - 180)[None, :]
+    lat0, lon0 = math.radians(latitude), math.radians(longitude)
+    corner_inside = (math.sin(lat0) * np.sin(corner_lat) +
+                     math.cos(lat0) * np.cos(corner_lat) * np.cos(corner_lon - lon0)) >= math.cos(angle)
+    cell_inside = corner_inside[:-1, :-1] & corner_inside[:-1, 1:] & corner_inside[1:, :-1] & corner_inside[1:, 1:]
+
+    any_inside = cell_inside.any(axis=1)
+    lefts = first_column + cell_inside.argmax(axis=1)
+    rights = last_column - cell_inside[:, ::-1].argmax(axis=1)
+    whole, edge = [], []
+    for row, has_inside, left, right in zip(rows.tolist(), any_inside.tolist(), lefts.tolist(), rights.tolist()):
+        if not has_inside:
+            edge += _key_ranges(row, first_column, last_column)
+            continue
+        if left > first_column:
+            edge += _key_ranges(row, first_column, left - 1)
+        whole += _key_ranges(row, left, right)
+        if right < last_column:
+            edge += _key_ranges(row, right + 1, last_column)
+    return whole, edge
+
+
+class _Points:
+    """One role's points: sorted by grid cell for radius queries and by UTC offset for timezones.
+
+    An entry replaced by a later save is tombstoned in place, so the sorted
+    arrays are only rebuilt by a merge.
+    """
+
+    def __init__(self, user_ids, latitudes, longitudes, offsets, placed):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.float32)
+        self.placed = np.asarray(placed, dtype=bool)
+        self.alive = np.ones(len(self.user_ids), dtype=bool)
+        self.dead = 0
+
+        spatial = np.flatnonzero(self.placed)
+        keys = _cell_keys(self.latitudes[spatial], self.longitudes[spatial])
+        order = np.argsort(keys, kind='stable')
+        cell_order = spatial[order]
+        self.keys = keys[order]
+        self.cell_ids = self.user_ids[cell_order]
+        self.cell_xyz = _unit_vectors(self.latitudes[cell_order], self.longitudes[cell_order])
+        self.cell_alive = np.ones(len(cell_order), dtype=bool)
+
+        tz_order = np.argsort(self.offsets, kind='stable')
+        self.tz_offsets = self.offsets[tz_order]
+        self.tz_ids = self.user_ids[tz_order]
+        self.tz_alive = np.ones(len(tz_order), dtype=bool)
+
+        # Where each entry sits in the two orders, by user id, for tombstoning
+        id_order = np.argsort(self.user_ids, kind='stable')
+        self.sorted_ids = self.user_ids[id_order]
+        self.entry_of = id_order.astype(np.int32)
+        self.cell_position = np.full(len(self.user_ids), -1, dtype=np.int32)
+        self.cell_position[cell_order] = np.arange(len(cell_order), dtype=np.int32)
+        self.tz_position = np.empty(len(self.user_ids), dtype=np.int32)
+        self.tz_position[tz_order] = np.arange(len(tz_order), dtype=np.int32)
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [])
+
+    def __len__(self):
+        return len(self.user_ids) - self.dead
+
+    def kill(self, user_id):
+        i = np.searchsorted(self.sorted_ids, user_id)
+        if i == len(self.sorted_ids) or self.sorted_ids[i] != user_id:
+            return
+        entry = self.entry_of[i]
+        if self.alive[entry]:
+            self.alive[entry] = False
+            self.dead += 1
+            self.tz_alive[self.tz_position[entry]] = False
+            if self.cell_position[entry] >= 0:
+                self.cell_alive[self.cell_position[entry]] = False
+
+    def live_entries(self):
+        return tuple(array[self.alive] for array in
+                     (self.user_ids, self.latitudes, self.longitudes, self.offsets, self.placed))
+
+    def within(self, latitude, longitude, km, cells):
+        """Ids within ``km`` of the point, given the circle's ``_cell_ranges``."""
+        whole, edge = cells
+        x, y, z = self.cell_xyz
+        x0, y0, z0 = _unit_vectors(latitude, longitude)
+        cos_angle = math.cos(km / EARTH_RADIUS_KM)
+        if len(self.keys) < SCAN_BELOW:
+            keep = x * x0 + y * y0 + z * z0 >= cos_angle
+            return self.cell_ids[keep & self.cell_alive if self.dead else keep]
+        if not whole and not edge:
+            return np.empty(0, dtype=np.int64)
+        bounds = np.searchsorted(self.keys, np.asarray(whole + edge, dtype=np.int64))
+        parts = []
+        for i, (start, end) in enumerate(bounds):
+            if start == end:
+                continue
+            keep = None
+            if i >= len(whole):
+                keep = x[start:end] * x0 + y[start:end] * y0 + z[start:end] * z0 >= cos_angle
+            if self.dead:
+                alive = self.cell_alive[start:end]
+                keep = alive if keep is None else keep & alive
+            parts.append(self.cell_ids[start:end] if keep is None else self.cell_ids[start:end][keep])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def in_timezone(self, utc_offset, hours):
+        """Ids whose offset is within ``hours`` of ``utc_offset``, wrapping at the date line."""
+        parts = []
+        for shift in (-24, 0, 24):
+            low = np.float32(utc_offset - hours + shift)
+            high = np.float32(utc_offset + hours + shift)
+            start = np.searchsorted(self.tz_offsets, low, 'left')
+            end = np.searchsorted(self.tz_offsets, high, 'right')
+            if start < end:
+                ids = self.tz_ids[start:end]
+                parts.append(ids[self.tz_alive[start:end]] if self.dead else ids)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        if len(parts) == 1:
+            return parts[0]
+        # The three windows only overlap when they span a whole day
+        return np.unique(np.concatenate(parts)) if hours >= 12 else np.concatenate(parts)
+
+
+class GeoIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._points = {role: _Points.empty() for role in ROLES}
+        # role -> {user_id: Place, or None once removed}: saves since the arrays were built
+        self._overlay = {role: {} for role in ROLES}
+        # role -> the overlay's places as points, rebuilt on the first query after a save
+        self._overlay_points = {}
+        self._since = datetime.utcnow()
+        self._checked = 0.0
+        self._applied = {}  # (role, user_id) -> the row's stamps, for rows read within the lag
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(self._points[role]) + len(self._recent(role)) for role in ROLES)
+
+    def update(self, role, user_id, place):
+        """Index a complete profile's place; None removes it (incomplete or unplaceable)."""
+        with self._lock:
+            self._points[role].kill(int(user_id))
+            self._overlay[role][int(user_id)] = place
+            self._overlay_points.pop(role, None)
+            if len(self._overlay[role]) >= MERGE_THRESHOLD:
+                self._merge(role)
+
+    def remove(self, role, user_id):
+        self.update(role, user_id, None)
+
+    def _recent(self, role):
+        if role not in self._overlay_points:
+            self._overlay_points[role] = _from_places(
+                {user_id: place for user_id, place in self._overlay[role].items() if place is not None}
+            )
+        return self._overlay_points[role]
+
+    def _merge(self, role):
+        merged = zip(self._points[role].live_entries(), self._recent(role).live_entries())
+        self._points[role] = _Points(*(np.concatenate(pair) for pair in merged))
+        self._overlay[role] = {}
+        self._overlay_points.pop(role, None)
+
+    def within(self, role, latitude, longitude, km):
+        """Ids of ``role`` profiles placed within ``km`` of the point, in no particular order."""
+        cells = _cell_ranges(latitude, longitude, km)
+        with self._lock:
+            ids = self._points[role].within(latitude, longitude, km, cells)
+            if self._overlay[role]:
+                recent = self._recent(role).within(latitude, longitude, km, cells)
+                if len(recent):
+                    ids = np.concatenate((ids, recent))
+        return ids
+
+    def in_timezone(self, role, utc_offset, hours):
+        """Ids of ``role`` profiles whose UTC offset is within ``hours`` of ``utc_offset``."""
+        with self._lock:
+            ids = self._points[role].in_timezone(utc_offset, hours)
+            if self._overlay[role]:
+                recent = self._recent(role).in_timezone(utc_offset, hours)
+                if len(recent):
+                    ids = np.concatenate((ids, recent))
+        return ids
+
+    def catch_up(self, force=False):
+        """Apply the saves other workers committed since the last look, at most every ``REFRESH_SECONDS``."""
+        if not force and time.monotonic() - self._checked < REFRESH_SECONDS:
+            return 0
+        self._checked = time.monotonic()
+        cutoff = self._since - CATCH_UP_LAG
+        profiles, users = UserProfile.__table__, User.__table__
+        locations = ProfileLocation.__table__
+        rows = db.session.execute(_profile_places().add_columns(
+            profiles.c.is_complete, profiles.c.updated_at.label('profile_updated_at'),
+            users.c.updated_at.label('user_updated_at'), locations.c.updated_at.label('location_updated_at')
+        ).where(or_(
+            profiles.c.updated_at > cutoff, users.c.updated_at > cutoff, locations.c.updated_at > cutoff
+        ))).all()
+        applied, latest = 0, self._since
+        for row in rows:
+            stamps = (row.profile_updated_at, row.user_updated_at, row.location_updated_at)
+            latest = max([latest] + [stamp for stamp in stamps if stamp is not None])
+            key = (row.role, row.user_id)
+            if row.role not in self._overlay or self._applied.get(key) == stamps:
+                continue
+            self._applied[key] = stamps
+            self.update(row.role, row.user_id, _place(row) if row.is_complete else None)
+            applied += 1
+        self._since = latest
+        cutoff = self._since - CATCH_UP_LAG
+        self._applied = {key: stamps for key, stamps in self._applied.items()
+                         if any(stamp is not None and stamp > cutoff for stamp in stamps)}
+        return applied
+
+    @classmethod
+    def from_places(cls, places):
+        """An index over ``{role: {user_id: Place}}``."""
+        index = cls()
+        for role, role_places in places.items():
+            index._points[role] = _from_places(role_places)
+        return index
+
+    @classmethod
+    def build(cls):
+        """Index every complete profile, geocoding those saved before ``profile_location`` existed."""
+        built_at = datetime.utcnow()
+        query = _profile_places().where(UserProfile.__table__.c.is_complete == True)
+        places = {role: {} for role in ROLES}
+        resolved = {}
+        for row in db.session.execute(query.execution_options(yield_per=10000)):
+            if row.role not in places:
+                continue
+            place = _place(row, resolved)
+            if place is not None:
+                places[row.role][row.user_id] = place
+        index = cls.from_places(places)
+        index._since = built_at
+        return index
+
+
+def _profile_places():
+    """Each profile with what placing it takes: its stored location, or the strings to geocode."""
+    profiles, users = UserProfile.__table__, User.__table__
+    locations = ProfileLocation.__table__
+    return select(
+        profiles.c.user_id, profiles.c.role, users.c.location,
+        profiles.c.geographic_preference, profiles.c.location_preference,
+        locations.c.latitude, locations.c.longitude, locations.c.utc_offset, locations.c.precision
+    ).select_from(
+        profiles.join(users, users.c.id == profiles.c.user_id).outerjoin(locations, and_(
+            locations.c.user_id == profiles.c.user_id, locations.c.role == profiles.c.role
+        ))
+    )
+
+
+def _place(row, resolved=None):
+    """The ``Place`` of a ``_profile_places`` row, geocoding it when nothing is stored."""
+    if row.latitude is not None:
+        return gazetteer.Place('', row.latitude, row.longitude, row.utc_offset, row.precision)
+    key = (row.role, row.location, row.geographic_preference, row.location_preference)
+    if resolved is None:
+        return resolve(*key)
+    if key not in resolved:
+        resolved[key] = resolve(*key)
+    return resolved[key]
+
+
+def _from_places(places):
+    places = list(places.items())
+    return _Points(
+        [user_id for user_id, _ in places],
+        [place.latitude for _, place in places],
+        [place.longitude for _, place in places],
+        [place.utc_offset for _, place in places],
+        [place.precision == 'city' for _, place in places]
+    )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide index, built from the database on first use and kept caught up."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = GeoIndex.build()
+    _index.catch_up()
+    return _index
+
+
+def update_profile(profile, place):
+    """Reflect a saved profile in the index, once its transaction has committed.
+
+    Before the first spatial query there is no index to update; its build
+    reads the stored location instead.
+    """
+    if _index is not None:
+        _index.update(profile.role, profile.user_id, place if profile.is_complete else None)
@@ -1,12 +1,48 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from a2wsgi import WSGIMiddleware
 from premium import router as premium_router
+from events import router as events_router
+from async_api import router as async_router
+from flask_app import create_app
+from src.services import async_db, db_routing, metrics, principal_cache, query_stats
+from contextlib import asynccontextmanager
 import api_profiles
+import asyncio
+import os
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    invalidations = asyncio.create_task(principal_cache.listen_for_invalidations())
+    yield
+    invalidations.cancel()
+    await async_db.dispose()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(query_stats.QueryStatsMiddleware)
+app.add_middleware(db_routing.ConsistencyMiddleware, primary_position=async_db.primary_position)
 
 # mount routes
 app.include_router(premium_router)
+app.include_router(events_router)
+app.include_router(api_profiles.router)
+
+# Hot reads served natively async; SPARKO_ASYNC_ROUTES=0 falls back to the Flask versions
+if os.environ.get("SPARKO_ASYNC_ROUTES", "1") != "0":
+    app.include_router(async_router)
+
+@app.exception_handler(async_db.PoolBusy)
+async def database_busy(request: Request, exc: async_db.PoolBusy):
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "1"})
 
 @app.get("/")
 def root():
     return {"message": "Sparko backend running"}
+
+# Per-process: scrape each worker, or run one worker per scrape target
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Everything else goes to the Flask blueprints on a bounded thread pool
+app.mount("/", WSGIMiddleware(create_app(), workers=int(os.environ.get("WSGI_WORKERS", 10))))
@@ -0,0 +1,169 @@
+"""Match list read model for /matches.
+
+A match card is the other party's user row and role profile plus the
+conversation's last message preview and the viewer's unread count. Cards are
+read in a single keyset-paginated query: the last-message fields are
+denormalized into ``match_activity`` by ``send_message``, and unread counts
+come from each participant's ``match_read_marker`` counted over the
+``(match_id, id)`` range of newer messages.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, or_, select
+
+from src.models.user import db, User, UserProfile, Match, Message
+from src.services import db_routing, serializers
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+PREVIEW_LENGTH = 140
+SORTS = ('created_at', 'activity')
+
+# The user1 side of the match list is a prefix of uq_match_pair; this covers the user2 side
+ix_match_user2 = db.Index('ix_match_user2', Match.user2_id, Match.user2_role)
+
+
+class MatchActivity(db.Model):
+    __tablename__ = 'match_activity'
+
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
+    last_message_id = db.Column(db.Integer)
+    last_sender_id = db.Column(db.Integer)
+    last_message_preview = db.Column(db.String(PREVIEW_LENGTH))
+    last_activity_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class MatchReadMarker(db.Model):
+    __tablename__ = 'match_read_marker'
+
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+def record_message(message):
+    """Denormalize a new message into its match's activity row (joins the caller's transaction)."""
+    activity = db.session.get(MatchActivity, message.match_id)
+    if not activity:
+        activity = MatchActivity(match_id=message.match_id)
+        db.session.add(activity)
+    activity.last_message_id = message.id
+    activity.last_sender_id = message.sender_id
+    activity.last_message_preview = message.content[:PREVIEW_LENGTH]
+    activity.last_activity_at = message.created_at or datetime.utcnow()
+
+
+@db_routing.primary()
+def mark_read(match_id, user_id, message_id):
+    """Advance a participant's read marker; never moves it backwards. Reads the marker from the primary."""
+    if not message_id:
+        return
+    marker = db.session.get(MatchReadMarker, (match_id, user_id))
+    if not marker:
+        db.session.add(MatchReadMarker(match_id=match_id, user_id=user_id, last_read_message_id=message_id))
+    elif marker.last_read_message_id < message_id:
+        marker.last_read_message_id = message_id
+
+
+async def mark_read_async(session, match_id, user_id, message_id):
+    """``mark_read`` for an ``AsyncSession``."""
+    if not message_id:
+        return
+    marker = await session.get(MatchReadMarker, (match_id, user_id))
+    if not marker:
+        session.add(MatchReadMarker(match_id=match_id, user_id=user_id, last_read_message_id=message_id))
+    elif marker.last_read_message_id < message_id:
+        marker.last_read_message_id = message_id
+
+
+def encode_cursor(sort, sort_value, match_id):
+    raw = f'{sort}|{sort_value.isoformat()}|{match_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, sort_value, match_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        if cursor_sort != sort:
+            raise ValueError
+        return datetime.fromisoformat(sort_value), int(match_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def match_page_statement(user_id, role, cursor=None, limit=PAGE_SIZE, sort='created_at'):
+    """The single SELECT behind ``match_page``; usable with sync and async sessions alike."""
+    if sort not in SORTS:
+        raise ValueError('Invalid sort')
+
+    is_user1 = Match.user1_id == user_id
+    other_id = case((is_user1, Match.user2_id), else_=Match.user1_id)
+    other_role = case((is_user1, Match.user2_role), else_=Match.user1_role)
+
+    sort_column = Match.created_at
+    if sort == 'activity':
+        sort_column = func.coalesce(MatchActivity.last_activity_at, Match.created_at)
+
+    unread = select(func.count(Message.id)).where(and_(
+        Message.match_id == Match.id,
+        Message.id > func.coalesce(MatchReadMarker.last_read_message_id, 0),
+        Message.sender_id != user_id
+    )).correlate(Match, MatchReadMarker).scalar_subquery()
+
+    statement = select(
+        Match, User, UserProfile, MatchActivity, unread.label('unread_count'), sort_column.label('sort_value')
+    ).join(
+        User, User.id == other_id
+    ).join(
+        UserProfile, and_(UserProfile.user_id == other_id, UserProfile.role == other_role)
+    ).outerjoin(
+        MatchActivity, MatchActivity.match_id == Match.id
+    ).outerjoin(
+        MatchReadMarker, and_(MatchReadMarker.match_id == Match.id, MatchReadMarker.user_id == user_id)
+    ).where(
+        or_(
+            and_(Match.user1_id == user_id, Match.user1_role == role),
+            and_(Match.user2_id == user_id, Match.user2_role == role)
+        )
+    )
+
+    if cursor:
+        sort_value, match_id = decode_cursor(cursor, sort)
+        statement = statement.where(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, Match.id < match_id)
+        ))
+
+    return statement.order_by(sort_column.desc(), Match.id.desc()).limit(clamp_limit(limit) + 1)
+
+
+def clamp_limit(limit):
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def page_from_rows(rows, user_id, limit=PAGE_SIZE, sort='created_at', fields=None):
+    """Turn the rows of ``match_page_statement`` into ``(cards, next_cursor)``."""
+    serializer = serializers.MATCH_CARD.only(fields)
+    limit = clamp_limit(limit)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, last.sort_value, last.Match.id)
+
+    return serializer.many(rows, viewer_id=int(user_id)), next_cursor
+
+
+def match_page(user_id, role, cursor=None, limit=PAGE_SIZE, sort='created_at', fields=None):
+    """Return ``(cards, next_cursor)`` for the viewer's matches in ``role``, newest first.
+
+    ``fields`` is an optional sparse fieldset of card keys (see ``serializers.MATCH_CARD``).
+    """
+    serializers.MATCH_CARD.only(fields)  # reject unknown fields before querying
+    statement = match_page_statement(user_id, role, cursor, limit, sort)
+    rows = db.session.execute(statement).all()
+    return page_from_rows(rows, user_id, limit, sort, fields)
@@ -1,19 +1,21 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import db, User, UserProfile, Swipe, Match
-from sqlalchemy import and_, or_
-from datetime import datetime, timedelta
-import random
+from src.services import db_routing, discovery_queue, gazetteer, geo_index, match_cards, principal_cache, profile_index, realtime, serializers, super_sparks, swipe_buffer, swipe_pipeline, text_index, vector_index
+from sqlalchemy import and_, or_, select
+from datetime import datetime
+import numpy as np
 
 matching_bp = Blueprint('matching', __name__)
 
 @matching_bp.route('/discover', methods=['GET'])
 @jwt_required()
+@db_routing.replica_reads
 def discover_profiles():
     """Discover profiles based on current user role"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = principal_cache.current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -39,45 +41,159 @@ def discover_profiles():
         else:
             return jsonify({'error': 'Invalid role'}), 400
         
-        # Get users who have been swiped by current user in current role
-        swiped_user_ids = db.session.query(Swipe.swiped_id).filter(
-            and_(
-                Swipe.swiper_id == user_id,
-                Swipe.swiper_role == current_role,
-                Swipe.swiped_role == target_role
+        try:
+            limit = int(request.args.get('limit', discovery_queue.PAGE_SIZE))
+            serializer = serializers.DISCOVER_CARD.only(serializers.requested_fields())
+            target_profiles, next_cursor = discovery_queue.next_page(
+                user_id, current_role, cursor=request.args.get('cursor'), limit=limit
             )
-        ).subquery()
-        
-        # Find users with complete profiles in target role, excluding already swiped
-        target_profiles = db.session.query(UserProfile, User).join(
-            User, UserProfile.user_id == User.id
-        ).filter(
-            and_(
-                UserProfile.role == target_role,
-                UserProfile.is_complete == True,
-                UserProfile.user_id != user_id,
-                ~UserProfile.user_id.in_(swiped_user_ids)
-            )
-        ).limit(10).all()
-        
-        profiles = []
-        for profile, profile_user in target_profiles:
-            profile_data = profile.to_dict()
-            profile_data.update({
-                'name': profile_user.name,
-                'age': profile_user.age,
-                'location': profile_user.location,
-                'photo_url': profile_user.photo_url or f"https://images.unsplash.com/photo-{random.choice(['1494790108755-2616b612b786', '1472099645785-5658abf4ff4e', '1438761681033-6461ffad8d80', '1507003211169-0a1dd7228f2d', '1489424731084-a5d8b219a5bb', '1560250097-0b93528c311a'])}?w=400&h=400&fit=crop&crop=face"
-            })
-            profiles.append(profile_data)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid cursor, limit or fields: {e}'}), 400
         
-        return jsonify({
+        profiles = serializer.many(target_profiles)
+        
+        return serializers.render({
             'profiles': profiles,
             'current_role': current_role,
             'target_role': target_role,
+            'next_cursor': next_cursor,
             'message': f'Swipe right to connect with {target_role}s' if profiles else 'No more profiles'
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _profile_cards(role, user_ids, **values):
+    """Profile dicts with the user's name, age, location and photo, in ``user_ids`` order.
+
+    Each keyword maps user ids to a value the dicts carry under that name.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    rows = db.session.query(UserProfile, User).join(
+        User, UserProfile.user_id == User.id
+    ).filter(
+        UserProfile.role == role,
+        UserProfile.user_id.in_(user_ids)
+    ).all() if user_ids else []
+    rows.sort(key=lambda row: user_ids.index(row[0].user_id))
+    
+    profiles = []
+    for profile, profile_user in rows:
+        profile_data = profile.to_dict()
+        profile_data.update({
+            'name': profile_user.name,
+            'age': profile_user.age,
+            'location': profile_user.location,
+            'photo_url': profile_user.photo_url
+        })
+        for name, by_id in values.items():
+            profile_data[name] = round(by_id[profile.user_id], 4)
+        profiles.append(profile_data)
+    return profiles
+
+@matching_bp.route('/search', methods=['GET'])
+@jwt_required()
+@db_routing.replica_reads
+def search_profiles():
+    """Filter complete profiles of a role by tags, e.g. ?role=entrepreneur&skills=AI&industry=fintech&stage=seed
+
+    ``within_km`` and ``timezone_hours`` narrow to profiles near, or within
+    that many hours of the UTC offset of, ``near`` (a place name, defaulting
+    to the viewer's location): ?role=investor&within_km=100&timezone_hours=2
+
+    ``q`` ranks the matches by BM25 relevance of their tagline, bio, project
+    description and past investments, best first, with a ``score`` each:
+    ?role=entrepreneur&q=climate+hardware&stage=seed
+    """
+    try:
+        role = request.args.get('role')
+        if role not in ['entrepreneur', 'investor', 'partner']:
+            return jsonify({'error': 'Invalid role'}), 400
+        
+        filters = {
+            name: request.args.getlist(name)
+            for name in profile_index.FILTER_FIELDS
+            if name in request.args
+        }
+        limit = min(int(request.args.get('limit', 20)), 100)
+        offset = int(request.args.get('offset', 0))
+        if offset < 0 or limit < 0:
+            raise ValueError('offset and limit must not be negative')
+
+        query = request.args.get('q', '').strip()
+        
+        # Without tag filters a text query needs no candidate list: the text index knows completeness
+        user_ids = profile_index.get_index().search(role, **filters) if filters or not query else None
+        if 'within_km' in request.args or 'timezone_hours' in request.args:
+            place = gazetteer.geocode(request.args.get('near') or principal_cache.current_user().location)
+            if place is None:
+                return jsonify({'error': 'Unknown location'}), 400
+            index = geo_index.get_index()
+            if 'within_km' in request.args:
+                nearby = index.within(role, place.latitude, place.longitude, float(request.args['within_km']))
+                user_ids = nearby if user_ids is None else np.asarray(user_ids, dtype=np.int64)[np.isin(user_ids, nearby)]
+            if 'timezone_hours' in request.args:
+                same_hours = index.in_timezone(role, place.utc_offset, float(request.args['timezone_hours']))
+                user_ids = same_hours if user_ids is None else np.asarray(user_ids, dtype=np.int64)[np.isin(user_ids, same_hours)]
+            user_ids = np.asarray(user_ids).tolist()
+        
+        scores = {}
+        if query:
+            page_ids, page_scores, total = text_index.get_index().search(
+                query, role, allowed=user_ids, offset=offset, limit=limit
+            )
+            scores = dict(zip(page_ids, page_scores))
+        else:
+            page_ids, total = user_ids[offset:offset + limit], len(user_ids)
+        
+        profiles = _profile_cards(role, page_ids, score=scores) if query else _profile_cards(role, page_ids)
+        
+        return jsonify({
+            'profiles': profiles,
+            'total': total,
+            'offset': offset,
+            'limit': limit
         }), 200
         
+    except ValueError:
+        return jsonify({'error': 'Invalid limit, offset, within_km or timezone_hours'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@matching_bp.route('/similar/<int:user_id>', methods=['GET'])
+@jwt_required()
+@db_routing.replica_reads
+def similar_profiles(user_id):
+    """Complete profiles of a role whose text reads most like the given user's, e.g. /similar/42?role=investor
+
+    ``role`` defaults to that user's current role. Each profile carries the
+    cosine ``similarity`` of the two text embeddings, best first.
+    """
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+        role = request.args.get('role')
+        if not role:
+            user = db.session.get(User, user_id)
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            role = user.current_role
+        if role not in ['entrepreneur', 'investor', 'partner']:
+            return jsonify({'error': 'Invalid role'}), 400
+        
+        index = vector_index.get_index()
+        found = index.similar(role, user_id, limit) if index is not None else None
+        if found is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        similar_ids, similarities = found
+        profiles = _profile_cards(
+            role, similar_ids, similarity=dict(zip(similar_ids.tolist(), similarities.tolist()))
+        )
+        
+        return jsonify({'profiles': profiles, 'role': role}), 200
+        
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -98,152 +214,104 @@ def swipe_profile():
         if action not in ['like', 'skip', 'super_spark']:
             return jsonify({'error': 'Invalid action'}), 400
         
-        user = User.query.get(user_id)
-        swiped_user = User.query.get(swiped_user_id)
-        
-        if not user or not swiped_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        current_role = user.current_role
-        
-        # Determine target role
-        if current_role == 'entrepreneur':
-            target_role = 'investor'
-        elif current_role == 'investor':
-            target_role = 'entrepreneur'
-        elif current_role == 'partner':
-            target_role = 'partner'
-        else:
-            return jsonify({'error': 'Invalid role'}), 400
-        
-        # Check if already swiped
-        existing_swipe = Swipe.query.filter_by(
-            swiper_id=user_id,
-            swiped_id=swiped_user_id,
-            swiper_role=current_role,
-            swiped_role=target_role
-        ).first()
+        try:
+            swiped_user_id = int(swiped_user_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid user_id'}), 400
         
-        if existing_swipe:
-            return jsonify({'error': 'Already swiped on this profile'}), 400
+        try:
+            result = swipe_pipeline.record_swipe(int(user_id), swiped_user_id, action)
+        except swipe_pipeline.SwipeError as e:
+            return jsonify({'error': e.message}), e.status_code
         
-        # Handle super spark
         if action == 'super_spark':
-            if user.super_spark_count <= 0:
-                return jsonify({'error': 'No super sparks remaining'}), 400
-            user.super_spark_count -= 1
-        
-        # Create swipe record
-        swipe = Swipe(
-            swiper_id=user_id,
-            swiped_id=swiped_user_id,
-            swiper_role=current_role,
-            swiped_role=target_role,
-            action=action
-        )
-        db.session.add(swipe)
-        
-        # Check for match if action is like or super_spark
-        match_created = False
-        if action in ['like', 'super_spark']:
-            # Check if the other user has liked back
-            reverse_swipe = Swipe.query.filter_by(
-                swiper_id=swiped_user_id,
-                swiped_id=user_id,
-                swiper_role=target_role,
-                swiped_role=current_role,
-                action='like'
-            ).first() or Swipe.query.filter_by(
-                swiper_id=swiped_user_id,
-                swiped_id=user_id,
-                swiper_role=target_role,
-                swiped_role=current_role,
-                action='super_spark'
-            ).first()
-            
-            if reverse_swipe:
-                # Create match
-                match = Match(
-                    user1_id=min(user_id, swiped_user_id),
-                    user2_id=max(user_id, swiped_user_id),
-                    user1_role=current_role if user_id < swiped_user_id else target_role,
-                    user2_role=target_role if user_id < swiped_user_id else current_role
-                )
-                db.session.add(match)
-                match_created = True
-        
-        db.session.commit()
+            principal_cache.invalidate_user(user_id)
         
         response_data = {
             'message': 'Swipe recorded successfully',
-            'match': match_created,
-            'super_spark_count': user.super_spark_count
+            'match': result.match_id is not None,
+            'super_spark_count': result.super_spark_count
         }
         
-        if match_created:
+        if result.match_id is not None:
             response_data['message'] = "It's a match! 🎉"
+            response_data['match_id'] = result.match_id
+            realtime.publish_to_users([int(user_id), int(swiped_user_id)], 'match', {'match_id': result.match_id})
         
         return jsonify(response_data), 200
         
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@matching_bp.route('/swipe/batch', methods=['POST'])
+@jwt_required()
+def swipe_batch():
+    """Record an ordered list of swipes: {"swipes": [{"user_id": 1, "action": "like"}, ...]}"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
+        items = data.get('swipes') if data else None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Missing required fields'}), 400
+        
+        if len(items) > swipe_buffer.MAX_BATCH:
+            return jsonify({'error': f'At most {swipe_buffer.MAX_BATCH} swipes per batch'}), 400
+        
+        try:
+            results, super_spark_count = swipe_buffer.record_batch(int(user_id), items)
+        except swipe_pipeline.SwipeError as e:
+            return jsonify({'error': e.message}), e.status_code
+        
+        if any(result['action'] == 'super_spark' and result['status'] == 'accepted' for result in results):
+            principal_cache.invalidate_user(user_id)
+        
+        for result in results:
+            if result['match']:
+                realtime.publish_to_users([int(user_id), result['user_id']], 'match', {'match_id': result['match_id']})
+        
+        return jsonify({
+            'results': results,
+            'matches': [result['match_id'] for result in results if result['match']],
+            'super_spark_count': super_spark_count
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @matching_bp.route('/matches', methods=['GET'])
 @jwt_required()
+@db_routing.replica_reads
 def get_matches():
     """Get matches for current user and role"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = principal_cache.current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         current_role = user.current_role
         
-        # Get matches where user is involved in current role
-        matches = Match.query.filter(
-            or_(
-                and_(Match.user1_id == user_id, Match.user1_role == current_role),
-                and_(Match.user2_id == user_id, Match.user2_role == current_role)
+        try:
+            limit = int(request.args.get('limit', match_cards.PAGE_SIZE))
+            match_list, next_cursor = match_cards.match_page(
+                user_id, current_role,
+                cursor=request.args.get('cursor'),
+                limit=limit,
+                sort=request.args.get('sort', 'created_at'),
+                fields=serializers.requested_fields()
             )
-        ).all()
-        
-        match_list = []
-        for match in matches:
-            # Determine the other user
-            if match.user1_id == user_id:
-                other_user_id = match.user2_id
-                other_role = match.user2_role
-            else:
-                other_user_id = match.user1_id
-                other_role = match.user1_role
-            
-            other_user = User.query.get(other_user_id)
-            other_profile = UserProfile.query.filter_by(
-                user_id=other_user_id,
-                role=other_role
-            ).first()
-            
-            if other_user and other_profile:
-                match_data = {
-                    'match_id': match.id,
-                    'user': {
-                        'id': other_user.id,
-                        'name': other_user.name,
-                        'photo_url': other_user.photo_url,
-                        'role': other_role
-                    },
-                    'profile': other_profile.to_dict(),
-                    'created_at': match.created_at.isoformat(),
-                    'chat_unlocked': match.chat_unlocked
-                }
-                match_list.append(match_data)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid cursor, sort, limit or fields: {e}'}), 400
         
-        return jsonify({
+        return serializers.render({
             'matches': match_list,
-            'current_role': current_role
-        }), 200
+            'current_role': current_role,
+            'next_cursor': next_cursor
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -251,34 +319,28 @@ def get_matches():
 @matching_bp.route('/super-spark/reset', methods=['POST'])
 @jwt_required()
 def reset_super_sparks():
-    """Reset super sparks if a week has passed"""
+    """Report the super spark balance; the weekly refill is applied lazily by super_sparks"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        balance = db.session.execute(
+            select(User.super_spark_count, User.super_spark_reset_date).where(User.id == int(user_id))
+        ).first()
         
-        if not user:
+        if not balance:
             return jsonify({'error': 'User not found'}), 404
         
         now = datetime.utcnow()
-        week_ago = now - timedelta(days=7)
-        
-        if user.super_spark_reset_date < week_ago:
-            user.super_spark_count = 3
-            user.super_spark_reset_date = now
-            db.session.commit()
-            
-            return jsonify({
-                'message': 'Super sparks reset successfully',
-                'super_spark_count': user.super_spark_count
-            }), 200
+        status = super_sparks.status(balance, now)
+        status['reset'] = super_sparks.refilled(balance.super_spark_count, balance.super_spark_reset_date, now)
+        if status['reset']:
+            status['message'] = 'Super sparks reset successfully'
+        elif status['super_spark_count'] == super_sparks.WEEKLY_QUOTA:
+            status['message'] = 'Super sparks are already full'
         else:
-            return jsonify({
-                'message': 'Super sparks not ready for reset',
-                'super_spark_count': user.super_spark_count,
-                'next_reset': (user.super_spark_reset_date + timedelta(days=7)).isoformat()
-            }), 200
+            status['message'] = 'Super sparks not ready for reset'
+        
+        return jsonify(status), 200
             
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
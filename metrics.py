@@ -0,0 +1,139 @@
+"""Lightweight in-process metrics shared by the service modules, rendered for Prometheus by ``render()``."""
+import bisect
+import threading
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus-style cumulative ``le`` buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + [float('inf')], self.counts):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+            return {'buckets': buckets, 'sum': self.total, 'count': self.count}
+
+
+class LabeledHistogram:
+    """A family of ``Histogram``s keyed by label values."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames, buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def lines(self):
+        lines = []
+        for values, child in sorted(self._children.items()):
+            lines.extend(histogram_lines(self.name, dict(zip(self.labelnames, values)), child.snapshot()))
+        return lines
+
+
+class LabeledCounter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{format_labels(dict(zip(self.labelnames, values)))} {value}' for values, value in items]
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_families = []
+_sources = {}
+_registry_lock = threading.Lock()
+
+
+def register(family):
+    with _registry_lock:
+        _families.append(family)
+    return family
+
+
+def register_source(name, stats, counters=()):
+    """Export ``stats()`` on /metrics as ``sparko_<name>_<key>`` series.
+
+    ``stats`` returns a flat dict of numbers and ``Histogram.snapshot()``s,
+    like the ``stats()`` methods of the service singletons; keys listed in
+    ``counters`` are exported as counters, other numbers as gauges.
+    """
+    with _registry_lock:
+        _sources[name] = (stats, frozenset(counters))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def histogram_lines(name, labels, snapshot):
+    lines = [f'{name}_bucket{format_labels(dict(labels, le=bound))} {count}'
+             for bound, count in snapshot['buckets'].items()]
+    lines.append(f'{name}_sum{format_labels(labels)} {snapshot["sum"]}')
+    lines.append(f'{name}_count{format_labels(labels)} {snapshot["count"]}')
+    return lines
+
+
+def render():
+    """Every registered family and source in the Prometheus text exposition format."""
+    with _registry_lock:
+        families, sources = list(_families), sorted(_sources.items())
+    out = []
+    for family in families:
+        out += [f'# HELP {family.name} {family.help}', f'# TYPE {family.name} {family.type}']
+        out += family.lines()
+    for source, (stats, counters) in sources:
+        for key, value in stats().items():
+            name = f'sparko_{source}_{key}'
+            if isinstance(value, dict) and 'buckets' in value:
+                out.append(f'# TYPE {name} histogram')
+                out += histogram_lines(name, {}, value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                if key in counters:
+                    out += [f'# TYPE {name}_total counter', f'{name}_total {value}']
+                else:
+                    out += [f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(out) + '\n'
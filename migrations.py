@@ -0,0 +1,229 @@
+"""Versioned schema migrations.
+
+Usage: python -m src.services.migrations [--database-url URL] [--status]
+
+``db.create_all()`` creates missing tables together with their indexes but
+never alters a table that already exists, so an index declared after a
+deployment's tables were created never reaches that deployment. Each
+migration is a numbered step, applied once and in order by ``upgrade()``,
+and recorded in ``schema_migrations``. Run it from this module before
+starting the workers; ``create_app`` only calls it (after ``create_all``)
+when ``SPARKO_MIGRATE_ON_START=1``, for development. On a fresh database
+``create_all`` has already made everything, and the steps are no-ops that
+only get recorded.
+
+Migrations spell out their DDL instead of reusing the model-level
+``db.Index`` objects, so an old step keeps doing what it did when the model
+changes later. On PostgreSQL indexes are built ``CONCURRENTLY`` so writes to
+a live table are not blocked. That can't run inside a transaction, so steps
+there run in autocommit under an advisory lock that keeps two workers from
+migrating at once, and data fixes in them open their own transaction. A
+concurrent build that failed leaves an invalid index
+behind, and it is dropped and rebuilt on the next run. Elsewhere each step
+is one transaction.
+"""
+import argparse
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+
+# Arbitrary, but fixed: every worker must contend for the same advisory lock
+LOCK_KEY = 0x5370_6172_6B6F
+
+schema_migrations = db.Table(
+    'schema_migrations', db.metadata,
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False)
+)
+
+Migration = namedtuple('Migration', 'version description upgrade')
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(upgrade):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, 'migrations must be declared in order'
+        MIGRATIONS.append(Migration(version, description, upgrade))
+        return upgrade
+    return register
+
+
+def _postgres(connection):
+    return connection.dialect.name == 'postgresql'
+
+
+@contextmanager
+def _transaction(connection):
+    """Run the block as one transaction; a PostgreSQL step is in autocommit, elsewhere it is one already."""
+    if not _postgres(connection):
+        yield
+        return
+    connection.execute(text('BEGIN'))
+    try:
+        yield
+    except Exception:
+        connection.execute(text('ROLLBACK'))
+        raise
+    connection.execute(text('COMMIT'))
+
+
+def _index_columns(connection, table, name):
+    """The columns of index ``name`` on ``table`` in order, or None if there is no such index."""
+    for index in inspect(connection).get_indexes(table):
+        if index['name'] == name:
+            return index['column_names']
+    return None
+
+
+def create_index(connection, name, table, columns, unique=False):
+    if _postgres(connection):
+        invalid = connection.execute(text(
+            'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = :name AND NOT i.indisvalid'
+        ), {'name': name}).first()
+        if invalid:
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    concurrently = ' CONCURRENTLY' if _postgres(connection) else ''
+    connection.execute(text(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX{concurrently} IF NOT EXISTS {name} '
+        f'ON "{table}" ({", ".join(columns)})'
+    ))
+
+
+def drop_index(connection, name):
+    concurrently = ' CONCURRENTLY' if _postgres(connection) else ''
+    connection.execute(text(f'DROP INDEX{concurrently} IF EXISTS {name}'))
+
+
+def _delete_duplicate_swipes(connection):
+    """Keep the first of each repeated swipe; the old read-before-write check let races through."""
+    connection.execute(text(
+        'DELETE FROM swipe WHERE id NOT IN ('
+        'SELECT min(id) FROM swipe GROUP BY swiper_id, swiped_id, swiper_role, swiped_role)'
+    ))
+
+
+def _merge_duplicate_matches(connection):
+    """Fold repeated matches for one pair into the first, moving their messages over."""
+    duplicates = connection.execute(text(
+        'SELECT m.id, k.keep_id FROM "match" m JOIN ('
+        'SELECT min(id) AS keep_id, user1_id, user2_id, user1_role, user2_role FROM "match" '
+        'GROUP BY user1_id, user2_id, user1_role, user2_role HAVING count(*) > 1'
+        ') k ON m.user1_id = k.user1_id AND m.user2_id = k.user2_id '
+        'AND m.user1_role = k.user1_role AND m.user2_role = k.user2_role '
+        'WHERE m.id <> k.keep_id'
+    )).all()
+    for duplicate_id, keep_id in duplicates:
+        params = {'duplicate_id': duplicate_id, 'keep_id': keep_id}
+        connection.execute(text('UPDATE message SET match_id = :keep_id WHERE match_id = :duplicate_id'), params)
+        connection.execute(text('DELETE FROM match_activity WHERE match_id = :duplicate_id'), params)
+        connection.execute(text('DELETE FROM match_read_marker WHERE match_id = :duplicate_id'), params)
+        connection.execute(text('DELETE FROM "match" WHERE id = :duplicate_id'), params)
+
+
+@migration(1, 'indexes declared before versioned migrations')
+def _existing_indexes(connection):
+    create_index(connection, 'ix_message_match_id', 'message', ['match_id', 'id'])
+    create_index(connection, 'uq_discovery_queue_candidate', 'discovery_queue',
+                 ['user_id', 'role', 'candidate_id'], unique=True)
+    if _index_columns(connection, 'swipe', 'uq_swipe_once') is None:
+        with _transaction(connection):
+            _delete_duplicate_swipes(connection)
+        create_index(connection, 'uq_swipe_once', 'swipe',
+                     ['swiper_id', 'swiped_id', 'swiper_role', 'swiped_role'], unique=True)
+    if _index_columns(connection, 'match', 'uq_match_pair') is None:
+        with _transaction(connection):
+            _merge_duplicate_matches(connection)
+        create_index(connection, 'uq_match_pair', 'match',
+                     ['user1_id', 'user2_id', 'user1_role', 'user2_role'], unique=True)
+
+
+@migration(2, 'hot query indexes: seen-set order for uq_swipe_once, profile and match lookups')
+def _hot_query_indexes(connection):
+    seen_order = ['swiper_id', 'swiper_role', 'swiped_role', 'swiped_id']
+    if _index_columns(connection, 'swipe', 'uq_swipe_once') != seen_order:
+        if _postgres(connection):
+            # Build the replacement first so swipes are never left without the dedupe index
+            create_index(connection, 'uq_swipe_once_v2', 'swipe', seen_order, unique=True)
+            drop_index(connection, 'uq_swipe_once')
+            connection.execute(text('ALTER INDEX uq_swipe_once_v2 RENAME TO uq_swipe_once'))
+        else:
+            drop_index(connection, 'uq_swipe_once')
+            create_index(connection, 'uq_swipe_once', 'swipe', seen_order, unique=True)
+    create_index(connection, 'ix_user_profile_user_role', 'user_profile', ['user_id', 'role'])
+    create_index(connection, 'ix_match_user2', 'match', ['user2_id', 'user2_role'])
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {row.version: row for row in connection.execute(select(schema_migrations))}
+
+
+def upgrade(engine, log=None):
+    """Apply pending migrations in order; returns the versions applied."""
+    applied = []
+    with engine.connect() as connection:
+        postgres = _postgres(connection)
+        if postgres:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+        try:
+            done = applied_versions(connection)
+            connection.commit()
+            for step in MIGRATIONS:
+                if step.version in done:
+                    continue
+                if log:
+                    log(f'migration {step.version}: {step.description}')
+                try:
+                    step.upgrade(connection)
+                except Exception:
+                    connection.rollback()
+                    raise
+                try:
+                    connection.execute(schema_migrations.insert().values(
+                        version=step.version, description=step.description, applied_at=datetime.utcnow()
+                    ))
+                    connection.commit()
+                except IntegrityError:
+                    # Another worker recorded it first (no advisory lock outside PostgreSQL)
+                    connection.rollback()
+                    continue
+                applied.append(step.version)
+        finally:
+            if postgres:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+    return applied
+
+
+def main():
+    from src.services.async_db import database_url
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--status', action='store_true', help='list migrations without applying any')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url or database_url())
+    if args.status:
+        with engine.connect() as connection:
+            done = applied_versions(connection)
+            connection.commit()
+        for step in MIGRATIONS:
+            row = done.get(step.version)
+            state = f'applied {row.applied_at:%Y-%m-%d %H:%M}' if row else 'pending'
+            print(f'{step.version:>4}  {state:<24} {step.description}')
+    else:
+        applied = upgrade(engine, log=print)
+        print(f'applied {len(applied)} migration(s)' if applied else 'up to date')
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
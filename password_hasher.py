@@ -0,0 +1,151 @@
+"""Password hashing off the request thread.
+
+bcrypt runs in a dedicated, bounded process pool so a burst of logins can
+use at most ``PASSWORD_HASH_WORKERS`` cores instead of every request worker.
+Admission control caps the work in flight at ``PASSWORD_HASH_MAX_QUEUE``;
+beyond that requests fail fast with ``HasherOverloaded`` (503 + Retry-After)
+rather than queueing behind each other and holding request workers. A slot
+is held until its hash finishes in the pool, also when the request gave up
+waiting after ``PASSWORD_HASH_TIMEOUT``.
+
+The bcrypt cost is ``BCRYPT_ROUNDS``. Hashes made with a different cost
+still verify, and ``needs_rehash`` tells /login to re-hash them transparently.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+from flask import current_app
+
+from src.services import metrics
+from src.services.metrics import LATENCY_BUCKETS, Histogram
+
+DEFAULT_ROUNDS = 12
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_MAX_QUEUE = DEFAULT_WORKERS * 4
+DEFAULT_TIMEOUT = 10.0
+
+
+class HasherOverloaded(Exception):
+    pass
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+def hash_rounds(hashed):
+    """Cost factor of a ``$2b$<cost>$...`` hash, or None if it isn't bcrypt."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE,
+                 rounds=DEFAULT_ROUNDS, timeout=DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.timeout = timeout
+        # spawn: children must not inherit the parent's database connections
+        self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherOverloaded('Password hashing is overloaded, retry shortly')
+
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._done(started)
+            raise
+        future.add_done_callback(lambda _: self._done(started))
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # Frees the slot now if the pool hasn't started it; otherwise it frees when it finishes
+            future.cancel()
+            raise HasherOverloaded('Password hashing timed out, retry shortly')
+
+    def _done(self, started):
+        self.latency.observe(time.perf_counter() - started)
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, password, hashed):
+        if not hashed:
+            return False
+        return self._run(_check, password, hashed)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_depth': self.in_flight,
+            'max_queue': self.max_queue,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'latency_seconds': self.latency.snapshot()
+        }
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                config = current_app.config
+                _hasher = PasswordHasher(
+                    workers=config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS),
+                    max_queue=config.get('PASSWORD_HASH_MAX_QUEUE', DEFAULT_MAX_QUEUE),
+                    rounds=config.get('BCRYPT_ROUNDS', DEFAULT_ROUNDS),
+                    timeout=config.get('PASSWORD_HASH_TIMEOUT', DEFAULT_TIMEOUT)
+                )
+                metrics.register_source('password_hasher', _hasher.stats, counters=('rejected', 'completed'))
+    return _hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def check_password(password, hashed):
+    return get_hasher().check(password, hashed)
+
+
+def needs_rehash(hashed):
+    return get_hasher().needs_rehash(hashed)
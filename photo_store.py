@@ -0,0 +1,225 @@
+"""Profile photo pipeline and content-addressed variant store.
+
+An upload is addressed by the SHA-256 of its bytes (plus ``PIPELINE_VERSION``,
+so changing the variant recipe produces new URLs). The original is written
+under ``PHOTO_ROOT/<aa>/<digest>/`` and resized in a background process
+pool into fixed variants: a 480x600 ``card`` and a 160x160 ``thumb``, each
+as JPEG and WebP. Because a digest's files never change, they are served
+with an immutable one-year ``Cache-Control``.
+
+``photo_url`` holds the variant-neutral URL ``/api/photos/<digest>/card``;
+the serving route picks WebP or JPEG from the ``Accept`` header, and
+``variant_url`` swaps ``card`` for ``thumb`` where a list only needs a thumbnail.
+
+A failed render is recorded next to the original in ``failed.json`` with its
+attempt count and the earliest next try, ``RENDER_RETRY_SECONDS`` doubling
+per attempt; after ``MAX_RENDER_ATTEMPTS`` the photo is given up on and the
+serving route stops answering "still processing".
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+from src.services import metrics
+
+PIPELINE_VERSION = 1
+URL_PREFIX = '/api/photos'
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+ACCEPTED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+DEFAULT_WORKERS = 2
+MAX_RENDER_ATTEMPTS = 3
+RENDER_RETRY_SECONDS = 30
+
+# name -> (width, height); images are centre-cropped to fill the box
+VARIANTS = {
+    'card': (480, 600),
+    'thumb': (160, 160)
+}
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+ORIGINAL = 'original'
+FAILURE_FILE = 'failed.json'
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+def photo_digest(data):
+    return hashlib.sha256(b'sparko-photo-v%d:' % PIPELINE_VERSION + data).hexdigest()
+
+
+def photo_dir(root, digest):
+    return os.path.join(root, digest[:2], digest)
+
+
+def variant_path(root, digest, variant, extension):
+    return os.path.join(photo_dir(root, digest), f'{variant}.{extension}')
+
+
+def photo_url(digest, variant='card'):
+    return f'{URL_PREFIX}/{digest}/{variant}'
+
+
+def variant_url(url, variant):
+    """Point one of our photo URLs at another variant; other URLs pass through unchanged."""
+    if not url or not url.startswith(URL_PREFIX + '/'):
+        return url
+    return url.rsplit('/', 1)[0] + '/' + variant
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def validate(data):
+    """Cheap header-only check run on the request thread; raises InvalidPhoto."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise InvalidPhoto(f'Photo must be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB')
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise InvalidPhoto('Photo must be a JPEG, PNG or WebP image')
+            if image.width * image.height > MAX_PIXELS:
+                raise InvalidPhoto('Photo dimensions are too large')
+    except (OSError, Image.DecompressionBombError):
+        raise InvalidPhoto('File is not a readable image')
+
+
+def render_variants(root, digest):
+    """Worker-process entry point: decode the original once and write every variant."""
+    with open(variant_path(root, digest, ORIGINAL, 'bin'), 'rb') as f:
+        image = Image.open(io.BytesIO(f.read()))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    for variant, size in VARIANTS.items():
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+        for extension, (pil_format, _, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            _write_atomic(variant_path(root, digest, variant, extension), buffer.getvalue())
+    return digest
+
+
+class PhotoPipeline:
+    def __init__(self, root, workers=DEFAULT_WORKERS):
+        self.root = root
+        # spawn: children must not inherit the parent's database connections
+        self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def store(self, data):
+        """Persist an upload and queue its variants; returns the digest without waiting."""
+        validate(data)
+        digest = photo_digest(data)
+        original = variant_path(self.root, digest, ORIGINAL, 'bin')
+        if not os.path.exists(original):
+            _write_atomic(original, data)
+        if not self.is_ready(digest):
+            self.schedule(digest)
+        return digest
+
+    def schedule(self, digest):
+        """Queue a render; returns its future, or None while backing off or once the photo has failed for good."""
+        with self._lock:
+            if digest in self._pending:
+                return self._pending[digest]
+            failure = self.failure(digest)
+            if failure and (failure['attempts'] >= MAX_RENDER_ATTEMPTS or time.time() < failure['retry_at']):
+                return None
+            future = self._pool.submit(render_variants, self.root, digest)
+            self._pending[digest] = future
+        future.add_done_callback(lambda done: self._done(digest, done))
+        return future
+
+    def _done(self, digest, future):
+        error = future.exception() if not future.cancelled() else None
+        path = os.path.join(photo_dir(self.root, digest), FAILURE_FILE)
+        if error is not None:
+            attempts = (self.failure(digest) or {'attempts': 0})['attempts'] + 1
+            _write_atomic(path, json.dumps({
+                'attempts': attempts,
+                'retry_at': time.time() + RENDER_RETRY_SECONDS * 2 ** (attempts - 1),
+                'error': repr(error)
+            }).encode())
+        elif os.path.exists(path):
+            os.remove(path)
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def failure(self, digest):
+        """The recorded render failure (``attempts``, ``retry_at``, ``error``), or None."""
+        try:
+            with open(os.path.join(photo_dir(self.root, digest), FAILURE_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def has_failed(self, digest):
+        """True once rendering has failed ``MAX_RENDER_ATTEMPTS`` times; the photo won't be retried."""
+        failure = self.failure(digest)
+        return failure is not None and failure['attempts'] >= MAX_RENDER_ATTEMPTS
+
+    def retry_after(self, digest):
+        """Seconds until the next render attempt may start, 0 if it may now."""
+        failure = self.failure(digest)
+        return max(0.0, failure['retry_at'] - time.time()) if failure else 0.0
+
+    def is_ready(self, digest):
+        # The last file render_variants writes
+        last_variant = list(VARIANTS)[-1]
+        last_format = list(FORMATS)[-1]
+        return os.path.exists(variant_path(self.root, digest, last_variant, last_format))
+
+    def has_original(self, digest):
+        return os.path.exists(variant_path(self.root, digest, ORIGINAL, 'bin'))
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                config = current_app.config
+                _pipeline = PhotoPipeline(
+                    root=config.get('PHOTO_ROOT', os.path.join(current_app.instance_path, 'photos')),
+                    workers=config.get('PHOTO_WORKERS', DEFAULT_WORKERS)
+                )
+                metrics.register_source('photo_pipeline', lambda: {'pending': _pipeline.pending()})
+    return _pipeline
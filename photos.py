@@ -0,0 +1,81 @@
+from flask import Blueprint, request, jsonify, send_file
+from src.models.user import db
+from src.routes.auth import token_required
+from src.services import photo_store, principal_cache
+from datetime import datetime
+import math
+import os
+
+photos_bp = Blueprint('photos', __name__)
+
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+@photos_bp.route('', methods=['POST'])
+@token_required
+def upload_photo(current_user):
+    """Upload a profile photo (multipart field "photo"); variants are rendered in the background"""
+    try:
+        upload = request.files.get('photo')
+        if not upload:
+            return jsonify({'message': 'Photo file is required'}), 400
+        
+        data = upload.stream.read(photo_store.MAX_UPLOAD_BYTES + 1)
+        
+        try:
+            digest = photo_store.get_pipeline().store(data)
+        except photo_store.InvalidPhoto as e:
+            return jsonify({'message': str(e)}), 400
+        
+        if photo_store.get_pipeline().has_failed(digest):
+            return jsonify({'message': 'Photo could not be processed'}), 422
+        
+        current_user.photo_url = photo_store.photo_url(digest)
+        current_user.updated_at = datetime.utcnow()
+        db.session.commit()
+        principal_cache.invalidate_user(current_user.id)
+        
+        ready = photo_store.get_pipeline().is_ready(digest)
+        return jsonify({
+            'message': 'Photo uploaded successfully',
+            'photo_url': current_user.photo_url,
+            'variants': {variant: photo_store.photo_url(digest, variant) for variant in photo_store.VARIANTS},
+            'ready': ready
+        }), 201 if ready else 202
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Photo upload failed: {str(e)}'}), 500
+
+@photos_bp.route('/<digest>/<variant>', methods=['GET'])
+def get_photo(digest, variant):
+    """Serve a photo variant as WebP when the client accepts it, JPEG otherwise"""
+    if not photo_store.DIGEST_PATTERN.match(digest) or variant not in photo_store.VARIANTS:
+        return jsonify({'message': 'Photo not found'}), 404
+    
+    extension = 'webp' if request.accept_mimetypes['image/webp'] else 'jpg'
+    pipeline = photo_store.get_pipeline()
+    path = photo_store.variant_path(pipeline.root, digest, variant, extension)
+    
+    if not os.path.exists(path):
+        if not pipeline.has_original(digest):
+            return jsonify({'message': 'Photo not found'}), 404
+        if pipeline.has_failed(digest):
+            return jsonify({'message': 'Photo could not be processed'}), 422
+        # Uploaded but not rendered yet (or rendered by a since-restarted worker, or backing off after a failure)
+        pipeline.schedule(digest)
+        response = jsonify({'message': 'Photo is still processing'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, math.ceil(pipeline.retry_after(digest))))
+        return response
+    
+    # Content-addressed, so the bytes behind this URL never change
+    response = send_file(
+        path,
+        mimetype=photo_store.FORMATS[extension][1],
+        max_age=CACHE_MAX_AGE,
+        etag=f'{digest}-{variant}-{extension}',
+        conditional=True
+    )
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
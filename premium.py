@@ -1,17 +1,34 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+
+from async_api import jwt_user_id
+from src.models.user import User
+from src.services import principal_cache, super_sparks
+from src.services.async_db import get_read_session, get_session
 
 router = APIRouter()
 
-user_super_spark = {"remaining": 3}
+# Balances live on each user's row (see super_sparks): every worker sees the
+# same quota, and the weekly refill happens lazily on the next read or spend.
 
 @router.get("/api/super_spark/remaining")
-def get_remaining_super_spark():
-    return {"remaining": user_super_spark["remaining"]}
+async def get_remaining_super_spark(user_id: int = Depends(jwt_user_id), session=Depends(get_read_session)):
+    row = (await session.execute(
+        select(User.super_spark_count, User.super_spark_reset_date).where(User.id == user_id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {
+        "remaining": super_sparks.remaining(*row),
+        "next_reset": super_sparks.next_refill(row.super_spark_reset_date).isoformat()
+    }
 
 @router.post("/api/super_spark/use")
-def use_super_spark():
-    if user_super_spark["remaining"] > 0:
-        user_super_spark["remaining"] -= 1
-        return {"message": "Super Spark used.", "remaining": user_super_spark["remaining"]}
-    else:
+async def use_super_spark(user_id: int = Depends(jwt_user_id), session=Depends(get_session)):
+    remaining = await super_sparks.consume_async(session, user_id)
+    if remaining is None:
+        await session.rollback()
         raise HTTPException(status_code=400, detail="No Super Sparks left this week.")
+    await session.commit()
+    await principal_cache.invalidate_user_async(user_id)
+    return {"message": "Super Spark used.", "remaining": remaining}
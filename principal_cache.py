@@ -0,0 +1,221 @@
+"""Verified-principal cache for authenticated requests.
+
+Maps the SHA-256 digest of a bearer token to the user id it was verified for
+and a snapshot of that ``User`` row, so repeat requests with the same token
+skip both the JWT signature check and the primary-key read. Entries live
+until the token expires or ``PRINCIPAL_CACHE_TTL`` seconds pass, whichever
+comes first, and the cache holds at most ``PRINCIPAL_CACHE_SIZE`` entries in
+LRU order. Handlers that change the user row call ``invalidate_user``, which
+also publishes the user id on the realtime broker; each worker's
+``listen_for_invalidations`` task drops it from that worker's cache. With
+the ``RedisBroker`` that reaches every worker, so the TTL only bounds
+staleness when a broadcast is lost.
+
+Cached users are re-attached to the session without a query, so handlers can
+still modify and commit them. Misses read the primary even in replica-routed
+views, so a lagging replica can't put a stale snapshot in the cache.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import jwt
+from flask import current_app, request
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy.orm import make_transient_to_detached
+
+from src.models.user import db, User
+from src.services import db_routing, metrics, realtime
+
+DEFAULT_SIZE = 10000
+DEFAULT_TTL = 300
+INVALIDATION_CHANNEL = 'principal_cache:invalidate'
+
+# Tells this worker's own broadcasts apart from other workers'
+_origin = uuid.uuid4().hex
+
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    def __init__(self, max_entries=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (scheme, digest) -> (user_id, values, expires_at)
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, user_id, values, token_expires_at=None):
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (user_id, values, expires_at)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _drop(self, key):
+        user_id = self._entries.pop(key)[0]
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PrincipalCache(
+                    max_entries=current_app.config.get('PRINCIPAL_CACHE_SIZE', DEFAULT_SIZE),
+                    ttl=current_app.config.get('PRINCIPAL_CACHE_TTL', DEFAULT_TTL)
+                )
+                metrics.register_source('principal_cache', _cache.stats,
+                                        counters=('hits', 'misses', 'evictions', 'invalidations'))
+    return _cache
+
+
+def snapshot(user):
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def attach(values):
+    """Rebuild a session-attached ``User`` from a snapshot without querying."""
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _key(scheme, token):
+    return scheme, hashlib.sha256(token.encode()).digest()
+
+
+def verify_token(token):
+    """Resolve an ``auth`` blueprint token to its ``User``, or None for unknown users.
+
+    Raises the usual ``jwt`` exceptions for expired or invalid tokens on a
+    cache miss; a hit means this exact token already passed verification.
+    """
+    cache = get_cache()
+    key = _key('auth', token)
+    cached = cache.get(key)
+    if cached:
+        return attach(cached[1])
+
+    data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    with db_routing.primary():
+        user = db.session.get(User, data['user_id'])
+    if user:
+        cache.put(key, user.id, snapshot(user), data.get('exp'))
+    return user
+
+
+def current_user():
+    """The ``User`` behind the current ``@jwt_required()`` request, or None."""
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        token = token[7:]
+
+    cache = get_cache()
+    key = _key('jwt', token)
+    cached = cache.get(key) if token else None
+    if cached:
+        return attach(cached[1])
+
+    with db_routing.primary():
+        user = db.session.get(User, get_jwt_identity())
+    if user and token:
+        cache.put(key, user.id, snapshot(user), get_jwt().get('exp'))
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop the user's cached snapshots here and, through the broker, in every other worker."""
+    user_id = int(user_id)
+    get_cache().invalidate_user(user_id)
+    try:
+        realtime.get_broker().publish(INVALIDATION_CHANNEL, {'user_id': user_id, 'origin': _origin})
+    except Exception:
+        # The row already committed; other workers fall back to the TTL
+        current_app.logger.exception('Failed to broadcast invalidation of user %s', user_id)
+
+
+async def invalidate_user_async(user_id):
+    """``invalidate_user`` for the async routes, which run outside any Flask app context."""
+    user_id = int(user_id)
+    if _cache is not None:
+        _cache.invalidate_user(user_id)
+    try:
+        await asyncio.to_thread(realtime.get_broker().publish, INVALIDATION_CHANNEL,
+                                {'user_id': user_id, 'origin': _origin})
+    except Exception:
+        logger.exception('Failed to broadcast invalidation of user %s', user_id)
+
+
+async def listen_for_invalidations():
+    """Apply other workers' ``invalidate_user`` calls; run as a task on the server's event loop."""
+    subscription = realtime.get_broker().subscribe(INVALIDATION_CHANNEL)
+    try:
+        async for event in subscription:
+            if event.get('origin') != _origin and _cache is not None:
+                _cache.invalidate_user(int(event['user_id']))
+    finally:
+        subscription.close()
+
+
+def stats():
+    return get_cache().stats()
@@ -1,33 +1,40 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import db, User, UserProfile
+from src.services import db_routing, geo_index, principal_cache, profile_index, text_index, vector_index
 
 profile_bp = Blueprint('profile', __name__)
 
+# Every profile read and write here (and the discovery and match joins) looks up (user_id, role)
+ix_user_profile_user_role = db.Index('ix_user_profile_user_role', UserProfile.user_id, UserProfile.role)
+
+def empty_profile(role):
+    """Placeholder for a role the user hasn't filled in; reads never create rows"""
+    return {
+        'role': role,
+        'is_complete': False,
+        'completion_percentage': 0
+    }
+
 @profile_bp.route('/profiles', methods=['GET'])
 @jwt_required()
+@db_routing.replica_reads
 def get_user_profiles():
     """Get all profiles for the current user"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = principal_cache.current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
+        # One query for all roles; completion is maintained at write time
+        stored = {profile.role: profile for profile in UserProfile.query.filter_by(user_id=user_id)}
         profiles = {}
         for role in ['entrepreneur', 'investor', 'partner']:
-            profile = UserProfile.query.filter_by(user_id=user_id, role=role).first()
-            if profile:
-                profile.calculate_completion()
-                db.session.commit()
-                profiles[role] = profile.to_dict()
-            else:
-                profiles[role] = {
-                    'role': role,
-                    'is_complete': False,
-                    'completion_percentage': 0
-                }
+            profile = stored.get(role)
+            profiles[role] = profile.to_dict() if profile else empty_profile(role)
         
         return jsonify({
             'user': user.to_dict(include_private=True),
@@ -39,6 +46,7 @@ def get_user_profiles():
 
 @profile_bp.route('/profiles/<role>', methods=['GET'])
 @jwt_required()
+@db_routing.replica_reads
 def get_profile_by_role(role):
     """Get profile for a specific role"""
     try:
@@ -48,16 +56,8 @@ def get_profile_by_role(role):
         user_id = get_jwt_identity()
         profile = UserProfile.query.filter_by(user_id=user_id, role=role).first()
         
-        if not profile:
-            # Create empty profile
-            profile = UserProfile(user_id=user_id, role=role)
-            db.session.add(profile)
-            db.session.commit()
-        
-        profile.calculate_completion()
-        db.session.commit()
-        
-        return jsonify({'profile': profile.to_dict()}), 200
+        # The row is created by the first PUT, not by reads
+        return jsonify({'profile': profile.to_dict() if profile else empty_profile(role)}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -124,9 +124,18 @@ def update_profile_by_role(role):
                 if field in data:
                     setattr(profile, field, data[field])
         
-        # Calculate completion
-        profile.calculate_completion()
-        db.session.commit()
+        # Only recompute completion (and touch the index) when something changed
+        if profile.id is None or db.session.is_modified(profile):
+            profile.calculate_completion()
+            # The search index catches up from other workers' saves by this
+            profile.updated_at = datetime.utcnow()
+            place = geo_index.store(profile, principal_cache.current_user().location)
+            vector = vector_index.store(profile)
+            db.session.commit()
+            profile_index.get_index().update(profile)
+            geo_index.update_profile(profile, place)
+            text_index.update_profile(profile)
+            vector_index.update_profile(profile, vector)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -148,27 +157,22 @@ def switch_role():
         if new_role not in ['entrepreneur', 'investor', 'partner']:
             return jsonify({'error': 'Invalid role'}), 400
         
-        user = User.query.get(user_id)
+        user = principal_cache.current_user()
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        user.current_role = new_role
-        db.session.commit()
+        if user.current_role != new_role:
+            user.current_role = new_role
+            db.session.commit()
+            principal_cache.invalidate_user(user_id)
         
         # Get profile for the new role
         profile = UserProfile.query.filter_by(user_id=user_id, role=new_role).first()
-        if not profile:
-            profile = UserProfile(user_id=user_id, role=new_role)
-            db.session.add(profile)
-            db.session.commit()
-        
-        profile.calculate_completion()
-        db.session.commit()
         
         return jsonify({
             'message': 'Role switched successfully',
             'current_role': new_role,
-            'profile': profile.to_dict()
+            'profile': profile.to_dict() if profile else empty_profile(new_role)
         }), 200
         
     except Exception as e:
@@ -176,6 +180,7 @@ def switch_role():
 
 @profile_bp.route('/check-completion/<role>', methods=['GET'])
 @jwt_required()
+@db_routing.replica_reads
 def check_profile_completion(role):
     """Check if profile is complete for a specific role"""
     try:
@@ -192,9 +197,6 @@ def check_profile_completion(role):
                 'message': 'Complete your profile to start swiping'
             }), 200
         
-        profile.calculate_completion()
-        db.session.commit()
-        
         message = 'Profile complete' if profile.is_complete else 'Complete your profile to start swiping'
         
         return jsonify({
@@ -0,0 +1,18 @@
+"""Reading the tag-like fields profiles store, shared by scoring and profile_index."""
+
+# Funding stages in order, normalized (lowercase, single spaces)
+STAGES = ['pre-seed', 'seed', 'series a', 'series b', 'series c', 'growth']
+
+
+def strings(value):
+    """Flatten the JSON blobs profiles store (lists, dicts of lists) into strings."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = value.values()
+    flat = []
+    for item in value:
+        flat.extend(strings(item))
+    return flat
@@ -0,0 +1,318 @@
+"""In-process inverted index over the JSON tag fields of role profiles.
+
+Skills, expertise and investment preferences are stored as JSON blobs the
+database cannot search. This index maps role-scoped tags such as
+``investor:industry:fintech`` to sorted posting lists of user ids, so filters
+like "skills ∋ AI AND industry = fintech AND stage = seed" are a handful of
+posting-list intersections instead of a scan over every row.
+
+Posting lists are kept in memory as sorted ``array('I')`` (4 bytes per id)
+and persisted as delta + varint encoded snapshots that a worker loads on
+start instead of rebuilding from the database.
+
+Every index carries a high-water mark, the ``updated_at`` up to which it has
+seen profile saves. Every ``CATCH_UP_SECONDS`` it re-indexes the profiles
+saved since (including other workers' saves), and with
+``PROFILE_INDEX_PATH`` it rewrites the snapshot, stamped with that mark,
+every ``SNAPSHOT_SECONDS`` and at exit. A worker loading a snapshot catches
+up from its mark, so an old snapshot costs a replay, not stale results.
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from src.models.user import UserProfile
+from src.services import profile_fields
+
+SNAPSHOT_MAGIC = b'SPKIDX2\n'
+CATCH_UP_SECONDS = 5.0
+SNAPSHOT_SECONDS = 300.0
+# Saves stamped this long before the mark are read again, for transactions that committed late
+CATCH_UP_LAG = timedelta(seconds=30)
+EPOCH = datetime(1970, 1, 1)
+
+# Query parameter name -> tag field
+FILTER_FIELDS = {
+    'skills': 'skills',
+    'industry': 'industry',
+    'stage': 'stage',
+    'expertise': 'expertise',
+    'investor_type': 'investor_type',
+    'collaboration_type': 'collaboration_type',
+    'availability': 'availability',
+}
+
+
+def normalize(value):
+    return ' '.join(str(value).lower().replace('_', ' ').split())
+
+
+def profile_tags(profile):
+    """Role-scoped tags describing a profile."""
+    fields = [('skills', value) for value in profile_fields.strings(profile.get_skills())]
+
+    if profile.role == 'entrepreneur':
+        fields += [
+            ('industry', profile.industry),
+            ('stage', profile.funding_stage),
+            ('investor_type', profile.looking_for_investor_type),
+        ]
+    elif profile.role == 'investor':
+        for value in profile_fields.strings(profile.get_investment_preferences()):
+            fields.append(('stage' if normalize(value) in profile_fields.STAGES else 'industry', value))
+    elif profile.role == 'partner':
+        fields += [('expertise', value) for value in profile_fields.strings(profile.get_expertise())]
+        fields += [
+            ('collaboration_type', profile.collaboration_type),
+            ('availability', profile.availability),
+        ]
+
+    tags = {f'{profile.role}:{field}:{normalize(value)}' for field, value in fields if value}
+    if profile.is_complete:
+        tags.add(f'{profile.role}:status:complete')
+    return tags
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_postings(ids):
+    """Delta + varint encode a sorted id list."""
+    out = bytearray()
+    _encode_varint(len(ids), out)
+    previous = 0
+    for doc_id in ids:
+        _encode_varint(doc_id - previous, out)
+        previous = doc_id
+    return bytes(out)
+
+
+def decode_postings(data, pos=0):
+    count, pos = _decode_varint(data, pos)
+    ids = array('I')
+    previous = 0
+    for _ in range(count):
+        delta, pos = _decode_varint(data, pos)
+        previous += delta
+        ids.append(previous)
+    return ids, pos
+
+
+def intersect(lists):
+    """Intersect sorted id arrays, driving from the shortest one."""
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    result = list(lists[0])
+    for other in lists[1:]:
+        if not result:
+            break
+        kept = []
+        lo = 0
+        size = len(other)
+        for doc_id in result:
+            lo = bisect_left(other, doc_id, lo)
+            if lo == size:
+                break
+            if other[lo] == doc_id:
+                kept.append(doc_id)
+        result = kept
+    return result
+
+
+class ProfileIndex:
+    def __init__(self, high_water=EPOCH):
+        self._postings = {}
+        self._doc_tags = {}
+        self._lock = threading.RLock()
+        self.high_water = high_water
+        self._caught_up = time.monotonic()
+
+    def __len__(self):
+        return len(self._doc_tags)
+
+    def _add(self, tag, doc_id):
+        postings = self._postings.setdefault(tag, array('I'))
+        pos = bisect_left(postings, doc_id)
+        if pos == len(postings) or postings[pos] != doc_id:
+            postings.insert(pos, doc_id)
+
+    def _remove(self, tag, doc_id):
+        postings = self._postings.get(tag)
+        if postings is None:
+            return
+        pos = bisect_left(postings, doc_id)
+        if pos < len(postings) and postings[pos] == doc_id:
+            del postings[pos]
+            if not postings:
+                del self._postings[tag]
+
+    def update(self, profile):
+        """Re-index one profile, touching only the tags that changed."""
+        key = (profile.role, profile.user_id)
+        tags = profile_tags(profile)
+        with self._lock:
+            old_tags = self._doc_tags.get(key, frozenset())
+            for tag in old_tags - tags:
+                self._remove(tag, profile.user_id)
+            for tag in tags - old_tags:
+                self._add(tag, profile.user_id)
+            self._doc_tags[key] = frozenset(tags)
+
+    def remove(self, role, user_id):
+        with self._lock:
+            for tag in self._doc_tags.pop((role, user_id), ()):
+                self._remove(tag, user_id)
+
+    def search(self, role, complete_only=True, **filters):
+        """User ids whose ``role`` profile carries every ``field=value`` filter.
+
+        Values may be a single string or a list; a list means the profile must
+        carry all of them.
+        """
+        tags = [f'{role}:status:complete'] if complete_only else []
+        for name, values in filters.items():
+            if values is None:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            tags += [f'{role}:{FILTER_FIELDS[name]}:{normalize(value)}' for value in values]
+
+        with self._lock:
+            if not tags:
+                return sorted(user_id for doc_role, user_id in self._doc_tags if doc_role == role)
+            lists = []
+            for tag in tags:
+                postings = self._postings.get(tag)
+                if not postings:
+                    return []
+                lists.append(postings)
+            return intersect(lists)
+
+    def catch_up(self, force=False):
+        """Re-index the profiles saved since the high-water mark, at most every ``CATCH_UP_SECONDS``."""
+        if not force and time.monotonic() - self._caught_up < CATCH_UP_SECONDS:
+            return 0
+        self._caught_up = time.monotonic()
+        started = datetime.utcnow()
+        profiles = UserProfile.query.filter(UserProfile.updated_at > self.high_water - CATCH_UP_LAG).all()
+        for profile in profiles:
+            self.update(profile)
+        with self._lock:
+            self.high_water = max([self.high_water] + [profile.updated_at for profile in profiles
+                                                       if profile.updated_at and profile.updated_at <= started])
+        return len(profiles)
+
+    def save(self, path):
+        """Write an atomic snapshot of every posting list and the high-water mark to ``path``."""
+        with self._lock:
+            items = sorted(self._postings.items())
+            out = bytearray(SNAPSHOT_MAGIC)
+            _encode_varint((self.high_water - EPOCH) // timedelta(microseconds=1), out)
+            _encode_varint(len(items), out)
+            for tag, postings in items:
+                tag_bytes = tag.encode()
+                _encode_varint(len(tag_bytes), out)
+                out += tag_bytes
+                out += encode_postings(postings)
+
+        tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(out)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError(f'{path} is not a profile index snapshot')
+
+        high_water, pos = _decode_varint(data, len(SNAPSHOT_MAGIC))
+        index = cls(EPOCH + timedelta(microseconds=high_water))
+        doc_tags = {}
+        count, pos = _decode_varint(data, pos)
+        for _ in range(count):
+            length, pos = _decode_varint(data, pos)
+            tag = data[pos:pos + length].decode()
+            pos += length
+            postings, pos = decode_postings(data, pos)
+            index._postings[tag] = postings
+            role = tag.split(':', 1)[0]
+            for user_id in postings:
+                doc_tags.setdefault((role, user_id), set()).add(tag)
+        index._doc_tags = {key: frozenset(tags) for key, tags in doc_tags.items()}
+        return index
+
+    @classmethod
+    def build(cls):
+        # Saves racing the scan are picked up by the first catch-up
+        index = cls(datetime.utcnow())
+        for profile in UserProfile.query.yield_per(1000):
+            index.update(profile)
+        return index
+
+
+_index = None
+_index_lock = threading.Lock()
+_path = None
+_saved = 0.0
+
+
+def get_index():
+    """Process-wide index, loaded from ``PROFILE_INDEX_PATH`` when a snapshot exists, and kept caught up."""
+    global _index, _path, _saved
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = current_app.config.get('PROFILE_INDEX_PATH')
+                index = None
+                if path and os.path.exists(path):
+                    try:
+                        index = ProfileIndex.load(path)
+                    except ValueError:
+                        current_app.logger.warning('Rebuilding the profile index: %s is an old snapshot', path)
+                    else:
+                        index.catch_up(force=True)
+                if index is None:
+                    index = ProfileIndex.build()
+                    if path:
+                        index.save(path)
+                if path:
+                    _path, _saved = path, time.monotonic()
+                    atexit.register(save_snapshot)
+                _index = index
+    _index.catch_up()
+    if _path and time.monotonic() - _saved >= SNAPSHOT_SECONDS:
+        _saved = time.monotonic()
+        _index.save(_path)
+    return _index
+
+
+def save_snapshot():
+    if _path and _index is not None:
+        _index.save(_path)
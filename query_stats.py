@@ -0,0 +1,246 @@
+"""Per-request database accounting, a slow-query log and query budgets.
+
+SQLAlchemy cursor events on every ``Engine`` (the Flask-SQLAlchemy engine
+and the async engine's sync core alike) charge each statement to the
+request running in the current context: query count, database time, rows
+reported by the driver (``cursor.rowcount``, which SQLite leaves at -1 for
+SELECTs) and commits. When a request finishes, the totals feed per-endpoint
+histograms and counters labeled by blueprint and endpoint, exported on
+/metrics through ``metrics.render()``.
+
+Statements slower than ``SLOW_QUERY_MS`` are logged to ``sparko.slow_query``
+with their SQL normalized (literals and parameters collapsed to ``?``) so
+repeats of the same query group together.
+
+Query budgets catch N+1 regressions. ``query_budget(n)`` fails a block that
+issues more than ``n`` statements, and ``QUERY_BUDGETS`` maps endpoint
+names to a per-request maximum, enforced when ``QUERY_BUDGET_ENFORCE`` is
+set (it defaults to ``app.testing``). Both raise ``QueryBudgetExceeded``,
+an ``AssertionError``, so a test fails.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.services import metrics
+
+DEFAULT_SLOW_QUERY_MS = 200
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89]
+MAX_LOGGED_SQL = 2000
+
+logger = logging.getLogger('sparko.slow_query')
+
+REQUEST_SECONDS = metrics.register(metrics.LabeledHistogram(
+    'sparko_http_request_duration_seconds', 'Request latency.',
+    ('blueprint', 'endpoint', 'method'), metrics.LATENCY_BUCKETS
+))
+REQUESTS = metrics.register(metrics.LabeledCounter(
+    'sparko_http_requests_total', 'Requests by response status.',
+    ('blueprint', 'endpoint', 'method', 'status')
+))
+QUERIES = metrics.register(metrics.LabeledHistogram(
+    'sparko_db_queries_per_request', 'SQL statements issued per request.',
+    ('blueprint', 'endpoint'), QUERY_BUCKETS
+))
+DB_SECONDS = metrics.register(metrics.LabeledHistogram(
+    'sparko_db_seconds_per_request', 'Time spent in the database per request.',
+    ('blueprint', 'endpoint'), metrics.LATENCY_BUCKETS
+))
+ROWS = metrics.register(metrics.LabeledCounter(
+    'sparko_db_rows_total', 'Rows returned or affected, as reported by the driver.', ('blueprint', 'endpoint')
+))
+COMMITS = metrics.register(metrics.LabeledCounter(
+    'sparko_db_commits_total', 'Transactions committed.', ('blueprint', 'endpoint')
+))
+SLOW_QUERIES = metrics.register(metrics.LabeledCounter(
+    'sparko_db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ('blueprint', 'endpoint')
+))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestQueries:
+    __slots__ = ('blueprint', 'endpoint', 'queries', 'seconds', 'rows', 'commits')
+
+    def __init__(self, blueprint='', endpoint=''):
+        self.blueprint = blueprint
+        self.endpoint = endpoint
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.commits = 0
+
+
+class _Budget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.statements = []
+
+
+_current = ContextVar('sparko_request_queries', default=None)
+_budgets = ContextVar('sparko_query_budgets', default=())
+_slow_query_seconds = DEFAULT_SLOW_QUERY_MS / 1000
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(...)'),
+    (re.compile(r'(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize_sql(statement):
+    """``WHERE id IN (1, 2, 3) AND name = 'x'`` -> ``WHERE id IN (...) AND name = ?``."""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()[:MAX_LOGGED_SQL]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    current = _current.get()
+    if current is not None:
+        current.queries += 1
+        current.seconds += elapsed
+        if cursor.rowcount > 0:
+            current.rows += cursor.rowcount
+    for budget in _budgets.get():
+        budget.statements.append(statement)
+    if elapsed >= _slow_query_seconds:
+        labels = (current.blueprint, current.endpoint) if current is not None else ('', '')
+        SLOW_QUERIES.inc(*labels)
+        logger.warning('slow query %.1f ms in %s: %s', elapsed * 1000, labels[1] or 'background',
+                       normalize_sql(statement))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+@event.listens_for(Engine, 'commit')
+def _commit(conn):
+    current = _current.get()
+    if current is not None:
+        current.commits += 1
+
+
+def start_request(blueprint='', endpoint=''):
+    """Start charging statements in this context to a new request; returns a token for ``finish_request``."""
+    return _current.set(RequestQueries(blueprint, endpoint))
+
+
+def finish_request(token, method, status, seconds, blueprint=None, endpoint=None):
+    """Record the request's totals; returns its ``RequestQueries``."""
+    current = _current.get()
+    _current.reset(token)
+    blueprint = current.blueprint if blueprint is None else blueprint
+    endpoint = current.endpoint if endpoint is None else endpoint
+    REQUEST_SECONDS.labels(blueprint, endpoint, method).observe(seconds)
+    REQUESTS.inc(blueprint, endpoint, method, str(status))
+    QUERIES.labels(blueprint, endpoint).observe(current.queries)
+    DB_SECONDS.labels(blueprint, endpoint).observe(current.seconds)
+    if current.rows:
+        ROWS.inc(blueprint, endpoint, amount=current.rows)
+    if current.commits:
+        COMMITS.inc(blueprint, endpoint, amount=current.commits)
+    return current
+
+
+@contextmanager
+def query_budget(limit):
+    """Fail with ``QueryBudgetExceeded`` if the block issues more than ``limit`` statements."""
+    budget = _Budget(limit)
+    token = _budgets.set(_budgets.get() + (budget,))
+    try:
+        yield budget
+    finally:
+        _budgets.reset(token)
+    if len(budget.statements) > limit:
+        raise QueryBudgetExceeded(
+            f'{len(budget.statements)} queries, budget {limit}:\n' +
+            '\n'.join(normalize_sql(statement) for statement in budget.statements)
+        )
+
+
+def install(app):
+    """Account every request of ``app``; reads ``SLOW_QUERY_MS``, ``QUERY_BUDGETS`` and ``QUERY_BUDGET_ENFORCE``."""
+    global _slow_query_seconds
+    _slow_query_seconds = app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS) / 1000
+    budgets = app.config.get('QUERY_BUDGETS', {})
+    enforce = app.config.get('QUERY_BUDGET_ENFORCE', app.testing)
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = (start_request(request.blueprint or '', request.endpoint or ''), time.perf_counter())
+
+    def _finish(status):
+        token, started = g.pop('query_stats')
+        return finish_request(token, request.method, status, time.perf_counter() - started)
+
+    @app.after_request
+    def _finish_query_stats(response):
+        if 'query_stats' in g:
+            current = _finish(response.status_code)
+            limit = budgets.get(current.endpoint)
+            if enforce and limit is not None and current.queries > limit:
+                raise QueryBudgetExceeded(f'{current.endpoint} issued {current.queries} queries, budget {limit}')
+        return response
+
+    @app.teardown_request
+    def _abandon_query_stats(error):
+        # after_request doesn't run when a view raises
+        if 'query_stats' in g:
+            _finish(500)
+
+
+class QueryStatsMiddleware:
+    """ASGI counterpart of ``install`` for the FastAPI routes.
+
+    Requests that end up in a mounted app (the Flask blueprints) are left to
+    that app's own accounting.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        token = start_request()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            if route is not None and hasattr(route, 'endpoint'):
+                finish_request(token, scope['method'], status, time.perf_counter() - started,
+                               blueprint=route.endpoint.__module__, endpoint=route.name)
+            else:
+                _current.reset(token)
@@ -0,0 +1,174 @@
+"""Pub/sub fan-out for real-time chat and match events.
+
+Flask request handlers publish events (new messages, new matches, chat
+unlocks) to per-user channels after their transaction commits; the SSE
+endpoint in ``events.py`` subscribes connected clients to their channel.
+
+``LocalBroker`` fans out in memory and is what tests and single-process
+deployments use. Setting ``SPARKO_BROKER_URL=redis://...`` switches to
+``RedisBroker`` so events published by any worker reach clients connected
+to any other. Deployments running more than one worker process must set
+it: ``principal_cache`` invalidations travel the same way, and with the
+``LocalBroker`` each worker would serve stale users until the cache TTL.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """Async iterator over the events delivered to one subscriber."""
+
+    def __init__(self, broker, channel, queue, loop):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue
+        self.loop = loop
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    async def get(self, timeout=None):
+        """Next event, or None if nothing arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process broker; publish is thread-safe and may be called from any thread."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(self, channel, asyncio.Queue(SUBSCRIBER_QUEUE_SIZE), loop)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, channel, event):
+        event = dict(event, id=next(self._ids))
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(_deliver, subscription.queue, event)
+        return len(subscribers)
+
+
+def _deliver(queue, event):
+    # A client that stops reading loses its oldest events instead of growing without bound
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class RedisBroker:
+    """Cross-process broker on Redis pub/sub (requires the ``redis`` package)."""
+
+    def __init__(self, url):
+        import redis
+        import redis.asyncio
+
+        self._publisher = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+        self._local = LocalBroker()
+        self._pubsub = None
+        self._listener = None
+
+    def publish(self, channel, event):
+        return self._publisher.publish(channel, json.dumps(event))
+
+    def subscribe(self, channel):
+        subscription = self._local.subscribe(channel)
+        asyncio.get_running_loop().create_task(self._ensure_subscribed(channel))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._local.unsubscribe(subscription)
+        if self._pubsub is not None and not self._local.subscriber_count(subscription.channel):
+            asyncio.get_running_loop().create_task(self._pubsub.unsubscribe(subscription.channel))
+
+    def subscriber_count(self, channel=None):
+        return self._local.subscriber_count(channel)
+
+    async def _ensure_subscribed(self, channel):
+        # One Redis subscription per channel per worker; local subscribers share it
+        if self._pubsub is None:
+            self._pubsub = self._async_client.pubsub()
+        await self._pubsub.subscribe(channel)
+        if self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        async for message in self._pubsub.listen():
+            if message['type'] != 'message':
+                continue
+            channel = message['channel'].decode()
+            self._local.publish(channel, json.loads(message['data']))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = os.environ.get('SPARKO_BROKER_URL')
+                _broker = RedisBroker(url) if url else LocalBroker()
+    return _broker
+
+
+def set_broker(broker):
+    """Swap the process-wide broker, e.g. for a fresh ``LocalBroker`` in tests."""
+    global _broker
+    _broker = broker
+
+
+def publish_to_users(user_ids, event_type, data):
+    """Publish one event to each user's channel; call after the triggering commit."""
+    broker = get_broker()
+    for user_id in set(user_ids):
+        try:
+            broker.publish(user_channel(user_id), {'type': event_type, 'data': data})
+        except Exception:
+            # The write already committed; clients still catch up on their next poll
+            logger.exception('Failed to publish %s event to user %s', event_type, user_id)
@@ -0,0 +1,283 @@
+"""Vectorized candidate scoring for the Smart Matching Algorithm.
+
+Profiles are encoded into fixed-width float32 feature vectors made of blocks
+(skills, industry, stage, check size, geography, investor type). Each role
+fills the blocks from the fields that express the same thing on its side, e.g.
+an entrepreneur's ``industry`` lines up with an investor's preferred
+industries, so scoring a viewer against every candidate is a single
+matrix-vector product followed by ``argpartition`` for the top-k.
+
+Each role's matrix is cached for ``MATRIX_TTL``. An expired matrix is rebuilt
+by one caller per role, outside the cache lock, while the others keep
+using the old one; the rebuild reads plain Core rows, not ORM objects.
+"""
+import json
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from sqlalchemy import and_, select
+
+from src.models.user import db, User, UserProfile
+from src.services import profile_fields
+
+SKILL_DIMS = 16
+INDUSTRY_DIMS = 8
+AMOUNT_BUCKETS = 6  # log10 buckets from $10k up to $1B+
+GEO_DIMS = 8
+INVESTOR_TYPES = ['angel', 'venture', 'corporate', 'accelerator']
+
+BLOCKS = [
+    ('skills', SKILL_DIMS, 3.0),
+    ('industry', INDUSTRY_DIMS, 2.5),
+    ('stage', len(profile_fields.STAGES), 2.0),
+    ('amount', AMOUNT_BUCKETS, 1.5),
+    ('geo', GEO_DIMS, 1.0),
+    ('investor_type', len(INVESTOR_TYPES), 1.0),
+]
+
+OFFSETS = {}
+_offset = 0
+for _name, _width, _weight in BLOCKS:
+    OFFSETS[_name] = (_offset, _offset + _width)
+    _offset += _width
+DIM = _offset
+
+BLOCK_WEIGHTS = np.concatenate([
+    np.full(width, weight, dtype=np.float32) for _, width, weight in BLOCKS
+])
+
+MATRIX_TTL = 300  # seconds before a role's candidate matrix is rebuilt
+
+_AMOUNT_RE = re.compile(r'\$?\s*(\d+(?:\.\d+)?)\s*([kmb])?', re.IGNORECASE)
+_MULTIPLIERS = {'k': 1e3, 'm': 1e6, 'b': 1e9}
+
+
+def _bucket(value, dims):
+    return zlib.crc32(value.strip().lower().encode()) % dims
+
+
+def _amounts(text):
+    if not text:
+        return []
+    amounts = []
+    for number, suffix in _AMOUNT_RE.findall(text):
+        amount = float(number) * _MULTIPLIERS.get(suffix.lower(), 1)
+        if amount >= 1000:
+            amounts.append(amount)
+    return amounts
+
+
+def _region(location):
+    """Coarse region key: the last component of "City, ST" / "City, Country"."""
+    if not location:
+        return None
+    return location.split(',')[-1].strip() or None
+
+
+def _set_hashed(vector, block, values):
+    start, end = OFFSETS[block]
+    for value in values:
+        if value and value.strip():
+            vector[start + _bucket(value, end - start)] = 1.0
+
+
+def _set_stages(vector, values):
+    start, _ = OFFSETS['stage']
+    for value in values:
+        value = value.strip().lower().replace('_', ' ')
+        if value in profile_fields.STAGES:
+            vector[start + profile_fields.STAGES.index(value)] = 1.0
+
+
+def _set_amounts(vector, text):
+    start, _ = OFFSETS['amount']
+    amounts = _amounts(text)
+    if not amounts:
+        return
+    low = int(np.clip(np.log10(min(amounts)) - 4, 0, AMOUNT_BUCKETS - 1))
+    high = int(np.clip(np.log10(max(amounts)) - 4, 0, AMOUNT_BUCKETS - 1))
+    vector[start + low:start + high + 1] = 1.0
+
+
+def _set_investor_types(vector, text):
+    start, _ = OFFSETS['investor_type']
+    text = (text or '').lower()
+    for i, investor_type in enumerate(INVESTOR_TYPES):
+        if investor_type in text or (investor_type == 'venture' and 'vc' in text.split()):
+            vector[start + i] = 1.0
+
+
+def encode(profile, user):
+    """Encode one role profile (plus its owner's location) as a feature vector."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    skills = profile_fields.strings(profile.get_skills())
+
+    if profile.role == 'entrepreneur':
+        _set_hashed(vector, 'industry', [profile.industry or ''])
+        _set_stages(vector, [profile.funding_stage or ''])
+        _set_amounts(vector, profile.funding_amount)
+        _set_hashed(vector, 'geo', [_region(user.location) or ''])
+        _set_investor_types(vector, profile.looking_for_investor_type)
+    elif profile.role == 'investor':
+        preferences = profile.get_investment_preferences()
+        preference_strings = profile_fields.strings(preferences)
+        _set_hashed(vector, 'industry', preference_strings)
+        _set_stages(vector, preference_strings)
+        _set_amounts(vector, profile.investment_range)
+        _set_hashed(vector, 'geo', [_region(profile.geographic_preference or user.location) or ''])
+        _set_investor_types(vector, f'{profile.title or ""} {profile.professional_background or ""}')
+    elif profile.role == 'partner':
+        skills += profile_fields.strings(profile.get_expertise())
+        _set_hashed(vector, 'geo', [_region(profile.location_preference or user.location) or ''])
+
+    _set_hashed(vector, 'skills', skills)
+
+    # Normalize each block so a profile listing many tags doesn't outscore a focused one
+    for start, end in OFFSETS.values():
+        norm = np.linalg.norm(vector[start:end])
+        if norm:
+            vector[start:end] /= norm
+    return vector
+
+
+class CandidateMatrix:
+    """Feature matrix for every complete profile of one role, sorted by user id."""
+
+    def __init__(self, user_ids, features):
+        order = np.argsort(user_ids, kind='stable')
+        self.user_ids = np.ascontiguousarray(user_ids[order], dtype=np.int64)
+        self.features = np.ascontiguousarray(features[order], dtype=np.float32)
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from ``(profile, user)`` pairs, ``UserProfile``/``User`` or anything ``encode`` reads."""
+        rows = list(rows)
+        features = np.zeros((len(rows), DIM), dtype=np.float32)
+        user_ids = np.zeros(len(rows), dtype=np.int64)
+        for i, (profile, user) in enumerate(rows):
+            features[i] = encode(profile, user)
+            user_ids[i] = profile.user_id
+        return cls(user_ids, features)
+
+    def scores(self, query):
+        """Score every candidate against an encoded viewer in one matrix-vector product."""
+        return self.features @ (query * BLOCK_WEIGHTS)
+
+    def top_k(self, query, k, exclude_ids=()):
+        """Return ``(user_ids, scores)`` of the best ``k`` candidates, best first."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = self.scores(query)
+        if len(exclude_ids):
+            exclude_ids = np.asarray(exclude_ids, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(self.user_ids, exclude_ids), len(self.user_ids) - 1)
+            scores[positions[self.user_ids[positions] == exclude_ids]] = -np.inf
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        return self.user_ids[top], scores[top]
+
+
+# The columns ``encode`` reads
+PROFILE_COLUMNS = [
+    'user_id', 'role', 'skills', 'industry', 'funding_stage', 'funding_amount', 'looking_for_investor_type',
+    'investment_preferences', 'investment_range', 'geographic_preference', 'title', 'professional_background',
+    'expertise', 'location_preference'
+]
+
+
+class _ProfileRow:
+    """What ``encode`` needs of a profile, over a Core row instead of a ``UserProfile``."""
+
+    __slots__ = ('_row',)
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        return getattr(self._row, name)
+
+    def _json(self, name, default):
+        raw = getattr(self._row, name)
+        return json.loads(raw) if raw else default
+
+    def get_skills(self):
+        return self._json('skills', [])
+
+    def get_expertise(self):
+        return self._json('expertise', [])
+
+    def get_investment_preferences(self):
+        return self._json('investment_preferences', {})
+
+
+class _UserRow:
+    __slots__ = ('location',)
+
+    def __init__(self, location):
+        self.location = location
+
+
+_matrices = {}
+_building = {}  # role -> Event set when its rebuild finishes
+_matrices_lock = threading.Lock()
+
+
+def load_matrix(role):
+    profiles, users = UserProfile.__table__, User.__table__
+    rows = db.session.execute(
+        select(*[profiles.c[name] for name in PROFILE_COLUMNS], users.c.location.label('user_location'))
+        .join(users, profiles.c.user_id == users.c.id)
+        .where(and_(profiles.c.role == role, profiles.c.is_complete == True)),
+        execution_options={'yield_per': 1000}
+    )
+    return CandidateMatrix.from_rows((_ProfileRow(row), _UserRow(row.user_location)) for row in rows)
+
+
+def candidate_matrix(role):
+    """Cached candidate matrix for ``role``, rebuilt once it is ``MATRIX_TTL`` old.
+
+    One caller rebuilds; the others get the expired matrix meanwhile, or wait
+    when there is none yet.
+    """
+    while True:
+        with _matrices_lock:
+            matrix = _matrices.get(role)
+            if matrix is not None and time.monotonic() - matrix.built_at <= MATRIX_TTL:
+                return matrix
+            done = _building.get(role)
+            if done is None:
+                done = _building[role] = threading.Event()
+                break
+        if matrix is not None:
+            return matrix
+        # A failed first build leaves nothing behind; the next pass retries it
+        done.wait()
+
+    try:
+        matrix = load_matrix(role)
+        with _matrices_lock:
+            _matrices[role] = matrix
+        return matrix
+    finally:
+        with _matrices_lock:
+            _building.pop(role, None)
+        done.set()
+
+
+def invalidate(role=None):
+    with _matrices_lock:
+        if role is None:
+            _matrices.clear()
+        else:
+            _matrices.pop(role, None)
@@ -0,0 +1,381 @@
+"""Per-(swiper, role) seen-sets: everyone a user has swiped in a role, as a compressed bitmap.
+
+Discovery must never show a profile twice, so it excludes everyone the
+viewer already swiped. Reading that from the swipe table costs a full row per
+swipe, and most of those rows are skips kept for nothing else. A
+``RoaringBitmap`` holds the same set in about two bytes per swiped id, so
+the swipe table no longer needs the skips.
+
+The bitmap for ``(swiper_id, swiper_role)`` is stored serialized in
+``swipe_seen_set``, and ids swiped since it was last compacted are rows of
+``swipe_seen_delta``. Together they are the authority on "already swiped":
+every swipe path inserts its ids as deltas in the swipe's own transaction
+and rejects those that conflict with a delta or are in the bitmap, so a
+swipe writes one small row instead of the whole bitmap. Once a swiper has
+``COMPACT_DELTAS`` deltas, the swipe that sees it folds them into the
+bitmap. A swiper without a row (swipes from before the table existed, or
+loaded in bulk) gets one built from the swipe table on first use.
+``archive_skips`` then moves old skip rows of swipers that have a row out to
+``swipe_archive``; likes stay, since matching reads them.
+"""
+import argparse
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import and_, create_engine, delete, exists, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db, Swipe
+
+ARRAY_MAX = 4096
+BITSET_BYTES = 8192
+ARCHIVE_BATCH = 10000
+COMPACT_DELTAS = 256
+
+_HEADER = struct.Struct('<II')
+_CONTAINER = struct.Struct('<HBH')
+_ARRAY, _BITSET = 0, 1
+
+
+class SwipeSeenSet(db.Model):
+    __tablename__ = 'swipe_seen_set'
+
+    swiper_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    swiper_role = db.Column(db.String(20), primary_key=True)
+    bitmap = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0)  # as of the last compaction
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class SwipeSeenDelta(db.Model):
+    """An id swiped since the swiper's bitmap was last compacted."""
+    __tablename__ = 'swipe_seen_delta'
+
+    swiper_id = db.Column(db.Integer, primary_key=True)
+    swiper_role = db.Column(db.String(20), primary_key=True)
+    swiped_id = db.Column(db.Integer, primary_key=True)
+
+
+class SwipeArchive(db.Model):
+    """Swipe rows moved out of the hot table by ``archive_skips``, ids preserved."""
+    __tablename__ = 'swipe_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    swiper_id = db.Column(db.Integer, nullable=False)
+    swiped_id = db.Column(db.Integer, nullable=False)
+    swiper_role = db.Column(db.String(20), nullable=False)
+    swiped_role = db.Column(db.String(20), nullable=False)
+    action = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RoaringBitmap:
+    """A set of 32-bit ids split into 65536-wide containers by their high 16 bits.
+
+    A container is a sorted ``array('H')`` of low bits (two bytes per id)
+    until it holds ``ARRAY_MAX`` ids, then an 8 KiB bitset, which is smaller
+    from there on. Membership is a binary search in at most 4096 entries or
+    one bit test. Run containers from the Roaring format are left out: swiped
+    ids are scattered, so there are no runs to compress.
+    """
+
+    __slots__ = ('_containers', '_size')
+
+    def __init__(self, ids=()):
+        self._containers = {}
+        self._size = 0
+        if len(ids):
+            self.update(ids)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] >> (low & 7) & 1)
+        i = bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    @property
+    def nbytes(self):
+        """Payload size: two bytes per id in array containers, 8 KiB per bitset."""
+        return sum(len(container) * (1 if isinstance(container, bytearray) else 2)
+                   for container in self._containers.values())
+
+    def add(self, value):
+        """Add one id; returns False if it was already present."""
+        key, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(key)
+        if container is None:
+            self._containers[key] = array('H', [low])
+        elif isinstance(container, bytearray):
+            if container[low >> 3] >> (low & 7) & 1:
+                return False
+            container[low >> 3] |= 1 << (low & 7)
+        else:
+            i = bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                return False
+            container.insert(i, low)
+            if len(container) > ARRAY_MAX:
+                self._containers[key] = _to_bitset(np.frombuffer(container, dtype=np.uint16))
+        self._size += 1
+        return True
+
+    def update(self, ids):
+        """Add many ids at once."""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        keys = ids >> 16
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for chunk in np.split(ids, bounds):
+            key = int(chunk[0] >> 16)
+            lows = (chunk & 0xFFFF).astype(np.uint16)
+            container = self._containers.get(key)
+            if isinstance(container, bytearray):
+                before = _popcount(container)
+                bits = np.frombuffer(container, dtype=np.uint8).copy()
+                np.bitwise_or.at(bits, lows >> 3, (1 << (lows & 7)).astype(np.uint8))
+                container = self._containers[key] = bytearray(bits.tobytes())
+                self._size += _popcount(container) - before
+                continue
+            existing = np.frombuffer(container, dtype=np.uint16) if container is not None else lows[:0]
+            merged = np.union1d(existing, lows)
+            self._size += len(merged) - len(existing)
+            self._containers[key] = _to_bitset(merged) if len(merged) > ARRAY_MAX else array('H', merged.tobytes())
+
+    def to_array(self):
+        """Every id, ascending, as an ``int64`` array."""
+        parts = []
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            if isinstance(container, bytearray):
+                lows = np.flatnonzero(np.unpackbits(np.frombuffer(container, dtype=np.uint8), bitorder='little'))
+            else:
+                lows = np.frombuffer(container, dtype=np.uint16)
+            parts.append(lows.astype(np.int64) + (key << 16))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def to_bytes(self):
+        out = [_HEADER.pack(len(self._containers), self._size)]
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            if isinstance(container, bytearray):
+                out.append(_CONTAINER.pack(key, _BITSET, 0))
+                out.append(bytes(container))
+            else:
+                out.append(_CONTAINER.pack(key, _ARRAY, len(container)))
+                out.append(_little_endian(container).tobytes())
+        return b''.join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        bitmap = cls()
+        count, bitmap._size = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        for _ in range(count):
+            key, kind, length = _CONTAINER.unpack_from(data, offset)
+            offset += _CONTAINER.size
+            if kind == _BITSET:
+                bitmap._containers[key] = bytearray(data[offset:offset + BITSET_BYTES])
+                offset += BITSET_BYTES
+            else:
+                container = array('H', data[offset:offset + 2 * length])
+                bitmap._containers[key] = _little_endian(container)
+                offset += 2 * length
+        return bitmap
+
+
+def _to_bitset(lows):
+    bits = np.zeros(65536, dtype=bool)
+    bits[lows] = True
+    return bytearray(np.packbits(bits, bitorder='little').tobytes())
+
+
+def _popcount(container):
+    return int(np.unpackbits(np.frombuffer(container, dtype=np.uint8)).sum())
+
+
+def _little_endian(container):
+    if sys.byteorder == 'big':
+        container = array('H', container)
+        container.byteswap()
+    return container
+
+
+def insert_ignore(table):
+    """INSERT that skips rows violating a unique index, where the dialect supports it."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def _key(table, swiper_id, role):
+    return and_(table.c.swiper_id == swiper_id, table.c.swiper_role == role)
+
+
+def _from_swipes(swiper_id, role, leave_out=()):
+    swipes = Swipe.__table__
+    query = select(swipes.c.swiped_id).where(and_(
+        swipes.c.swiper_id == swiper_id,
+        swipes.c.swiper_role == role
+    ))
+    if leave_out:
+        query = query.where(swipes.c.swiped_id.not_in(leave_out))
+    return RoaringBitmap(db.session.execute(query).scalars().all())
+
+
+def _create(swiper_id, role, leave_out=()):
+    """Build the swiper's missing bitmap row from the swipe table; returns the bitmap stored.
+
+    ``leave_out`` are swipes the caller just inserted, kept out of the build
+    so they don't look like repeats. Only swipers with a row have archived
+    swipes, so a build never misses a real repeat the unique index allowed.
+    """
+    table = SwipeSeenSet.__table__
+    bitmap = _from_swipes(swiper_id, role, leave_out)
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(table).values(
+                swiper_id=swiper_id, swiper_role=role, bitmap=bitmap.to_bytes(),
+                size=len(bitmap), updated_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        # A concurrent first swipe created it
+        return RoaringBitmap.from_bytes(db.session.execute(
+            select(table.c.bitmap).where(_key(table, swiper_id, role))
+        ).scalar_one())
+    return bitmap
+
+
+def load(swiper_id, role):
+    """The seen-set of ``(swiper_id, role)``, for reading."""
+    row = db.session.get(SwipeSeenSet, (swiper_id, role))
+    if row is None:
+        return _from_swipes(swiper_id, role)
+    bitmap = RoaringBitmap.from_bytes(row.bitmap)
+    deltas = SwipeSeenDelta.__table__
+    swiped_ids = db.session.execute(
+        select(deltas.c.swiped_id).where(_key(deltas, swiper_id, role))
+    ).scalars().all()
+    if swiped_ids:
+        bitmap.update(swiped_ids)
+    return bitmap
+
+
+def add(swiper_id, role, swiped_ids):
+    """Record swipes in the seen-set (joins the caller's transaction); returns the ids that were already in it."""
+    table, deltas = SwipeSeenSet.__table__, SwipeSeenDelta.__table__
+    swiped_ids = list(dict.fromkeys(swiped_ids))
+    if not swiped_ids:
+        return []
+    inserted = set(db.session.execute(insert_ignore(deltas).values([
+        {'swiper_id': swiper_id, 'swiper_role': role, 'swiped_id': swiped_id} for swiped_id in swiped_ids
+    ]).returning(deltas.c.swiped_id)).scalars())
+
+    # Read after the insert, which waits for a compaction deleting one of these ids; it has folded it in by now
+    row = db.session.execute(select(
+        table.c.bitmap,
+        select(func.count()).select_from(deltas).where(_key(deltas, swiper_id, role)).scalar_subquery()
+    ).where(_key(table, swiper_id, role))).first()
+    if row is None:
+        bitmap, pending = _create(swiper_id, role, swiped_ids), 0
+    else:
+        bitmap, pending = RoaringBitmap.from_bytes(row[0]), row[1]
+
+    repeated = [swiped_id for swiped_id in swiped_ids if swiped_id not in inserted or swiped_id in bitmap]
+    if pending >= COMPACT_DELTAS:
+        compact(swiper_id, role)
+    return repeated
+
+
+def discard(swiper_id, role, swiped_ids):
+    """Take back ids this transaction just added, for swipes it ended up rejecting."""
+    deltas = SwipeSeenDelta.__table__
+    db.session.execute(delete(deltas).where(and_(
+        _key(deltas, swiper_id, role),
+        deltas.c.swiped_id.in_(swiped_ids)
+    )))
+
+
+def compact(swiper_id, role):
+    """Fold the swiper's deltas into the bitmap and delete them (joins the caller's transaction).
+
+    The row is locked by writing it first rather than ``SELECT ... FOR
+    UPDATE``, which SQLite ignores; a write takes its database lock too.
+    """
+    table, deltas = SwipeSeenSet.__table__, SwipeSeenDelta.__table__
+    key = _key(table, swiper_id, role)
+    if not db.session.execute(update(table).where(key).values(updated_at=datetime.utcnow())).rowcount:
+        return
+    bitmap = RoaringBitmap.from_bytes(db.session.execute(select(table.c.bitmap).where(key)).scalar_one())
+    swiped_ids = db.session.execute(
+        select(deltas.c.swiped_id).where(_key(deltas, swiper_id, role))
+    ).scalars().all()
+    if not swiped_ids:
+        return
+    bitmap.update(swiped_ids)
+    db.session.execute(update(table).where(key).values(bitmap=bitmap.to_bytes(), size=len(bitmap)))
+    db.session.execute(delete(deltas).where(and_(
+        _key(deltas, swiper_id, role),
+        deltas.c.swiped_id.in_(swiped_ids)
+    )))
+
+
+def archive_skips(connection, older_than, batch_size=ARCHIVE_BATCH):
+    """Move skip swipes older than ``older_than`` to ``swipe_archive``; returns the number moved.
+
+    Only swipers with a seen-set are touched, since a missing one is rebuilt
+    from the swipe table. Each batch commits on its own.
+    """
+    swipes, archive, seen = Swipe.__table__, SwipeArchive.__table__, SwipeSeenSet.__table__
+    columns = ['id', 'swiper_id', 'swiped_id', 'swiper_role', 'swiped_role', 'action', 'created_at']
+    candidates = select(swipes.c.id).where(and_(
+        swipes.c.action == 'skip',
+        swipes.c.created_at < older_than,
+        exists().where(and_(seen.c.swiper_id == swipes.c.swiper_id, seen.c.swiper_role == swipes.c.swiper_role))
+    )).order_by(swipes.c.id).limit(batch_size)
+
+    moved = 0
+    while True:
+        ids = connection.execute(candidates).scalars().all()
+        if not ids:
+            return moved
+        connection.execute(insert(archive).from_select(
+            columns, select(*[swipes.c[name] for name in columns]).where(swipes.c.id.in_(ids))
+        ))
+        connection.execute(delete(swipes).where(swipes.c.id.in_(ids)))
+        connection.commit()
+        moved += len(ids)
+
+
+def main():
+    from src.services.async_db import database_url
+
+    parser = argparse.ArgumentParser(description='Archive old skip swipes already recorded in seen-sets.')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--days', type=int, default=30, help='archive skips older than this')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url or database_url())
+    with engine.connect() as connection:
+        moved = archive_skips(connection, datetime.utcnow() - timedelta(days=args.days))
+    print(f'archived {moved} skip swipes')
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
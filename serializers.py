@@ -0,0 +1,295 @@
+"""Response serialization for the list endpoints.
+
+Serializers are compiled once per model shape (and once per requested
+sparse fieldset, keeping the ``MAX_FIELDSETS`` most recently used) into a
+plain function that builds the response dict with straight attribute reads,
+instead of going through ``to_dict`` for every row.
+JSON blob columns (skills, expertise, ...) are decoded through a small cache
+because the same few values repeat across thousands of profiles.
+
+``render`` replaces ``jsonify`` for these endpoints. It picks MessagePack
+when the client sends ``Accept: application/msgpack`` and compresses bodies
+over ``MIN_COMPRESS_SIZE`` bytes with brotli or gzip, depending on
+``Accept-Encoding``.
+"""
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
+
+import brotli
+import msgpack
+from flask import current_app, has_request_context, request
+from sqlalchemy import DateTime
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from src.models.user import User, UserProfile
+from src.services.photo_store import variant_url
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# ?fields= is client-controlled, so compiled fieldsets are kept in a bounded LRU
+MAX_FIELDSETS = 64
+
+
+@lru_cache(maxsize=4096)
+def _parse_json(raw):
+    return json.loads(raw)
+
+
+def _json(raw, default):
+    # Cached values are shared between responses, so they must never be mutated
+    return _parse_json(raw) if raw else default
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _thumb(url):
+    return variant_url(url, 'thumb')
+
+
+HELPERS = {'_json': _json, '_iso': _iso, '_thumb': _thumb}
+
+
+class Field:
+    """One output key: a Python expression over ``obj`` (and ``viewer_id``), or a nested serializer."""
+
+    def __init__(self, name, expr, nested=None):
+        self.name = name
+        self.expr = expr
+        self.nested = nested
+
+
+class Serializer:
+    def __init__(self, fields):
+        self.fields = {field.name: field for field in fields}
+        self._compiled = OrderedDict()
+        self._compiled_lock = threading.Lock()
+        self._function = self._compile()
+
+    def __call__(self, obj, viewer_id=None):
+        return self._function(obj, viewer_id)
+
+    def many(self, objs, viewer_id=None):
+        function = self._function
+        return [function(obj, viewer_id) for obj in objs]
+
+    def only(self, names):
+        """The serializer restricted to ``names``; ``profile.skills`` selects inside a nested field.
+
+        Raises ValueError for unknown names. ``None`` or an empty list means all fields.
+        """
+        if not names:
+            return self
+        key = tuple(sorted(set(names)))
+        with self._compiled_lock:
+            serializer = self._compiled.get(key)
+            if serializer is not None:
+                self._compiled.move_to_end(key)
+                return serializer
+        serializer = self._restrict(key)
+        with self._compiled_lock:
+            self._compiled[key] = serializer
+            while len(self._compiled) > MAX_FIELDSETS:
+                self._compiled.popitem(last=False)
+        return serializer
+
+    def _restrict(self, names):
+        selected = {}
+        for name in names:
+            head, _, rest = name.partition('.')
+            field = self.fields.get(head)
+            if field is None or (rest and field.nested is None):
+                raise ValueError(f'Unknown field: {name}')
+            subfields = selected.setdefault(head, [])
+            if rest and subfields is not None:
+                subfields.append(rest)
+            elif not rest:
+                selected[head] = None  # the whole nested object
+
+        fields = []
+        for name, field in self.fields.items():
+            if name not in selected:
+                continue
+            if field.nested is not None and selected[name]:
+                field = Field(name, field.expr, field.nested.only(selected[name]))
+            fields.append(field)
+        return Serializer(fields)
+
+    def _compile(self):
+        namespace = dict(HELPERS)
+        items = []
+        for index, field in enumerate(self.fields.values()):
+            if field.nested is not None:
+                namespace[f'_nested{index}'] = field.nested._function
+                items.append(f'{field.name!r}: _nested{index}({field.expr}, viewer_id)')
+            else:
+                items.append(f'{field.name!r}: {field.expr}')
+        source = (
+            'def serialize(obj, viewer_id):\n'
+            '    if obj is None:\n'
+            '        return None\n'
+            f'    return {{{", ".join(items)}}}\n'
+        )
+        exec(source, namespace)
+        return namespace['serialize']
+
+
+def model_fields(model, obj='obj', json_columns=None, exclude=()):
+    """One ``Field`` per table column; DateTime columns become ISO strings."""
+    json_columns = json_columns or {}
+    fields = []
+    for column in model.__table__.columns:
+        if column.key in exclude:
+            continue
+        expr = f'{obj}.{column.key}'
+        if column.key in json_columns:
+            expr = f'_json({expr}, {json_columns[column.key]})'
+        elif isinstance(column.type, DateTime):
+            expr = f'_iso({expr})'
+        fields.append(Field(column.key, expr))
+    return fields
+
+
+PROFILE_JSON_COLUMNS = {'skills': '[]', 'expertise': '[]', 'investment_preferences': '{}'}
+
+PROFILE = Serializer(model_fields(UserProfile, json_columns=PROFILE_JSON_COLUMNS))
+
+PUBLIC_USER = Serializer([
+    Field('id', 'obj.id'),
+    Field('name', 'obj.name'),
+    Field('age', 'obj.age'),
+    Field('location', 'obj.location'),
+    Field('photo_url', 'obj.photo_url'),
+    Field('current_role', 'obj.current_role'),
+    Field('social_links', "_json(obj.social_links, {})")
+])
+
+# /discover card over a (UserProfile, User) row: the profile plus the user's public basics
+DISCOVER_CARD = Serializer(
+    model_fields(UserProfile, obj='obj[0]', json_columns=PROFILE_JSON_COLUMNS) + [
+        Field('name', 'obj[1].name'),
+        Field('age', 'obj[1].age'),
+        Field('location', 'obj[1].location'),
+        Field('photo_url', 'obj[1].photo_url')
+    ]
+)
+
+# /matches card over a (Match, User, UserProfile, MatchActivity, unread_count, ...) row
+MATCH_CARD = Serializer([
+    Field('match_id', 'obj[0].id'),
+    Field('user', 'obj', Serializer([
+        Field('id', 'obj[1].id'),
+        Field('name', 'obj[1].name'),
+        Field('photo_url', '_thumb(obj[1].photo_url)'),
+        Field('role', 'obj[2].role')
+    ])),
+    Field('profile', 'obj[2]', PROFILE),
+    Field('created_at', '_iso(obj[0].created_at)'),
+    Field('chat_unlocked', 'obj[0].chat_unlocked'),
+    Field('last_activity_at', '_iso(obj[3].last_activity_at if obj[3] is not None else obj[0].created_at)'),
+    Field('last_message', 'obj[3] if obj[3] is not None and obj[3].last_message_id else None', Serializer([
+        Field('id', 'obj.last_message_id'),
+        Field('content', 'obj.last_message_preview'),
+        Field('sender_id', 'obj.last_sender_id'),
+        Field('is_from_me', 'obj.last_sender_id == viewer_id')
+    ])),
+    Field('unread_count', 'obj[4]')
+])
+
+MESSAGE = Serializer([
+    Field('id', 'obj.id'),
+    Field('content', 'obj.content'),
+    Field('sender_id', 'obj.sender_id'),
+    Field('is_from_me', 'obj.sender_id == viewer_id'),
+    Field('created_at', '_iso(obj.created_at)')
+])
+
+
+def parse_fields(value):
+    """Split a ``fields=a,b,profile.skills`` parameter; None when absent or empty."""
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()] or None
+
+
+def requested_fields():
+    """The sparse fieldset of the current Flask request, or None."""
+    return parse_fields(request.args.get('fields'))
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+def encode(payload, mimetype='application/json'):
+    if mimetype in MSGPACK_MIMETYPES:
+        return msgpack.packb(payload, default=_default)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False, default=_default).encode()
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, GZIP_LEVEL)
+    return body
+
+
+def negotiate(accept=None, accept_encoding=None):
+    """``(mimetype, content_encoding)`` for the given header values; encoding may be None.
+
+    Without arguments the headers of the current Flask request are used.
+    """
+    if accept is None and accept_encoding is None and has_request_context():
+        accept_mimetypes, accept_encodings = request.accept_mimetypes, request.accept_encodings
+    else:
+        accept_mimetypes = parse_accept_header(accept, MIMEAccept)
+        accept_encodings = parse_accept_header(accept_encoding)
+
+    mimetype = accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES, 'application/json')
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if accept_encodings[candidate]:
+            encoding = candidate
+            break
+    return mimetype, encoding
+
+
+def representation_etag(etag, negotiated=None):
+    """``etag`` specialised to the negotiated format, so caches never mix representations."""
+    mimetype, encoding = negotiated or negotiate()
+    suffix = '-msgpack' if mimetype in MSGPACK_MIMETYPES else ''
+    return f'{etag}{suffix}-{encoding}' if encoding else f'{etag}{suffix}'
+
+
+def encode_body(payload, negotiated):
+    """``(body, content_encoding)``; small bodies are left uncompressed."""
+    mimetype, encoding = negotiated
+    body = encode(payload, mimetype)
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+def render(payload, status=200, etag=None):
+    """Encode ``payload`` for the current request; drop-in for ``jsonify(payload), status``."""
+    negotiated = negotiate()
+    body, encoding = encode_body(payload, negotiated)
+
+    response = current_app.response_class(body, status=status, mimetype=negotiated[0])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    if etag:
+        response.set_etag(representation_etag(etag, negotiated))
+    return response
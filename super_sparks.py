@@ -0,0 +1,129 @@
+"""Per-user Super Spark quota with a lazily applied weekly refill.
+
+The balance lives on the user row: ``super_spark_count`` is what was left
+after the last spend and ``super_spark_reset_date`` is when the current
+week started. Nothing ever runs to refill it. A week after the reset date
+the balance simply *reads* as ``WEEKLY_QUOTA`` (``balance()``), and the
+next spend writes the refill and the debit together.
+
+Spending is one conditional ``UPDATE``: the ``WHERE`` clause only matches if
+a refill is due or enough sparks are left, and the ``SET`` clause picks
+refill-then-debit or plain debit from the same row version. The database
+re-checks the condition under its row lock, so concurrent spends from any
+number of workers can never overdraw. The lock lasts only for that one
+statement's transaction and is never held across requests.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_, update
+
+from src.models.user import db, User
+
+WEEKLY_QUOTA = 3
+REFILL_PERIOD = timedelta(days=7)
+
+
+def refill_due(now, users=None):
+    """SQL condition: the user's week is over, so the next read sees a full quota."""
+    users = User.__table__ if users is None else users
+    return or_(
+        users.c.super_spark_reset_date.is_(None),
+        users.c.super_spark_reset_date <= now - REFILL_PERIOD
+    )
+
+
+def balance(now, users=None):
+    """SQL expression for the spendable balance, refill included."""
+    users = User.__table__ if users is None else users
+    return case(
+        (refill_due(now, users), WEEKLY_QUOTA),
+        else_=func.coalesce(users.c.super_spark_count, 0)
+    )
+
+
+def consume_statement(user_id, count=1, now=None, where=None):
+    """``UPDATE ... RETURNING super_spark_count`` spending ``count`` sparks.
+
+    It matches no row when the balance is too small, so "no rows" means
+    "rejected". ``where`` adds conditions, for example that the swipe paying
+    for the spark was actually inserted.
+    """
+    users = User.__table__
+    now = now or datetime.utcnow()
+    due = refill_due(now, users)
+    conditions = [
+        users.c.id == user_id,
+        or_(
+            and_(due, count <= WEEKLY_QUOTA),
+            and_(~due, func.coalesce(users.c.super_spark_count, 0) >= count)
+        )
+    ]
+    if where is not None:
+        conditions.append(where)
+    return update(users).where(and_(*conditions)).values(
+        super_spark_count=case(
+            (due, WEEKLY_QUOTA - count),
+            else_=func.coalesce(users.c.super_spark_count, 0) - count
+        ),
+        super_spark_reset_date=case((due, now), else_=users.c.super_spark_reset_date)
+    ).returning(users.c.super_spark_count)
+
+
+def consume(user_id, count=1, now=None):
+    """Spend ``count`` sparks; returns the new balance, or None if there weren't enough.
+
+    Joins the caller's transaction.
+    """
+    return db.session.execute(consume_statement(user_id, count, now)).scalar()
+
+
+async def consume_async(session, user_id, count=1, now=None):
+    return (await session.execute(consume_statement(user_id, count, now))).scalar()
+
+
+def refund(user_id, count=1, now=None):
+    """Give back ``count`` sparks paid for swipes that were never recorded, up to ``WEEKLY_QUOTA``.
+
+    A user whose week has ended since reads as a full quota anyway and is
+    left alone. Joins the caller's transaction.
+    """
+    users = User.__table__
+    now = now or datetime.utcnow()
+    refunded = func.coalesce(users.c.super_spark_count, 0) + count
+    db.session.execute(update(users).where(and_(users.c.id == user_id, ~refill_due(now, users))).values(
+        super_spark_count=case((refunded > WEEKLY_QUOTA, WEEKLY_QUOTA), else_=refunded)
+    ))
+
+
+def is_refill_due(super_spark_reset_date, now=None):
+    """``refill_due`` for an already loaded reset date."""
+    now = now or datetime.utcnow()
+    return super_spark_reset_date is None or super_spark_reset_date <= now - REFILL_PERIOD
+
+
+def refilled(super_spark_count, super_spark_reset_date, now=None):
+    """True if the lazy refill applies to this row: its week is over and it had spent sparks."""
+    return is_refill_due(super_spark_reset_date, now) and (super_spark_count or 0) < WEEKLY_QUOTA
+
+
+def remaining(super_spark_count, super_spark_reset_date, now=None):
+    """The spendable balance of an already loaded user row."""
+    if is_refill_due(super_spark_reset_date, now):
+        return WEEKLY_QUOTA
+    return super_spark_count or 0
+
+
+def next_refill(super_spark_reset_date, now=None):
+    """When the balance next refills: a week after the reset date, or now if that has passed."""
+    now = now or datetime.utcnow()
+    if is_refill_due(super_spark_reset_date, now):
+        return now
+    return super_spark_reset_date + REFILL_PERIOD
+
+
+def status(user, now=None):
+    now = now or datetime.utcnow()
+    return {
+        'super_spark_count': remaining(user.super_spark_count, user.super_spark_reset_date, now),
+        'next_reset': next_refill(user.super_spark_reset_date, now).isoformat()
+    }
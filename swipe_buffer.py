@@ -0,0 +1,447 @@
+"""Batched swipe ingestion with a write-behind buffer.
+
+``record_batch`` validates an ordered list of swipes with a fixed number of
+batched reads, writes what must be visible immediately (super spark debits,
+matches, discovery queue cleanup) in one transaction, and hands the swipe
+rows to a process-wide ``SwipeBuffer``. The buffer flushes them with
+multi-row INSERTs once it holds ``SWIPE_BUFFER_SIZE`` rows or its oldest row
+is ``SWIPE_BUFFER_INTERVAL`` seconds old.
+
+Buffered likes stay visible to match detection through the buffer's pending
+index, and every flush re-runs the reciprocal check in SQL for the rows it
+wrote, so a mutual like split across two workers' buffers still matches;
+those matches are published like any other.
+
+On PostgreSQL a flush takes the same per-pair advisory locks as the
+single-statement /swipe path before it inserts, so a flushed like and a
+direct like from the other side can't both miss each other.
+
+A flush that fails with a row-level error (``IntegrityError``,
+``DataError``) is bisected down to the rows that fail on their own; those
+are dropped, logged and counted, and what ``record_batch`` did for them is
+undone: they leave the seen-set and super sparks are refunded. Any other
+error (a lost connection, the database being down) requeues the unwritten
+rows untouched, and flushes back off up to ``MAX_RETRY_INTERVAL``.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, case, literal, select, text, tuple_
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import aliased
+
+from src.models.user import db, User, Swipe, Match
+from src.services import metrics, principal_cache, realtime, seen_set, super_sparks
+from src.services.discovery_queue import DiscoveryQueueEntry, TARGET_ROLES
+from src.services.metrics import LATENCY_BUCKETS, Histogram
+from src.services.seen_set import insert_ignore
+from src.services.swipe_pipeline import POSITIVE_ACTIONS, SwipeError
+
+MAX_BATCH = 100
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 0.5
+MAX_RETRY_INTERVAL = 30.0
+# Errors that say something about the rows written, not about the database
+ROW_ERRORS = (IntegrityError, DataError)
+
+
+def _key(row):
+    return row['swiper_id'], row['swiped_id'], row['swiper_role'], row['swiped_role']
+
+
+class SwipeBuffer:
+    def __init__(self, app, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.app = app
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._pending = {}  # (swiper_id, swiped_id, swiper_role, swiped_role) -> action
+        self._retry_interval = flush_interval
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+
+        self.flush_seconds = Histogram(LATENCY_BUCKETS)
+        self.flush_rows = Histogram([1, 10, 50, 100, 250, 500, 1000, 2500])
+        self.rows_flushed = 0
+        self.rows_dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name='swipe-buffer', daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, rows):
+        with self._lock:
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            for row in rows:
+                self._pending[_key(row)] = row['action']
+            if len(self._rows) >= self.flush_size:
+                self._wakeup.notify()
+
+    def pending_action(self, swiper_id, swiped_id, swiper_role, swiped_role):
+        """Action of a swipe still waiting in the buffer, or None."""
+        return self._pending.get((swiper_id, swiped_id, swiper_role, swiped_role))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if len(self._rows) >= self.flush_size:
+                        break
+                    if self._rows and time.monotonic() - self._oldest >= self.flush_interval:
+                        break
+                    timeout = self.flush_interval
+                    if self._rows:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - self._oldest))
+                    self._wakeup.wait(timeout)
+                if self._closed and not self._rows:
+                    return
+            try:
+                self.flush()
+                self._retry_interval = self.flush_interval
+            except Exception:
+                if self._closed:
+                    self.app.logger.exception('Swipe buffer closed with %d unwritten swipes', len(self._rows))
+                    return
+                self.app.logger.exception('Swipe buffer flush failed; retrying in %.1fs', self._retry_interval)
+                time.sleep(self._retry_interval)
+                self._retry_interval = min(self._retry_interval * 2, MAX_RETRY_INTERVAL)
+
+    def _write(self, rows):
+        """Insert ``rows`` in one transaction; returns the matches it created."""
+        positive = [row for row in rows if row['action'] in POSITIVE_ACTIONS]
+        with self.app.app_context():
+            try:
+                _lock_pairs(positive)
+                db.session.execute(insert_ignore(Swipe.__table__), rows)
+                created = _create_missed_matches(positive)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        return created
+
+    def _write_bisecting(self, rows, created, written, failed):
+        """Write ``rows``, splitting chunks on row-level errors until only rows that fail alone are ``failed``.
+
+        Any other error propagates at once, without splitting.
+        """
+        try:
+            created.extend(self._write(rows))
+            written.extend(rows)
+        except ROW_ERRORS as e:
+            if len(rows) == 1:
+                failed.append((rows[0], e))
+                return
+            middle = len(rows) // 2
+            self._write_bisecting(rows[:middle], created, written, failed)
+            self._write_bisecting(rows[middle:], created, written, failed)
+
+    def _release(self, rows):
+        """Undo what ``record_batch`` did for swipes that will never be written."""
+        with self.app.app_context():
+            try:
+                for row in rows:
+                    seen_set.discard(row['swiper_id'], row['swiper_role'], [row['swiped_id']])
+                    if row['action'] == 'super_spark':
+                        super_sparks.refund(row['swiper_id'])
+                db.session.commit()
+                for user_id in {row['swiper_id'] for row in rows if row['action'] == 'super_spark'}:
+                    principal_cache.invalidate_user(user_id)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Failed to release %d dropped swipes', len(rows))
+
+    def flush(self):
+        """Write every buffered row; rows stay pending until their transaction commits or they are dropped.
+
+        Re-raises an error that isn't row-level after requeueing the rows not written yet.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                self._oldest = None
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            created, written, failed = [], [], []
+            error = None
+            try:
+                self._write_bisecting(rows, created, written, failed)
+            except Exception as e:
+                error = e
+
+            dropped = [row for row, _ in failed]
+            done = {id(row) for row in written} | {id(row) for row in dropped}
+            retry = [row for row in rows if id(row) not in done]
+            with self._lock:
+                if retry:
+                    self._rows[:0] = retry
+                    self._oldest = time.monotonic()
+                for row in written + dropped:
+                    self._pending.pop(_key(row), None)
+
+            for row, row_error in failed:
+                self.app.logger.error('Dropping swipe %s: %s', row, row_error)
+            if dropped:
+                self._release(dropped)
+            for match in created:
+                realtime.publish_to_users([match.user1_id, match.user2_id], 'match', {'match_id': match.id})
+
+            self.rows_dropped += len(dropped)
+            if written:
+                self.flush_seconds.observe(time.perf_counter() - started)
+                self.flush_rows.observe(len(written))
+                self.rows_flushed += len(written)
+            if error is not None:
+                raise error
+            return len(written)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            'pending': len(self._rows),
+            'rows_flushed': self.rows_flushed,
+            'rows_dropped': self.rows_dropped,
+            'flush_seconds': self.flush_seconds.snapshot(),
+            'flush_rows': self.flush_rows.snapshot()
+        }
+
+
+def _lock_pairs(rows):
+    """Take the /swipe path's per-pair advisory locks for these likes, in a fixed order (PostgreSQL only).
+
+    Joins the caller's transaction, and must come before its reciprocal check.
+    """
+    if not rows or db.engine.dialect.name != 'postgresql':
+        return
+    pairs = sorted({(min(row['swiper_id'], row['swiped_id']), max(row['swiper_id'], row['swiped_id']))
+                    for row in rows})
+    # PostgreSQL evaluates a volatile select list after the ORDER BY sort, so the locks go in pair order
+    db.session.execute(text(
+        'SELECT pg_advisory_xact_lock(low, high) FROM unnest(CAST(:low AS integer[]), CAST(:high AS integer[]))'
+        ' AS pair(low, high) ORDER BY low, high'
+    ), {'low': [low for low, _ in pairs], 'high': [high for _, high in pairs]})
+
+
+def _create_missed_matches(rows):
+    """Create matches for flushed likes whose reciprocal like landed from another worker; returns them."""
+    if not rows:
+        return []
+    swipe = aliased(Swipe.__table__, name='swipe')
+    reverse = aliased(Swipe.__table__, name='reverse_swipe')
+    first = swipe.c.swiper_id < swipe.c.swiped_id
+    matches = Match.__table__
+    return db.session.execute(insert_ignore(matches).from_select(
+        ['user1_id', 'user2_id', 'user1_role', 'user2_role', 'created_at'],
+        select(
+            case((first, swipe.c.swiper_id), else_=swipe.c.swiped_id),
+            case((first, swipe.c.swiped_id), else_=swipe.c.swiper_id),
+            case((first, swipe.c.swiper_role), else_=swipe.c.swiped_role),
+            case((first, swipe.c.swiped_role), else_=swipe.c.swiper_role),
+            literal(datetime.utcnow())
+        ).join(reverse, and_(
+            reverse.c.swiper_id == swipe.c.swiped_id,
+            reverse.c.swiped_id == swipe.c.swiper_id,
+            reverse.c.swiper_role == swipe.c.swiped_role,
+            reverse.c.swiped_role == swipe.c.swiper_role
+        )).where(and_(
+            tuple_(swipe.c.swiper_id, swipe.c.swiped_id, swipe.c.swiper_role, swipe.c.swiped_role).in_(
+                [(row['swiper_id'], row['swiped_id'], row['swiper_role'], row['swiped_role']) for row in rows]
+            ),
+            swipe.c.action.in_(POSITIVE_ACTIONS),
+            reverse.c.action.in_(POSITIVE_ACTIONS)
+        )).distinct()
+    ).returning(matches.c.id, matches.c.user1_id, matches.c.user2_id)).all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                app = current_app._get_current_object()
+                _buffer = SwipeBuffer(
+                    app,
+                    flush_size=app.config.get('SWIPE_BUFFER_SIZE', DEFAULT_FLUSH_SIZE),
+                    flush_interval=app.config.get('SWIPE_BUFFER_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+                )
+                atexit.register(_buffer.close)
+                metrics.register_source('swipe_buffer', _buffer.stats, counters=('rows_flushed', 'rows_dropped'))
+    return _buffer
+
+
+def record_batch(user_id, items):
+    """Record an ordered list of ``{'user_id', 'action'}`` swipes; returns per-item results.
+
+    Raises ``SwipeError`` only for problems with the swiper; problems with an
+    individual item are reported in its result.
+    """
+    users, swipes, matches = User.__table__, Swipe.__table__, Match.__table__
+    buffer = get_buffer()
+
+    me = db.session.execute(
+        select(users.c.current_role, super_sparks.balance(datetime.utcnow(), users)).where(users.c.id == user_id)
+    ).first()
+    if me is None:
+        raise SwipeError('User not found', 404)
+    current_role, super_spark_count = me
+    target_role = TARGET_ROLES.get(current_role)
+    if target_role is None:
+        raise SwipeError('Invalid role')
+
+    results = []
+    accepted = []
+    seen = set()
+    for item in items:
+        swiped_user_id = item.get('user_id') if isinstance(item, dict) else None
+        action = item.get('action') if isinstance(item, dict) else None
+        result = {'user_id': swiped_user_id, 'action': action, 'match': False}
+        results.append(result)
+        try:
+            swiped_user_id = result['user_id'] = int(swiped_user_id)
+        except (TypeError, ValueError):
+            result['error'] = 'Missing required fields'
+            continue
+        if action not in ['like', 'skip', 'super_spark']:
+            result['error'] = 'Invalid action'
+        elif swiped_user_id == user_id:
+            result['error'] = 'Cannot swipe on yourself'
+        elif swiped_user_id in seen:
+            result['error'] = 'Already swiped on this profile'
+        else:
+            seen.add(swiped_user_id)
+            accepted.append(result)
+
+    ids = [result['user_id'] for result in accepted]
+    if ids:
+        known = {row[0] for row in db.session.execute(select(users.c.id).where(users.c.id.in_(ids)))}
+        swiped = seen_set.load(user_id, current_role)
+        liked_me = {row[0] for row in db.session.execute(select(swipes.c.swiper_id).where(and_(
+            swipes.c.swiper_id.in_(ids),
+            swipes.c.swiped_id == user_id,
+            swipes.c.swiper_role == target_role,
+            swipes.c.swiped_role == current_role,
+            swipes.c.action.in_(POSITIVE_ACTIONS)
+        )))}
+    else:
+        known = swiped = liked_me = set()
+
+    sparks_left = super_spark_count
+    sparks_used = 0
+    valid = []
+    for result in accepted:
+        swiped_user_id, action = result['user_id'], result['action']
+        if swiped_user_id not in known:
+            result['error'] = 'User not found'
+        elif swiped_user_id in swiped or buffer.pending_action(user_id, swiped_user_id, current_role, target_role):
+            result['error'] = 'Already swiped on this profile'
+        elif action == 'super_spark' and sparks_used >= sparks_left:
+            result['error'] = 'No super sparks remaining'
+        else:
+            if action == 'super_spark':
+                sparks_used += 1
+            valid.append(result)
+
+    if valid:
+        # Another batch of this user's may have swiped some of them since the set was loaded
+        repeated = set(seen_set.add(user_id, current_role, [result['user_id'] for result in valid]))
+        for result in valid:
+            if result['user_id'] in repeated:
+                result['error'] = 'Already swiped on this profile'
+                if result['action'] == 'super_spark':
+                    sparks_used -= 1
+        valid = [result for result in valid if 'error' not in result]
+
+    if sparks_used:
+        debited = super_sparks.consume(user_id, sparks_used)
+        if debited is None:
+            # Another request spent sparks since we read the balance; reject this batch's
+            for result in valid:
+                if result['action'] == 'super_spark':
+                    result['error'] = 'No super sparks remaining'
+            seen_set.discard(user_id, current_role, [result['user_id'] for result in valid if 'error' in result])
+            valid = [result for result in valid if result['action'] != 'super_spark']
+            sparks_used = 0
+        else:
+            # Concurrent spends may have left less than we read
+            sparks_left = debited + sparks_used
+
+    now = datetime.utcnow()
+    match_rows = []
+    for result in valid:
+        other_id = result['user_id']
+        if result['action'] in POSITIVE_ACTIONS and (
+            other_id in liked_me
+            or buffer.pending_action(other_id, user_id, target_role, current_role) in POSITIVE_ACTIONS
+        ):
+            user_is_first = user_id < other_id
+            match_rows.append({
+                'user1_id': min(user_id, other_id),
+                'user2_id': max(user_id, other_id),
+                'user1_role': current_role if user_is_first else target_role,
+                'user2_role': target_role if user_is_first else current_role,
+                'created_at': now
+            })
+
+    if match_rows:
+        created = db.session.execute(
+            insert_ignore(matches).returning(matches.c.id, matches.c.user1_id, matches.c.user2_id),
+            match_rows
+        ).all()
+        match_ids = {
+            (row.user2_id if row.user1_id == user_id else row.user1_id): row.id
+            for row in created
+        }
+        for result in valid:
+            if result['user_id'] in match_ids:
+                result['match'] = True
+                result['match_id'] = match_ids[result['user_id']]
+
+    if valid:
+        DiscoveryQueueEntry.query.filter(and_(
+            DiscoveryQueueEntry.user_id == user_id,
+            DiscoveryQueueEntry.role == current_role,
+            DiscoveryQueueEntry.candidate_id.in_([result['user_id'] for result in valid])
+        )).delete(synchronize_session=False)
+
+    db.session.commit()
+
+    buffer.add([
+        {
+            'swiper_id': user_id,
+            'swiped_id': result['user_id'],
+            'swiper_role': current_role,
+            'swiped_role': target_role,
+            'action': result['action'],
+            'created_at': now
+        }
+        for result in valid
+    ])
+
+    for result in valid:
+        result['status'] = 'accepted'
+    for result in results:
+        if 'error' in result:
+            result['status'] = 'rejected'
+
+    return results, sparks_left - sparks_used
@@ -0,0 +1,257 @@
+"""Swipe write path: dedupe insert, reciprocal-interest lookup and match creation.
+
+Double swipes are rejected by the ``uq_swipe_once`` unique index rather than
+a read-before-write, and the same index doubles as the reciprocal-like
+lookup: "did they already like me?" is a point probe on the reversed key
+``(swiped_id, target_role, current_role, swiper_id)``. The columns lead with
+``(swiper_id, swiper_role, swiped_role)`` so the discovery queue's "everyone
+I already swiped in this role" is an index-only range scan on it too.
+``uq_match_pair`` keeps two concurrent mutual likes from producing two
+matches. A repeat of a swipe whose row was archived gets past the index, so
+the swiper's ``seen_set`` is updated in the same transaction and has the
+final say.
+
+On PostgreSQL the whole swipe (role lookup, super spark debit, swipe insert,
+reciprocal probe, match insert and discovery queue cleanup) is a single
+statement built from data-modifying CTEs, i.e. one round trip. A like is
+preceded by a transaction-scoped advisory lock on the user pair: the
+statement's READ COMMITTED snapshot is taken after a concurrent like from the
+other side has committed, so its reciprocal probe sees it. Other databases
+run the same steps as a single transaction.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db, User, Swipe, Match
+from src.services import seen_set, super_sparks
+from src.services.discovery_queue import DiscoveryQueueEntry, TARGET_ROLES, drop_candidate
+
+POSITIVE_ACTIONS = ('like', 'super_spark')
+
+uq_swipe_once = db.Index(
+    'uq_swipe_once',
+    Swipe.swiper_id, Swipe.swiper_role, Swipe.swiped_role, Swipe.swiped_id,
+    unique=True
+)
+uq_match_pair = db.Index(
+    'uq_match_pair',
+    Match.user1_id, Match.user2_id, Match.user1_role, Match.user2_role,
+    unique=True
+)
+
+SwipeResult = namedtuple('SwipeResult', 'current_role target_role match_id super_spark_count')
+
+
+class SwipeError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _match_values(user_id, swiped_user_id, current_role, target_role):
+    """Column values for a match row; matches store the lower user id first."""
+    user_is_first = user_id < swiped_user_id
+    return {
+        'user1_id': min(user_id, swiped_user_id),
+        'user2_id': max(user_id, swiped_user_id),
+        'user1_role': current_role if user_is_first else target_role,
+        'user2_role': target_role if user_is_first else current_role,
+    }
+
+
+def _reciprocal_like(user_id, swiped_user_id, current_role, target_role):
+    swipes = Swipe.__table__
+    return exists().where(and_(
+        swipes.c.swiper_id == swiped_user_id,
+        swipes.c.swiped_id == user_id,
+        swipes.c.swiper_role == target_role,
+        swipes.c.swiped_role == current_role,
+        swipes.c.action.in_(POSITIVE_ACTIONS)
+    ))
+
+
+def record_swipe(user_id, swiped_user_id, action):
+    """Record a swipe and create the match if it is mutual; commits on success.
+
+    Raises ``SwipeError`` for unknown users, invalid roles, duplicate swipes
+    and exhausted super sparks.
+    """
+    if user_id == swiped_user_id:
+        raise SwipeError('Cannot swipe on yourself')
+    if db.engine.dialect.name == 'postgresql':
+        return _record_swipe_single_statement(user_id, swiped_user_id, action)
+    return _record_swipe_transaction(user_id, swiped_user_id, action)
+
+
+def _record_swipe_single_statement(user_id, swiped_user_id, action):
+    users, swipes, matches = User.__table__, Swipe.__table__, Match.__table__
+    queue = DiscoveryQueueEntry.__table__
+    now = datetime.utcnow()
+
+    if action in POSITIVE_ACTIONS:
+        # Serialize the two sides of a pair; both likes in flight would otherwise miss each other
+        db.session.execute(select(func.pg_advisory_xact_lock(
+            min(user_id, swiped_user_id), max(user_id, swiped_user_id)
+        )))
+
+    target_role = case(TARGET_ROLES, value=users.c.current_role)
+    me = select(
+        users.c.current_role,
+        target_role.label('target_role'),
+        super_sparks.balance(now, users).label('super_spark_count')
+    ).where(users.c.id == user_id).cte('me')
+
+    target_exists = exists().where(users.c.id == swiped_user_id)
+    can_swipe = and_(target_exists, me.c.target_role.is_not(None))
+    if action == 'super_spark':
+        can_swipe = and_(can_swipe, me.c.super_spark_count > 0)
+
+    inserted = postgresql.insert(swipes).from_select(
+        ['swiper_id', 'swiped_id', 'swiper_role', 'swiped_role', 'action', 'created_at'],
+        select(
+            literal(user_id), literal(swiped_user_id), me.c.current_role,
+            me.c.target_role, literal(action), literal(now)
+        ).where(can_swipe)
+    ).on_conflict_do_nothing(
+        index_elements=['swiper_id', 'swiped_id', 'swiper_role', 'swiped_role']
+    ).returning(swipes.c.id, swipes.c.swiper_role, swipes.c.swiped_role).cte('inserted')
+
+    columns = [
+        me.c.current_role,
+        me.c.target_role,
+        me.c.super_spark_count,
+        target_exists.label('target_exists'),
+        select(inserted.c.id).scalar_subquery().label('swipe_id'),
+    ]
+
+    if action == 'super_spark':
+        # Debit only if the swipe went in; the WHERE re-checks the balance under the row lock
+        debited = super_sparks.consume_statement(
+            user_id, now=now, where=exists(select(inserted.c.id))
+        ).cte('debited')
+        columns.append(select(debited.c.super_spark_count).scalar_subquery().label('debited_count'))
+
+    if action in POSITIVE_ACTIONS:
+        first = literal(user_id) < literal(swiped_user_id)
+        reciprocal = exists().where(and_(
+            swipes.c.swiper_id == swiped_user_id,
+            swipes.c.swiped_id == user_id,
+            swipes.c.swiper_role == inserted.c.swiped_role,
+            swipes.c.swiped_role == inserted.c.swiper_role,
+            swipes.c.action.in_(POSITIVE_ACTIONS)
+        ))
+        new_match = postgresql.insert(matches).from_select(
+            ['user1_id', 'user2_id', 'user1_role', 'user2_role', 'created_at'],
+            select(
+                literal(min(user_id, swiped_user_id)),
+                literal(max(user_id, swiped_user_id)),
+                case((first, inserted.c.swiper_role), else_=inserted.c.swiped_role),
+                case((first, inserted.c.swiped_role), else_=inserted.c.swiper_role),
+                literal(now)
+            ).where(reciprocal)
+        ).on_conflict_do_nothing().returning(matches.c.id).cte('new_match')
+        columns.append(select(new_match.c.id).scalar_subquery().label('match_id'))
+
+    dropped = delete(queue).where(and_(
+        queue.c.user_id == user_id,
+        queue.c.candidate_id == swiped_user_id,
+        exists(select(inserted.c.id)),
+        queue.c.role == select(inserted.c.swiper_role).scalar_subquery()
+    )).returning(queue.c.position).cte('dropped')
+    columns.append(select(func.count()).select_from(dropped).scalar_subquery().label('dropped'))
+
+    row = db.session.execute(select(*columns)).mappings().first()
+
+    error = None
+    if row is None or not row['target_exists']:
+        error = SwipeError('User not found', 404)
+    elif row['target_role'] is None:
+        error = SwipeError('Invalid role')
+    elif row['swipe_id'] is None:
+        if action == 'super_spark' and row['super_spark_count'] <= 0:
+            error = SwipeError('No super sparks remaining')
+        else:
+            error = SwipeError('Already swiped on this profile')
+    elif action == 'super_spark' and row['debited_count'] is None:
+        # A concurrent super spark spent the last one between snapshot and row lock
+        error = SwipeError('No super sparks remaining')
+
+    if error is None and seen_set.add(user_id, row['current_role'], [swiped_user_id]):
+        # Its swipe row was archived, so the unique index let it through
+        error = SwipeError('Already swiped on this profile')
+
+    if error:
+        db.session.rollback()
+        raise error
+
+    super_spark_count = row['debited_count'] if action == 'super_spark' else row['super_spark_count']
+    db.session.commit()
+    return SwipeResult(
+        row['current_role'], row['target_role'], row.get('match_id'), super_spark_count
+    )
+
+
+def _record_swipe_transaction(user_id, swiped_user_id, action):
+    users, swipes, matches = User.__table__, Swipe.__table__, Match.__table__
+
+    now = datetime.utcnow()
+    me = db.session.execute(
+        select(users.c.current_role, super_sparks.balance(now, users)).where(users.c.id == user_id)
+    ).first()
+    if me is None or not db.session.execute(select(exists().where(users.c.id == swiped_user_id))).scalar():
+        raise SwipeError('User not found', 404)
+
+    current_role, super_spark_count = me
+    target_role = TARGET_ROLES.get(current_role)
+    if target_role is None:
+        raise SwipeError('Invalid role')
+
+    try:
+        if action == 'super_spark':
+            super_spark_count = super_sparks.consume(user_id, now=now)
+            if super_spark_count is None:
+                raise SwipeError('No super sparks remaining')
+
+        db.session.execute(insert(swipes).values(
+            swiper_id=user_id,
+            swiped_id=swiped_user_id,
+            swiper_role=current_role,
+            swiped_role=target_role,
+            action=action,
+            created_at=now
+        ))
+        if seen_set.add(user_id, current_role, [swiped_user_id]):
+            raise SwipeError('Already swiped on this profile')
+
+        match_id = None
+        if action in POSITIVE_ACTIONS:
+            values = _match_values(user_id, swiped_user_id, current_role, target_role)
+            try:
+                with db.session.begin_nested():
+                    match_id = db.session.execute(
+                        insert(matches).from_select(
+                            list(values) + ['created_at'],
+                            select(*[literal(v) for v in values.values()], literal(now)).where(
+                                _reciprocal_like(user_id, swiped_user_id, current_role, target_role)
+                            )
+                        ).returning(matches.c.id)
+                    ).scalar()
+            except IntegrityError:
+                # The other side's concurrent like already created the match
+                match_id = None
+
+        drop_candidate(user_id, current_role, swiped_user_id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise SwipeError('Already swiped on this profile')
+    except SwipeError:
+        db.session.rollback()
+        raise
+
+    return SwipeResult(current_role, target_role, match_id, super_spark_count)
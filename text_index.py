@@ -0,0 +1,931 @@
+"""Full-text search over profile prose, ranked by BM25.
+
+The tagline, bio, project description and past investments of every
+profile are tokenized into an inverted index laid out like Lucene's: a
+list of immutable *segments*, each holding its documents' keys (role and
+user id), lengths and per-term postings as flat arrays, plus a small
+in-memory buffer of the latest saves. ``update_profile`` puts a save in
+the buffer and marks the profile's older copy dead in every segment; a
+background thread flushes the buffer to a new segment once it holds
+``FLUSH_DOCS`` profiles or is ``FLUSH_SECONDS`` old, and merges runs of
+small segments adjacent in ``seq`` into bigger ones, dropping dead copies,
+once there are ``MERGE_FACTOR`` of them.
+
+With ``TEXT_INDEX_PATH`` set, segments are files in that directory (one
+header plus raw arrays, memory-mapped on load) listed in ``segments.json``.
+Workers share the directory: each writes the segments it flushes or merges
+and replaces the manifest under a file lock, and picks up the others' every
+``REFRESH_SECONDS``. Every segment has a sequence number and the newest
+copy of a profile wins, so segments can be loaded in any order. A merged
+segment takes the highest ``seq`` of its inputs, so merges only take runs
+with no other segment's ``seq`` in between: a worker that hasn't loaded a
+newer copy of a profile yet would otherwise promote the old one past it.
+Saves still in a worker's buffer are listed in its pending log; a worker
+that finds the log of one that died re-reads those profiles from the
+database.
+
+Without the setting the segments stay in memory and each worker builds its
+own from the database at startup. Workers then can't see each other's
+buffers or segments, so every ``REFRESH_SECONDS`` an in-memory index re-reads
+the profiles whose ``updated_at`` moved since its last look and indexes them
+like local saves.
+"""
+import argparse
+import atexit
+import fcntl
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+import uuid
+from array import array
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from src.models.user import db, UserProfile
+from src.services import metrics
+
+# Fields searched, with the weight of each occurrence of a term in them
+FIELDS = (('tagline', 2), ('bio', 1), ('project_description', 1), ('past_investments', 1))
+ROLE_CODES = {'entrepreneur': 0, 'investor': 1, 'partner': 2}
+STOPWORDS = frozenset('''
+    a about an and are as at be been but by for from has have i in into is it its me my of on or our
+    so that the their them they this to was we were what when which who will with you your
+'''.split())
+
+K1 = 1.2
+B = 0.75
+MAX_QUERY_TERMS = 16
+FLUSH_DOCS = 1000
+FLUSH_SECONDS = 5.0
+REFRESH_SECONDS = 1.0
+BUILD_SEGMENT_DOCS = 250000
+MERGE_FACTOR = 8
+MAX_MERGED_DOCS = 200000
+EXPUNGE_RATIO = 0.3
+# Rows committed this long after their updated_at was stamped are still caught
+CATCH_UP_LAG = timedelta(seconds=30)
+
+MANIFEST = 'segments.json'
+LOCK_FILE = 'segments.lock'
+SEGMENT_MAGIC = b'SPKTXT1\n'
+_LENGTH = struct.Struct('<I')
+_ALIGN = 8
+_WORD = re.compile(r'[a-z0-9]+')
+_USER_BITS = 32
+
+
+def _stem(word):
+    """Strip plain English plurals: startups -> startup, companies -> company; leaves business, analysis."""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercased ASCII-folded words of ``text``, stopwords dropped and plurals stemmed."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode().lower()
+    return [_stem(word) for word in _WORD.findall(text) if word not in STOPWORDS]
+
+
+Doc = namedtuple('Doc', 'complete removed counts length')
+
+
+def analyze(profile):
+    """The ``Doc`` of a profile (or a row with the same columns): weighted term counts and their total."""
+    counts = Counter()
+    for field, weight in FIELDS:
+        for term in tokenize(getattr(profile, field)):
+            counts[term] += weight
+    return Doc(bool(profile.is_complete), False, counts, sum(counts.values()))
+
+
+def make_key(role, user_id):
+    return ROLE_CODES[role] << _USER_BITS | int(user_id)
+
+
+def _aligned(size):
+    return -(-size // _ALIGN) * _ALIGN
+
+
+def _segment_name(seq):
+    return f'seg-{seq:010d}-{uuid.uuid4().hex[:8]}.tix'
+
+
+class Segment:
+    """An immutable batch of documents, numbered in key order, with postings sorted by term then document.
+
+    ``current`` is the only mutable state: False for documents whose
+    profile has a newer copy elsewhere. ``removed`` documents are markers for
+    deleted profiles; they hide older copies and never match.
+    """
+
+    def __init__(self, name, seq, keys, complete, removed, lengths, terms, starts, docs, tfs, mapping=None):
+        self.name = name
+        self.seq = seq
+        self.keys = keys
+        self.complete = complete
+        self.removed = removed
+        self.lengths = lengths
+        self.terms = terms
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.starts = starts
+        self.docs = docs
+        self.tfs = tfs
+        self.roles = (keys >> _USER_BITS).astype(np.int8)
+        self._lengths = lengths.astype(np.float32)
+        self._eligible = {}
+        self._mapping = mapping
+        self.set_current(np.ones(len(keys), dtype=bool))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def postings(self):
+        return len(self.docs)
+
+    def set_current(self, current):
+        self.current = current
+        self._eligible = {}
+        live = current & ~self.removed
+        self.live_docs = int(live.sum())
+        self.live_length = int(self.lengths[live].sum())
+
+    def kill(self, keys):
+        """Mark the copies of ``keys`` in this segment as superseded."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(keys) or not len(self.keys):
+            return
+        positions = np.searchsorted(self.keys, keys).clip(max=len(self.keys) - 1)
+        positions = positions[self.keys[positions] == keys]
+        positions = positions[self.current[positions]]
+        if not len(positions):
+            return
+        self.current[positions] = False
+        self._eligible = {}
+        live = positions[~self.removed[positions]]
+        self.live_docs -= len(live)
+        self.live_length -= int(self.lengths[live].sum())
+
+    def document_frequency(self, term):
+        t = self.term_index.get(term)
+        return 0 if t is None else int(self.starts[t + 1] - self.starts[t])
+
+    def score(self, weights, avgdl, role_code, complete_only):
+        """``(user ids, scores)`` of the current, matching documents with ``role_code`` that contain a query term.
+
+        ``weights`` are ``(term, idf)`` pairs; each posting adds the term's
+        BM25 contribution to its document's score.
+        """
+        docs, contributions = [], []
+        for term, idf in weights:
+            t = self.term_index.get(term)
+            if t is None:
+                continue
+            start, end = self.starts[t], self.starts[t + 1]
+            tf = self.tfs[start:end].astype(np.float32)
+            norm = np.float32(K1 * (1 - B)) + np.float32(K1 * B / avgdl) * self._lengths[self.docs[start:end]]
+            docs.append(self.docs[start:end])
+            contributions.append(np.float32(idf * (K1 + 1)) * tf / (tf + norm))
+        if not docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # One pass over every posting beats a scatter-add per term
+        scores = np.bincount(np.concatenate(docs), weights=np.concatenate(contributions), minlength=len(self.keys))
+        hits = np.flatnonzero((scores > 0) & self.eligible(role_code, complete_only))
+        return self.keys[hits] & 0xFFFFFFFF, scores[hits].astype(np.float32)
+
+    def eligible(self, role_code, complete_only):
+        """Mask of the current documents of ``role_code`` (complete ones only if asked), cached until a kill."""
+        mask = self._eligible.get((role_code, complete_only))
+        if mask is None:
+            mask = self.current & (self.roles == role_code) & ~self.removed
+            if complete_only:
+                mask &= self.complete
+            self._eligible[(role_code, complete_only)] = mask
+        return mask
+
+    @classmethod
+    def from_docs(cls, name, seq, items):
+        """A segment of ``(key, Doc)`` pairs, sorted by key."""
+        vocabulary = {}
+        term_ids, numbers, tfs = array('i'), array('i'), array('i')
+        for number, (_, doc) in enumerate(items):
+            for term, tf in doc.counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                numbers.append(number)
+                tfs.append(tf)
+        return cls.from_postings(
+            name, seq,
+            keys=np.fromiter((key for key, _ in items), dtype=np.int64, count=len(items)),
+            complete=np.fromiter((doc.complete for _, doc in items), dtype=bool, count=len(items)),
+            removed=np.fromiter((doc.removed for _, doc in items), dtype=bool, count=len(items)),
+            lengths=np.fromiter((doc.length for _, doc in items), dtype=np.uint32, count=len(items)),
+            terms=list(vocabulary),
+            term_ids=np.frombuffer(term_ids, dtype=np.int32),
+            numbers=np.frombuffer(numbers, dtype=np.int32),
+            tfs=np.frombuffer(tfs, dtype=np.int32)
+        )
+
+    @classmethod
+    def from_postings(cls, name, seq, keys, complete, removed, lengths, terms, term_ids, numbers, tfs):
+        """A segment from per-document arrays (in key order) and one ``(term id, doc number, tf)`` per posting."""
+        order = np.lexsort((numbers, term_ids))
+        term_ids = term_ids[order]
+        return cls(
+            name, seq, keys, complete, removed, lengths, terms,
+            starts=np.searchsorted(term_ids, np.arange(len(terms) + 1)).astype(np.int64),
+            docs=numbers[order].astype(np.int32),
+            tfs=np.minimum(tfs[order], np.iinfo(np.uint16).max).astype(np.uint16)
+        )
+
+    @classmethod
+    def merge(cls, name, seq, segments, currents):
+        """The current documents of ``segments`` (per the ``currents`` masks) in one segment.
+
+        Returns the segment and, per merged document, its position among the
+        inputs' current documents in order, to carry over later kills.
+        """
+        kept = [np.flatnonzero(current) for current in currents]
+        keys = np.concatenate([segment.keys[positions] for segment, positions in zip(segments, kept)])
+        order = np.argsort(keys, kind='stable')
+        numbers = np.empty(len(keys), dtype=np.int64)
+        numbers[order] = np.arange(len(keys))
+
+        vocabulary = {}
+        term_ids, doc_numbers, tfs = [], [], []
+        base = 0
+        for segment, positions in zip(segments, kept):
+            remap = np.full(len(segment), -1, dtype=np.int64)
+            remap[positions] = numbers[base:base + len(positions)]
+            base += len(positions)
+            ids = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in segment.terms], dtype=np.int32)
+            posting_numbers = remap[segment.docs]
+            alive = posting_numbers >= 0
+            term_ids.append(np.repeat(ids, np.diff(segment.starts))[alive])
+            doc_numbers.append(posting_numbers[alive])
+            tfs.append(segment.tfs[alive])
+
+        # Terms left only in dropped documents go
+        term_ids = np.concatenate(term_ids) if term_ids else np.empty(0, dtype=np.int32)
+        used = np.unique(term_ids)
+        terms = list(vocabulary)
+        renumber = np.zeros(max(len(terms), 1), dtype=np.int32)
+        renumber[used] = np.arange(len(used))
+
+        def gather(field):
+            return np.concatenate([getattr(segment, field)[positions] for segment, positions in zip(segments, kept)])[order]
+
+        merged = cls.from_postings(
+            name, seq, keys[order], gather('complete'), gather('removed'), gather('lengths'),
+            terms=[terms[i] for i in used],
+            term_ids=renumber[term_ids],
+            numbers=np.concatenate(doc_numbers) if doc_numbers else np.empty(0, dtype=np.int64),
+            tfs=np.concatenate(tfs) if tfs else np.empty(0, dtype=np.uint16)
+        )
+        return merged, (kept, order)
+
+    def write(self, path):
+        """Save to ``path`` atomically: magic, header length, JSON header, then each array 8-byte aligned."""
+        blob = np.frombuffer('\n'.join(self.terms).encode(), dtype=np.uint8)
+        arrays = [
+            ('keys', self.keys), ('complete', self.complete), ('removed', self.removed),
+            ('lengths', self.lengths), ('starts', self.starts), ('docs', self.docs), ('tfs', self.tfs),
+            ('terms', blob)
+        ]
+        layout, offset = {}, 0
+        for name, values in arrays:
+            layout[name] = [values.dtype.str, offset, len(values)]
+            offset += _aligned(values.nbytes)
+        header = json.dumps({'seq': self.seq, 'arrays': layout}).encode()
+        head = SEGMENT_MAGIC + _LENGTH.pack(len(header)) + header
+
+        temporary = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(head.ljust(_aligned(len(head)), b'\0'))
+            for _, values in arrays:
+                data = np.ascontiguousarray(values).tobytes()
+                f.write(data.ljust(_aligned(len(data)), b'\0'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def open(cls, path):
+        """Load a segment file; its arrays are read-only views of a memory map."""
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapping[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f'{path} is not a text index segment')
+        (length,) = _LENGTH.unpack_from(mapping, len(SEGMENT_MAGIC))
+        start = len(SEGMENT_MAGIC) + _LENGTH.size
+        header = json.loads(mapping[start:start + length])
+        base = _aligned(start + length)
+        arrays = {
+            name: np.frombuffer(mapping, dtype=np.dtype(dtype), count=count, offset=base + offset)
+            if count else np.empty(0, dtype=np.dtype(dtype))
+            for name, (dtype, offset, count) in header['arrays'].items()
+        }
+        blob = arrays.pop('terms').tobytes().decode()
+        return cls(os.path.basename(path), header['seq'], terms=blob.split('\n') if blob else [],
+                   mapping=mapping, **arrays)
+
+
+def resolve(segments, newer_keys=()):
+    """Reset every segment's ``current`` mask: only the copy of a key in the highest-``seq`` segment is current.
+
+    Keys in ``newer_keys`` (saves not flushed yet) are current in no segment.
+    """
+    if not segments:
+        return
+    keys = np.concatenate([segment.keys for segment in segments])
+    seqs = np.concatenate([np.full(len(segment), segment.seq, dtype=np.int64) for segment in segments])
+    order = np.lexsort((seqs, keys))
+    sorted_keys = keys[order]
+    newest = np.ones(len(keys), dtype=bool)
+    newest[:-1] = sorted_keys[1:] != sorted_keys[:-1]
+    current = np.zeros(len(keys), dtype=bool)
+    current[order[newest]] = True
+    if len(newer_keys):
+        current &= ~np.isin(keys, np.asarray(newer_keys, dtype=np.int64))
+    base = 0
+    for segment in segments:
+        segment.set_current(current[base:base + len(segment)])
+        base += len(segment)
+
+
+def supersede(older, newer):
+    """Mark the documents of ``older`` that ``newer`` holds again as superseded, searching the bigger one."""
+    if not len(newer):
+        return
+    if len(newer) <= len(older):
+        older.kill(newer.keys)
+    else:
+        positions = np.searchsorted(newer.keys, older.keys).clip(max=len(newer) - 1)
+        older.kill(older.keys[newer.keys[positions] == older.keys])
+
+
+class TextIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self.app = None
+        self._segments = []  # by seq
+        self._buffer = {}  # key -> Doc, saves not flushed yet
+        self._flushing = {}  # the buffer being written as a segment
+        self._oldest = None
+        self._next_seq = 1  # in memory only; on disk the manifest counts
+        self._manifest_state = None
+        self._refreshed = 0.0
+        self._since = datetime.utcnow()
+        self._checked = 0.0
+        self._applied = {}  # key -> updated_at of profiles read within the lag, in memory only
+        self._log = None
+        self._log_path = None
+        self._lock = threading.RLock()
+        self._maintenance_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = None
+
+        self.query_seconds = metrics.Histogram(metrics.LATENCY_BUCKETS)
+        self.flushes = 0
+        self.merges = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        with self._lock:
+            pending = {**self._flushing, **self._buffer}
+            return sum(segment.live_docs for segment in self._segments) + sum(
+                not doc.removed for doc in pending.values())
+
+    @property
+    def segments(self):
+        with self._lock:
+            return list(self._segments)
+
+    @classmethod
+    def from_segments(cls, segments, path=None):
+        """An index over prebuilt segments, for tools and benchmarks; with ``path`` they are written there and mapped back."""
+        index = cls(path)
+        next_seq = max((segment.seq for segment in segments), default=0) + 1
+        if not path:
+            index._segments = sorted(segments, key=lambda segment: segment.seq)
+            index._next_seq = next_seq
+            resolve(index._segments)
+            return index
+        with index._manifest() as manifest:
+            for segment in segments:
+                segment.write(index._file(segment.name))
+                manifest['segments'].append({'name': segment.name, 'seq': segment.seq})
+            manifest['next_seq'] = max(manifest['next_seq'], next_seq)
+            index._write_manifest(manifest)
+        index.refresh(force=True)
+        return index
+
+    # Lifecycle
+
+    def open(self):
+        """Load the segments on disk, or build them from the database, and recover dead workers' pending saves."""
+        if self.path and os.path.exists(self._file(MANIFEST)):
+            self.refresh(force=True)
+        else:
+            self.build()
+        if self.path:
+            self._recover_pending()
+            self._open_log()
+        return self
+
+    def start(self, app):
+        """Flush, merge and refresh in a background thread until ``close``."""
+        self.app = app
+        self._thread = threading.Thread(target=self._run, name='text-index', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.flush()
+        if self._log is not None:
+            self._log.close()
+            os.remove(self._log_path)
+            self._log = None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(REFRESH_SECONDS)
+                closed = self._closed
+            try:
+                with self._lock:
+                    due = self._buffer and (closed or len(self._buffer) >= FLUSH_DOCS
+                                            or time.monotonic() - self._oldest >= FLUSH_SECONDS)
+                if due:
+                    self.flush()
+                if closed:
+                    return
+                self.merge_segments()
+                self.refresh()
+            except Exception:
+                self.app.logger.exception('Text index maintenance failed')
+                if closed:
+                    return
+                time.sleep(REFRESH_SECONDS)
+
+    def build(self):
+        """Index every profile in the database, ``BUILD_SEGMENT_DOCS`` to a segment."""
+        self._since = datetime.utcnow()
+        profiles = UserProfile.__table__
+        query = select(
+            profiles.c.user_id, profiles.c.role, profiles.c.is_complete,
+            *[profiles.c[field] for field, _ in FIELDS]
+        ).execution_options(yield_per=10000)
+        batch = {}
+        for row in db.session.execute(query):
+            if row.role in ROLE_CODES:
+                batch[make_key(row.role, row.user_id)] = analyze(row)
+            if len(batch) >= BUILD_SEGMENT_DOCS:
+                self._install(self._new_segment(sorted(batch.items())))
+                batch = {}
+        if batch or not self._segments:
+            self._install(self._new_segment(sorted(batch.items())))
+        with self._lock:
+            resolve(self._segments)
+
+    # Writes
+
+    def update(self, profile):
+        self._put(make_key(profile.role, profile.user_id), analyze(profile))
+
+    def remove(self, role, user_id):
+        self._put(make_key(role, user_id), Doc(False, True, Counter(), 0))
+
+    def _put(self, key, doc):
+        with self._lock:
+            for segment in self._segments:
+                segment.kill([key])
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer[key] = doc
+            if self._log is not None:
+                self._log.write(f'{key}\n')
+                self._log.flush()
+            if len(self._buffer) >= FLUSH_DOCS:
+                self._wakeup.notify()
+
+    def flush(self):
+        """Write the buffer as a new segment; returns the number of profiles written."""
+        with self._maintenance_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                self._flushing, self._buffer = self._buffer, {}
+                self._oldest = None
+            try:
+                segment = self._new_segment(sorted(self._flushing.items()))
+            except Exception:
+                with self._lock:
+                    self._buffer = {**self._flushing, **self._buffer}
+                    self._flushing = {}
+                    self._oldest = time.monotonic()
+                raise
+            with self._lock:
+                segment.kill(list(self._buffer))
+                self._install(segment)
+                written, self._flushing = len(self._flushing), {}
+                self._rewrite_log()
+            self.flushes += 1
+            return written
+
+    def _new_segment(self, items):
+        """Write ``items`` as the newest segment, listed in the manifest but not yet installed here."""
+        if not self.path:
+            with self._lock:
+                seq, self._next_seq = self._next_seq, self._next_seq + 1
+            return Segment.from_docs(_segment_name(seq), seq, items)
+        with self._manifest() as manifest:
+            seq = manifest['next_seq']
+            segment = Segment.from_docs(_segment_name(seq), seq, items)
+            segment.write(self._file(segment.name))
+            manifest['next_seq'] = seq + 1
+            manifest['segments'].append({'name': segment.name, 'seq': seq})
+            self._write_manifest(manifest)
+        current = segment.current
+        segment = Segment.open(self._file(segment.name))
+        segment.set_current(current)
+        return segment
+
+    def _install(self, segment, replacing=()):
+        with self._lock:
+            self._segments = sorted(
+                [existing for existing in self._segments if existing not in replacing] + [segment],
+                key=lambda existing: existing.seq
+            )
+
+    # Merging
+
+    def merge_candidates(self):
+        """Segments to merge next: one mostly dead, or a run adjacent in ``seq`` once there are ``MERGE_FACTOR``.
+
+        The run is the longest (up to ``MERGE_FACTOR`` segments and
+        ``MAX_MERGED_DOCS`` live documents, but at least two) with the fewest
+        live documents.
+        """
+        with self._lock:
+            segments = list(self._segments)
+        for segment in sorted(segments, key=lambda segment: segment.live_docs):
+            if len(segment) and 1 - segment.live_docs / len(segment) >= EXPUNGE_RATIO:
+                return [segment]
+        if len(segments) < MERGE_FACTOR:
+            return []
+        best, best_rank = [], None
+        for start in range(len(segments) - 1):
+            run, size = [], 0
+            for segment in segments[start:start + MERGE_FACTOR]:
+                if len(run) >= 2 and size + segment.live_docs > MAX_MERGED_DOCS:
+                    break
+                run.append(segment)
+                size += segment.live_docs
+            rank = (-len(run), size)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = run, rank
+        return best
+
+    def merge_segments(self):
+        candidates = self.merge_candidates()
+        return self.merge(candidates) if candidates else None
+
+    def merge(self, segments):
+        """Rewrite ``segments`` as one without their dead documents; returns it, or None if they are gone."""
+        with self._maintenance_lock:
+            with self._lock:
+                if any(segment not in self._segments for segment in segments):
+                    return None
+                currents = [segment.current.copy() for segment in segments]
+            seq = max(segment.seq for segment in segments)
+            merged, (kept, order) = Segment.merge(_segment_name(seq), seq, segments, currents)
+
+            if self.path:
+                merged.write(self._file(merged.name))
+                names = {segment.name for segment in segments}
+                low = min(segment.seq for segment in segments)
+                with self._manifest() as manifest:
+                    listed = {entry['name'] for entry in manifest['segments']}
+                    between = any(low < entry['seq'] < seq and entry['name'] not in names
+                                  for entry in manifest['segments'])
+                    if not names <= listed or between:
+                        # Another worker merged some of them first, or flushed between them
+                        os.remove(self._file(merged.name))
+                        return None
+                    manifest['segments'] = [entry for entry in manifest['segments'] if entry['name'] not in names]
+                    manifest['segments'].append({'name': merged.name, 'seq': seq})
+                    self._write_manifest(manifest)
+                merged = Segment.open(self._file(merged.name))
+
+            with self._lock:
+                # Carry over profiles saved again while the merge ran
+                merged.set_current(np.concatenate(
+                    [segment.current[positions] for segment, positions in zip(segments, kept)]
+                )[order].copy())
+                self._install(merged, replacing=segments)
+            if self.path:
+                for segment in segments:
+                    try:
+                        os.remove(self._file(segment.name))
+                    except FileNotFoundError:
+                        pass
+            self.merges += 1
+            return merged
+
+    # Shared directory
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _manifest(self):
+        """The manifest, read under the directory's write lock, which is held until the block ends."""
+        with open(self._file(LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._file(MANIFEST)) as f:
+                        manifest = json.load(f)
+                except FileNotFoundError:
+                    manifest = {'next_seq': 1, 'segments': []}
+                yield manifest
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest):
+        temporary = self._file(f'{MANIFEST}.{uuid.uuid4().hex[:8]}.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._file(MANIFEST))
+
+    def refresh(self, force=False):
+        """Load the segments other workers flushed or merged; returns True if the set changed."""
+        if not self.path or (not force and time.monotonic() - self._refreshed < REFRESH_SECONDS):
+            return False
+        self._refreshed = time.monotonic()
+        with self._maintenance_lock:
+            stat = os.stat(self._file(MANIFEST))
+            state = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if state == self._manifest_state:
+                return False
+            with self._manifest() as manifest:
+                entries = manifest['segments']
+            with self._lock:
+                loaded = {segment.name: segment for segment in self._segments}
+            if {entry['name'] for entry in entries} == set(loaded):
+                self._manifest_state = state
+                return False
+            added = [Segment.open(self._file(entry['name'])) for entry in entries if entry['name'] not in loaded]
+            with self._lock:
+                kept = [loaded[entry['name']] for entry in entries if entry['name'] in loaded]
+                pending = list({**self._flushing, **self._buffer})
+                for i, segment in enumerate(added):
+                    for other in kept + added[:i]:
+                        if other.seq < segment.seq:
+                            supersede(other, segment)
+                        else:
+                            supersede(segment, other)
+                    segment.kill(pending)
+                self._segments = sorted(kept + added, key=lambda segment: segment.seq)
+                self._manifest_state = state
+            return True
+
+    def _open_log(self):
+        """Start this worker's pending log, locked for as long as the worker lives."""
+        path = self._file(f'pending-{os.getpid()}-{uuid.uuid4().hex[:8]}.log')
+        # Locked before it gets a name recovery looks for
+        log = open(path + '.tmp', 'w')
+        fcntl.flock(log, fcntl.LOCK_EX)
+        os.rename(path + '.tmp', path)
+        with self._lock:
+            self._log, self._log_path = log, path
+            self._rewrite_log()
+
+    def _rewrite_log(self):
+        if self._log is not None:
+            self._log.seek(0)
+            self._log.truncate()
+            self._log.write(''.join(f'{key}\n' for key in {**self._flushing, **self._buffer}))
+            self._log.flush()
+
+    def _recover_pending(self):
+        """Re-read from the database the profiles in pending logs no live worker holds."""
+        for name in sorted(os.listdir(self.path)):
+            if not (name.startswith('pending-') and name.endswith('.log')):
+                continue
+            with open(self._file(name)) as log:
+                try:
+                    fcntl.flock(log, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                keys = {int(line) for line in log if line.strip()}
+                self.reindex(keys)
+                self.flush()
+                os.remove(self._file(name))
+
+    def reindex(self, keys):
+        """Re-read the profiles of ``keys`` from the database; missing ones are removed."""
+        roles = {code: role for role, code in ROLE_CODES.items()}
+        pairs = {(roles[key >> _USER_BITS], key & 0xFFFFFFFF) for key in keys}
+        found = set()
+        for role in {role for role, _ in pairs}:
+            ids = [user_id for pair_role, user_id in pairs if pair_role == role]
+            for profile in UserProfile.query.filter(UserProfile.role == role, UserProfile.user_id.in_(ids)):
+                self.update(profile)
+                found.add((role, profile.user_id))
+        for role, user_id in pairs - found:
+            self.remove(role, user_id)
+
+    def catch_up(self, force=False):
+        """Index the profiles other workers saved since the last look, at most every ``REFRESH_SECONDS``.
+
+        Only an in-memory index needs this; a shared directory hands saves over as segments.
+        """
+        if self.path or (not force and time.monotonic() - self._checked < REFRESH_SECONDS):
+            return 0
+        self._checked = time.monotonic()
+        profiles = UserProfile.__table__
+        rows = db.session.execute(select(
+            profiles.c.user_id, profiles.c.role, profiles.c.is_complete, profiles.c.updated_at,
+            *[profiles.c[field] for field, _ in FIELDS]
+        ).where(profiles.c.updated_at > self._since - CATCH_UP_LAG)).all()
+        applied = 0
+        for row in rows:
+            if row.role not in ROLE_CODES:
+                continue
+            key = make_key(row.role, row.user_id)
+            if self._applied.get(key) == row.updated_at:
+                continue
+            self._applied[key] = row.updated_at
+            self._put(key, analyze(row))
+            applied += 1
+        if rows:
+            self._since = max(self._since, max(row.updated_at for row in rows))
+        cutoff = self._since - CATCH_UP_LAG
+        self._applied = {key: at for key, at in self._applied.items() if at > cutoff}
+        return applied
+
+    # Queries
+
+    def search(self, query, role, complete_only=True, allowed=None, offset=0, limit=20):
+        """``(user ids, scores, total)`` of profiles of ``role`` matching ``query``, best first.
+
+        ``allowed`` optionally restricts the results to a list of user ids
+        (fastest sorted); ``total`` counts every match, of which the page from
+        ``offset`` is returned. Ties rank by user id.
+        """
+        if offset < 0 or limit < 0:
+            raise ValueError('offset and limit must not be negative')
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms or role not in ROLE_CODES:
+            return [], [], 0
+        with self._lock:
+            segments = list(self._segments)
+            pending = {**self._flushing, **self._buffer}
+
+        count = sum(segment.live_docs for segment in segments)
+        length = sum(segment.live_length for segment in segments)
+        pending_live = [doc for doc in pending.values() if not doc.removed]
+        count += len(pending_live)
+        length += sum(doc.length for doc in pending_live)
+        avgdl = max(length / count, 1.0) if count else 1.0
+        weights = []
+        for term in terms:
+            df = sum(segment.document_frequency(term) for segment in segments)
+            df += sum(term in doc.counts for doc in pending_live)
+            weights.append((term, math.log(1 + (max(count - df, 0) + 0.5) / (df + 0.5))))
+
+        role_code = ROLE_CODES[role]
+        ids, scores = [], []
+        for segment in segments:
+            segment_ids, segment_scores = segment.score(weights, avgdl, role_code, complete_only)
+            ids.append(segment_ids)
+            scores.append(segment_scores)
+        buffered = [
+            (key & 0xFFFFFFFF, sum(idf * (K1 + 1) * doc.counts[term] /
+                                   (doc.counts[term] + K1 * (1 - B + B * doc.length / avgdl))
+                                   for term, idf in weights if term in doc.counts))
+            for key, doc in pending.items()
+            if key >> _USER_BITS == role_code and not doc.removed and (doc.complete or not complete_only)
+            and any(term in doc.counts for term in terms)
+        ]
+        ids.append(np.array([user_id for user_id, _ in buffered], dtype=np.int64))
+        scores.append(np.array([score for _, score in buffered], dtype=np.float32))
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+
+        if allowed is not None:
+            allowed = np.asarray(allowed, dtype=np.int64)
+            if np.any(allowed[1:] < allowed[:-1]):
+                allowed = np.sort(allowed)
+            if len(allowed):
+                keep = allowed[np.searchsorted(allowed, ids).clip(max=len(allowed) - 1)] == ids
+            else:
+                keep = np.zeros(len(ids), dtype=bool)
+            ids, scores = ids[keep], scores[keep]
+        total = len(ids)
+        top = offset + limit
+        if total > top:
+            candidates = np.argpartition(-scores, top - 1)[:top]
+        else:
+            candidates = np.arange(total)
+        candidates = candidates[np.lexsort((ids[candidates], -scores[candidates]))][offset:top]
+        self.query_seconds.observe(time.perf_counter() - started)
+        return ids[candidates].tolist(), scores[candidates].tolist(), total
+
+    def stats(self):
+        with self._lock:
+            segments = list(self._segments)
+            pending = len(self._buffer) + len(self._flushing)
+        return {
+            'segments': len(segments),
+            'documents': sum(len(segment) for segment in segments),
+            'live_documents': sum(segment.live_docs for segment in segments),
+            'postings': sum(segment.postings for segment in segments),
+            'pending': pending,
+            'flushes': self.flushes,
+            'merges': self.merges,
+            'query_seconds': self.query_seconds.snapshot()
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                app = current_app._get_current_object()
+                index = TextIndex(app.config.get('TEXT_INDEX_PATH')).open()
+                index.start(app)
+                atexit.register(index.close)
+                metrics.register_source('text_index', index.stats, counters=('flushes', 'merges'))
+                _index = index
+    _index.catch_up()
+    return _index
+
+
+def update_profile(profile):
+    """Index a committed profile save.
+
+    Skipped while there is no index to build from the database, which reads
+    the save anyway (as in geo_index); segments already on disk are opened.
+    """
+    if _index is None:
+        path = current_app.config.get('TEXT_INDEX_PATH')
+        if not path or not os.path.exists(os.path.join(path, MANIFEST)):
+            return
+    get_index().update(profile)
+
+
+def main():
+    from flask_app import create_app
+
+    parser = argparse.ArgumentParser(description='Build the on-disk text index if missing, or compact it.')
+    parser.add_argument('--path', default=None, help='defaults to TEXT_INDEX_PATH')
+    parser.add_argument('--merge', action='store_true', help='merge until no merge is due')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        path = args.path or app.config.get('TEXT_INDEX_PATH')
+        if not path:
+            parser.error('no --path and no TEXT_INDEX_PATH')
+        index = TextIndex(path).open()
+        while args.merge and index.merge_segments() is not None:
+            pass
+        index.close()
+        print(f'{len(index)} profiles in {index.stats()["segments"]} segments at {path}')
+
+
+if __name__ == '__main__':
+    main()
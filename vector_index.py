@@ -0,0 +1,549 @@
+"""Semantic profile vectors and an approximate nearest-neighbour index over them.
+
+Usage: python -m src.services.vector_index [--path DIR] [--train]
+
+Saving a profile embeds its text with the local ``EmbeddingModel`` and
+stores the vector in ``profile_embedding``. ``VectorIndex`` holds the vectors
+of each role's complete profiles for "most similar" queries. It powers
+/api/matching/similar and the semantic share of discovery refills.
+
+The index is an inverted file (IVF). Spherical k-means splits a role's
+vectors into about ``sqrt(n)`` lists around centroids, and rows are stored
+grouped by list. A query scores the centroids, then only the rows of the
+``NPROBE`` nearest lists, each a contiguous slice. ``exact`` scans
+everything and is the baseline the benchmark measures recall against.
+
+The model is only trained by running this module (``--train``, or when
+there is none yet), on a deterministic sample of profiles. It is published
+in ``embedding_model``, and with ``EMBEDDING_PATH`` also written there with
+each role's rows as ``.npy`` files. Workers never train: they load the
+published model, so every worker embeds with the same version, and until
+there is one, saves store no vectors and the index is off. Workers
+memory-map the ``.npy`` files, so the page cache holds one copy for all of
+them. Without the setting, the index is built in memory from the stored
+vectors. A retrained model takes effect as workers restart.
+Either way, saves after the build go to a small per-list overlay, and each
+worker picks up vectors that other workers stored every
+``REFRESH_SECONDS``.
+"""
+import argparse
+import math
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, func, select
+
+from src.models.user import db, UserProfile
+from src.services.embeddings import TEXT_FIELDS, EmbeddingModel, normalize, profile_text
+
+ROLES = ('entrepreneur', 'investor', 'partner')
+NPROBE = 16
+LISTS_PER_ROOT = 1.0
+MAX_LISTS = 4096
+KMEANS_SAMPLE_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+ASSIGN_BATCH = 16384
+EMBED_BATCH = 2000
+TRAIN_PROFILES = 200000
+REFRESH_SECONDS = 5.0
+# Vectors stored this long before the last look are read again, for transactions that committed late
+CATCH_UP_LAG = timedelta(seconds=30)
+MODEL_FILE = 'model.npz'
+
+
+class EmbeddingModelVersion(db.Model):
+    """Published models; workers load the newest."""
+    __tablename__ = 'embedding_model'
+
+    version = db.Column(db.String(12), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class ProfileEmbedding(db.Model):
+    __tablename__ = 'profile_embedding'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    model_version = db.Column(db.String(12), nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    complete = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+def _assign(vectors, centroids):
+    """The nearest centroid of each vector, ``ASSIGN_BATCH`` rows at a time."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        assignment[start:start + ASSIGN_BATCH] = np.argmax(
+            np.asarray(vectors[start:start + ASSIGN_BATCH]) @ centroids.T, axis=1)
+    return assignment
+
+
+def kmeans(vectors, count, seed=0):
+    """``count`` unit-length centroids of unit vectors, trained on a sample of at most 64 per centroid."""
+    rng = np.random.default_rng(seed)
+    size = min(len(vectors), count * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), size, replace=False))])
+    centroids = sample[rng.choice(len(sample), count, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = _assign(sample, centroids)
+        order = np.argsort(assignment, kind='stable')
+        members = np.bincount(assignment, minlength=count)
+        filled = np.flatnonzero(members)
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], np.searchsorted(assignment[order], filled), axis=0)
+        centroids = normalize(sums)
+        # Restart empty lists from random points
+        empty = np.flatnonzero(members == 0)
+        centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+class _Lists:
+    """One role's vectors grouped by IVF list: the rows of list ``l`` are ``offsets[l]:offsets[l + 1]``."""
+
+    def __init__(self, centroids, offsets, ids, vectors, built_at):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.built_at = built_at
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.live = len(ids)
+        self._by_id = np.argsort(ids, kind='stable')
+        self._sorted_ids = np.asarray(ids)[self._by_id]
+
+    def __len__(self):
+        return self.live
+
+    @classmethod
+    def build(cls, ids, vectors, dim, built_at, seed=0):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), dim)
+        if not len(ids):
+            return cls(np.zeros((1, dim), dtype=np.float32), np.zeros(2, dtype=np.int64), ids, vectors, built_at)
+        count = max(1, min(MAX_LISTS, int(math.sqrt(len(ids)) * LISTS_PER_ROOT)))
+        centroids = kmeans(vectors, count, seed)
+        assignment = _assign(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.searchsorted(assignment[order], np.arange(count + 1)).astype(np.int64)
+        return cls(centroids, offsets, ids[order], vectors[order], built_at)
+
+    def position(self, user_id):
+        i = int(np.searchsorted(self._sorted_ids, user_id))
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == user_id:
+            return int(self._by_id[i])
+        return None
+
+    def kill(self, user_id):
+        position = self.position(user_id)
+        if position is not None and self.alive[position]:
+            self.alive[position] = False
+            self.live -= 1
+
+    def nearest_lists(self, query, nprobe):
+        scores = self.centroids @ query
+        nprobe = min(nprobe, len(scores))
+        return np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+    def scan(self, query, lists=None):
+        """``(ids, similarities)`` of the live rows in ``lists``, or in every list."""
+        slices = [(0, len(self.ids))] if lists is None else [(self.offsets[l], self.offsets[l + 1]) for l in lists]
+        ids, scores = [], []
+        for start, end in slices:
+            if end > start:
+                alive = self.alive[start:end]
+                ids.append(self.ids[start:end][alive])
+                scores.append((self.vectors[start:end] @ query)[alive])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(ids), np.concatenate(scores)
+
+    def save(self, path, role, model_version):
+        """Write ``<role>.ids.npy``, ``<role>.vectors.npy`` and ``<role>.ivf.npz``, each replaced atomically."""
+        files = [
+            (f'{role}.ids.npy', lambda f: np.save(f, np.asarray(self.ids))),
+            (f'{role}.vectors.npy', lambda f: np.save(f, np.asarray(self.vectors))),
+            # Written last: loading goes by it
+            (f'{role}.ivf.npz', lambda f: np.savez(
+                f, centroids=self.centroids, offsets=self.offsets,
+                built_at=np.array(self.built_at.isoformat()), model_version=np.array(model_version)
+            )),
+        ]
+        for name, write in files:
+            temporary = os.path.join(path, f'{name}.{uuid.uuid4().hex[:8]}.tmp')
+            with open(temporary, 'wb') as f:
+                write(f)
+            os.replace(temporary, os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path, role, model_version):
+        """Map a role's saved rows, or None if there are none for ``model_version``."""
+        try:
+            with np.load(os.path.join(path, f'{role}.ivf.npz')) as ivf:
+                if str(ivf['model_version']) != model_version:
+                    return None
+                centroids, offsets = ivf['centroids'], ivf['offsets']
+                built_at = datetime.fromisoformat(str(ivf['built_at']))
+            ids = np.load(os.path.join(path, f'{role}.ids.npy'), mmap_mode='r')
+            vectors = np.load(os.path.join(path, f'{role}.vectors.npy'), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        return cls(centroids, offsets, ids, vectors, built_at)
+
+
+def _top(ids, scores, k, exclude):
+    if exclude is not None and len(exclude) and len(ids):
+        keep = ~np.isin(ids, exclude)
+        ids, scores = ids[keep], scores[keep]
+    k = min(k, len(ids))
+    if not k:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.lexsort((ids[top], -scores[top]))]
+    return ids[top], scores[top]
+
+
+class VectorIndex:
+    def __init__(self, model, lists):
+        self.model = model
+        self._lists = lists
+        self._lock = threading.Lock()
+        # role -> {user_id: (list, vector)}: saves since the lists were built
+        self._overlay = {role: {} for role in ROLES}
+        # role -> {list: (ids, vectors)}, rebuilt on the first query after a save to the list
+        self._overlay_arrays = {role: {} for role in ROLES}
+        self._since = min(lists[role].built_at for role in ROLES)
+        self._checked = 0.0
+        self._applied = {}  # (role, user_id) -> updated_at of stored vectors read within the lag
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(self._lists[role]) + len(self._overlay[role]) for role in ROLES)
+
+    def update(self, role, user_id, vector):
+        """Index a complete profile's vector; None (or an all-zero vector) removes it."""
+        user_id = int(user_id)
+        with self._lock:
+            lists = self._lists[role]
+            lists.kill(user_id)
+            previous = self._overlay[role].pop(user_id, None)
+            if previous is not None:
+                self._overlay_arrays[role].pop(previous[0], None)
+            if vector is not None and vector.any():
+                list_id = int(np.argmax(lists.centroids @ vector))
+                self._overlay[role][user_id] = (list_id, vector)
+                self._overlay_arrays[role].pop(list_id, None)
+
+    def remove(self, role, user_id):
+        self.update(role, user_id, None)
+
+    def vector(self, role, user_id):
+        """The indexed vector of a profile, or None if it is not indexed."""
+        with self._lock:
+            entry = self._overlay[role].get(int(user_id))
+            if entry is not None:
+                return entry[1]
+            lists = self._lists[role]
+            position = lists.position(int(user_id))
+            if position is None or not lists.alive[position]:
+                return None
+            return np.asarray(lists.vectors[position])
+
+    def _recent(self, role, list_ids):
+        arrays = self._overlay_arrays[role]
+        for list_id in list_ids:
+            if list_id not in arrays:
+                entries = [(user_id, vector) for user_id, (entry_list, vector) in self._overlay[role].items()
+                           if entry_list == list_id]
+                arrays[list_id] = (np.array([user_id for user_id, _ in entries], dtype=np.int64),
+                                   np.array([vector for _, vector in entries], dtype=np.float32).reshape(-1, self.model.dim))
+        return [arrays[list_id] for list_id in list_ids if len(arrays[list_id][0])]
+
+    def nearest(self, role, query, k, exclude=None, nprobe=NPROBE):
+        """``(user ids, cosine similarities)`` of about the ``k`` profiles of ``role`` nearest ``query``, best first."""
+        with self._lock:
+            lists = self._lists[role]
+            chosen = lists.nearest_lists(query, nprobe)
+            recent = self._recent(role, sorted({int(l) for l in chosen})) if self._overlay[role] else []
+        ids, scores = lists.scan(query, chosen)
+        for recent_ids, recent_vectors in recent:
+            ids = np.concatenate((ids, recent_ids))
+            scores = np.concatenate((scores, recent_vectors @ query))
+        return _top(ids, scores, k, exclude)
+
+    def exact(self, role, query, k, exclude=None):
+        """``nearest`` by scanning every vector."""
+        with self._lock:
+            lists = self._lists[role]
+            recent = [(user_id, vector) for user_id, (_, vector) in self._overlay[role].items()]
+        ids, scores = lists.scan(query)
+        if recent:
+            ids = np.concatenate((ids, [user_id for user_id, _ in recent]))
+            scores = np.concatenate((scores, np.array([vector for _, vector in recent]) @ query))
+        return _top(ids, scores, k, exclude)
+
+    def similar(self, role, user_id, k, nprobe=NPROBE):
+        """Profiles of ``role`` nearest ``user_id``'s, or None if that profile isn't indexed."""
+        query = self.vector(role, user_id)
+        if query is None:
+            return None
+        return self.nearest(role, query, k, exclude=np.array([user_id]), nprobe=nprobe)
+
+    def catch_up(self, force=False):
+        """Index the vectors other workers stored since the last look, at most every ``REFRESH_SECONDS``."""
+        if not force and time.monotonic() - self._checked < REFRESH_SECONDS:
+            return 0
+        self._checked = time.monotonic()
+        table = ProfileEmbedding.__table__
+        rows = db.session.execute(select(
+            table.c.user_id, table.c.role, table.c.model_version, table.c.vector, table.c.complete,
+            table.c.updated_at
+        ).where(table.c.updated_at > self._since - CATCH_UP_LAG)).all()
+        applied = 0
+        for row in rows:
+            key = (row.role, row.user_id)
+            if row.role not in self._overlay or self._applied.get(key) == row.updated_at:
+                continue
+            self._applied[key] = row.updated_at
+            if row.model_version == self.model.version:
+                vector = np.frombuffer(row.vector, dtype=np.float32)
+                self.update(row.role, row.user_id, vector if row.complete else None)
+                applied += 1
+        if rows:
+            self._since = max(self._since, max(row.updated_at for row in rows))
+        cutoff = self._since - CATCH_UP_LAG
+        self._applied = {key: at for key, at in self._applied.items() if at > cutoff}
+        return applied
+
+    @classmethod
+    def build(cls, model, restore=False):
+        """Index every complete profile from its stored vector, embedding those stored with another model.
+
+        With ``restore`` the fresh vectors of all profiles are stored too, committing in batches.
+        """
+        profiles, embeddings = UserProfile.__table__, ProfileEmbedding.__table__
+        built_at = datetime.utcnow()
+        query = select(
+            profiles.c.user_id, profiles.c.role, profiles.c.is_complete,
+            embeddings.c.model_version, embeddings.c.vector,
+            *[profiles.c[field] for field in TEXT_FIELDS]
+        ).select_from(profiles.outerjoin(embeddings, and_(
+            embeddings.c.user_id == profiles.c.user_id, embeddings.c.role == profiles.c.role
+        )))
+        if not restore:
+            query = query.where(profiles.c.is_complete == True)
+
+        found = {role: ([], []) for role in ROLES}
+        stale, restored = [], []
+
+        def embed_stale():
+            vectors = model.embed([profile_text(row) for row in stale])
+            if restore:
+                restored.extend(zip(stale, vectors))
+            for row, vector in zip(stale, vectors):
+                if row.is_complete:
+                    found[row.role][0].append(row.user_id)
+                    found[row.role][1].append(vector)
+            stale.clear()
+
+        for row in db.session.execute(query.execution_options(yield_per=10000)):
+            if row.role not in found:
+                continue
+            if row.model_version == model.version:
+                if row.is_complete:
+                    found[row.role][0].append(row.user_id)
+                    found[row.role][1].append(np.frombuffer(row.vector, dtype=np.float32))
+            else:
+                stale.append(row)
+                if len(stale) >= EMBED_BATCH:
+                    embed_stale()
+        embed_stale()
+        # Stored once the rows are read: committing would close the streamed result
+        for start in range(0, len(restored), EMBED_BATCH):
+            _store_rows(restored[start:start + EMBED_BATCH], model.version)
+
+        lists = {}
+        for role, (ids, vectors) in found.items():
+            vectors = np.array(vectors, dtype=np.float32).reshape(len(ids), model.dim)
+            live = vectors.any(axis=1)
+            lists[role] = _Lists.build(np.array(ids, dtype=np.int64)[live], vectors[live], model.dim, built_at)
+        return cls(model, lists)
+
+    @classmethod
+    def from_vectors(cls, model, vectors):
+        """An index over ``{role: (user ids, unit vectors)}``."""
+        built_at = datetime.utcnow()
+        return cls(model, {
+            role: _Lists.build(*vectors.get(role, ([], [])), model.dim, built_at) for role in ROLES
+        })
+
+    def save(self, path):
+        for role in ROLES:
+            self._lists[role].save(path, role, self.model.version)
+
+    @classmethod
+    def load(cls, path, model):
+        """Map the rows saved in ``path`` for ``model``, or None if any role is missing."""
+        lists = {role: _Lists.load(path, role, model.version) for role in ROLES}
+        if any(role_lists is None for role_lists in lists.values()):
+            return None
+        return cls(model, lists)
+
+
+def _store_rows(pairs, model_version):
+    """Upsert ``profile_embedding`` for ``(profile or row, vector)`` pairs and commit."""
+    now = datetime.utcnow()
+    for profile, vector in pairs:
+        row = db.session.get(ProfileEmbedding, (int(profile.user_id), profile.role))
+        if row is None:
+            row = ProfileEmbedding(user_id=int(profile.user_id), role=profile.role)
+            db.session.add(row)
+        row.model_version, row.vector = model_version, vector.astype(np.float32).tobytes()
+        row.complete, row.updated_at = bool(profile.is_complete), now
+    db.session.commit()
+
+
+def train_model():
+    """Train on the text of up to ``TRAIN_PROFILES`` profiles, every n-th user id so reruns pick the same ones."""
+    profiles = UserProfile.__table__
+    total = db.session.execute(select(func.count()).select_from(profiles)).scalar()
+    stride = max(1, math.ceil(total / TRAIN_PROFILES))
+    rows = db.session.execute(
+        select(*[profiles.c[field] for field in TEXT_FIELDS])
+        .where(profiles.c.user_id % stride == 0)
+        .order_by(profiles.c.user_id, profiles.c.role).limit(TRAIN_PROFILES)
+    ).all()
+    return EmbeddingModel.train([profile_text(row) for row in rows])
+
+
+def publish_model(model):
+    """Make ``model`` the one workers load and commit."""
+    if db.session.get(EmbeddingModelVersion, model.version) is None:
+        db.session.add(EmbeddingModelVersion(version=model.version, data=model.to_bytes()))
+    db.session.commit()
+
+
+def load_model():
+    """The newest published model, or None."""
+    data = db.session.execute(
+        select(EmbeddingModelVersion.data).order_by(EmbeddingModelVersion.created_at.desc()).limit(1)
+    ).scalar()
+    return EmbeddingModel.load(data) if data is not None else None
+
+
+_model = None
+_model_checked = float('-inf')
+_index = None
+_lock = threading.Lock()
+
+
+def get_model():
+    """Process-wide model from ``EMBEDDING_PATH`` or ``embedding_model``; None until one is published.
+
+    A missing model is looked for again at most every ``REFRESH_SECONDS``.
+    """
+    global _model, _model_checked
+    if _model is None and time.monotonic() - _model_checked >= REFRESH_SECONDS:
+        with _lock:
+            if _model is None and time.monotonic() - _model_checked >= REFRESH_SECONDS:
+                path = current_app.config.get('EMBEDDING_PATH')
+                if path and os.path.exists(os.path.join(path, MODEL_FILE)):
+                    _model = EmbeddingModel.load(os.path.join(path, MODEL_FILE))
+                else:
+                    _model = load_model()
+                _model_checked = time.monotonic()
+    return _model
+
+
+def get_index():
+    """Process-wide index, mapped from ``EMBEDDING_PATH`` or built from the database; None without a model."""
+    global _index
+    if _index is None:
+        model = get_model()
+        if model is None:
+            return None
+        with _lock:
+            if _index is None:
+                path = current_app.config.get('EMBEDDING_PATH')
+                index = VectorIndex.load(path, model) if path else None
+                _index = index or VectorIndex.build(model)
+    _index.catch_up()
+    return _index
+
+
+def store(profile):
+    """Embed ``profile`` and stage its ``profile_embedding`` row (joins the caller's transaction).
+
+    Returns the vector, or None without a model.
+    """
+    model = get_model()
+    if model is None:
+        return None
+    vector = model.embed([profile_text(profile)])[0]
+    row = db.session.get(ProfileEmbedding, (int(profile.user_id), profile.role))
+    if row is None:
+        row = ProfileEmbedding(user_id=int(profile.user_id), role=profile.role)
+        db.session.add(row)
+    row.model_version, row.vector = model.version, vector.tobytes()
+    row.complete, row.updated_at = bool(profile.is_complete), datetime.utcnow()
+    return vector
+
+
+def update_profile(profile, vector):
+    """Reflect a saved profile in the index, once its transaction has committed."""
+    if _index is not None and vector is not None:
+        _index.update(profile.role, profile.user_id, vector if profile.is_complete else None)
+
+
+def candidates(user_id, role, target_role, k, exclude=None):
+    """``(user ids, similarities)`` of the ``target_role`` profiles nearest the viewer's ``role`` profile."""
+    index = get_index()
+    query = index.vector(role, user_id) if index is not None else None
+    if query is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return index.nearest(target_role, query, k, exclude)
+
+
+def main():
+    from flask_app import create_app
+
+    parser = argparse.ArgumentParser(description='Train and publish the embedding model and write the vector index.')
+    parser.add_argument('--path', default=None, help='defaults to EMBEDDING_PATH; without either only the model is published')
+    parser.add_argument('--train', action='store_true', help='retrain the model even if one exists')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        path = args.path or app.config.get('EMBEDDING_PATH')
+        model_file = os.path.join(path, MODEL_FILE) if path else None
+        model = None
+        if not args.train:
+            model = EmbeddingModel.load(model_file) if model_file and os.path.exists(model_file) else load_model()
+        if model is None:
+            started = time.perf_counter()
+            try:
+                model = train_model()
+            except ValueError as e:
+                parser.exit(1, f'cannot train yet: {e}\n')
+            print(f'trained the model in {time.perf_counter() - started:.1f}s')
+        publish_model(model)
+        print(f'published model {model.version}')
+        if not path:
+            return
+        os.makedirs(path, exist_ok=True)
+        model.save(model_file)
+        started = time.perf_counter()
+        index = VectorIndex.build(model, restore=True)
+        index.save(path)
+        print(f'indexed {len(index)} profiles in {time.perf_counter() - started:.1f}s at {path}')
+
+
+if __name__ == '__main__':
+    main()